@@ -0,0 +1,310 @@
+"""Micro-benchmarks for the game engine, the AI and the renderer.
+
+Times the hot paths (board rules, AI search, game update, each draw function
+on an offscreen surface), writes the results with machine metadata as JSON,
+and compares them against a stored baseline, flagging anything slower than
+the threshold. Exits 1 when something regressed.
+
+Run from the repo root:
+    python -m benchmarks.engine_bench
+    python -m benchmarks.engine_bench --filter ai_ --out bench.json
+    python -m benchmarks.engine_bench --save-baseline   # after an intended change
+"""
+import os
+
+# headless: the game modules open a window and mixer at import
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "engine_baseline.json")
+THRESHOLD = 0.15  # flag a case when its best time is this much slower than the baseline
+REPEAT = 5
+MIN_BATCH_S = 0.05  # each timed batch runs at least this long
+MAX_STATEFUL_BATCH = 2000  # cases with per-call setup keep at most this many states alive
+
+
+def make_grid(filled_rows, rng):
+    """A mid-game stack: filled_rows of junk at the bottom, one hole per row, nothing full."""
+    grid = [["."] * 10 for _ in range(20 - filled_rows)]
+    for _ in range(filled_rows):
+        row = [rng.choice("12345678") for _ in range(10)]
+        row[rng.randrange(10)] = "."
+        grid.append(row)
+    return grid
+
+
+class Case:
+    """fn() is timed as is; with setup, fn(state) is timed on a fresh setup() state per call."""
+
+    def __init__(self, name, fn, setup=None):
+        self.name = name
+        self.fn = fn
+        self.setup = setup
+
+    def batch(self, number):
+        fn = self.fn
+        if self.setup is None:
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            return time.perf_counter() - started
+        states = [self.setup() for _ in range(number)]
+        started = time.perf_counter()
+        for state in states:
+            fn(state)
+        return time.perf_counter() - started
+
+    def measure(self, repeat, min_batch_s):
+        number = 1
+        while True:
+            elapsed = self.batch(number)
+            if elapsed >= min_batch_s or (self.setup is not None and number >= MAX_STATEFUL_BATCH):
+                break
+            number = min(number * 2, MAX_STATEFUL_BATCH) if self.setup is not None else number * 2
+        runs = [elapsed / number * 1e6] + [self.batch(number) / number * 1e6 for _ in range(repeat - 1)]
+        return {
+            "best_us": round(min(runs), 3),
+            "median_us": round(statistics.median(runs), 3),
+            "calls_per_run": number,
+            "runs": repeat,
+        }
+
+
+# ----------------------------
+# Cases
+# ----------------------------
+def engine_cases():
+    from tetris_engine import Board, Piece, compact_rows, full_rows
+
+    rng = random.Random(1234)
+    mid = Board(garbage_seed=1)
+    mid.set_grid(make_grid(8, rng))
+
+    spawn_t = Piece("T")
+    resting_i = Piece("I")  # lying on the floor of an empty board
+    resting_i.y = 18
+
+    # four full rows under an open well: the I locks vertically and clears all four
+    tetris_grid = [["."] * 10 for _ in range(16)] + [["3"] * 9 + ["."] for _ in range(4)]
+    tetris_board = Board(garbage_seed=1)
+    tetris_board.set_grid(tetris_grid)
+    well_i = Piece("I")
+    well_i.rotation = 1
+    well_i.x = 7
+    well_i.y = 16
+
+    full_grid = [["."] * 10 for _ in range(16)] + [["3"] * 10 for _ in range(4)]
+
+    def full_board():
+        board = Board(garbage_seed=1)
+        board.set_grid([row[:] for row in full_grid])
+        return board
+
+    return [
+        Case("board_collision", lambda: mid.collision(spawn_t, dy=1)),
+        Case("board_copy", mid.copy),
+        Case("board_lock", lambda b: b.lock(resting_i), setup=lambda: Board(garbage_seed=1)),
+        Case("board_lock_tetris", lambda b: b.lock(well_i), setup=tetris_board.copy),
+        Case("board_clear_lines", lambda b: b.clear_lines(), setup=full_board),
+        Case("board_add_garbage", lambda b: b.add_garbage(2), setup=mid.copy),
+        Case("full_rows", lambda: full_rows(full_grid, {16, 17, 18, 19})),
+        Case("compact_rows", lambda: compact_rows(full_grid, [16, 17, 18, 19])),
+    ]
+
+
+def ai_cases():
+    import tetris_vs_ai as vs
+
+    rng = random.Random(1234)
+    grid = make_grid(8, rng)
+    cases = [
+        Case("simulate_lock", lambda: vs.simulate_lock(grid, "T", 1, 4)),
+        Case("board_features", lambda: vs.board_features(grid)),
+        Case("evaluate_grid_score", lambda: vs.evaluate_grid_score(grid, 1)),
+    ]
+    for name in vs.AI_DIFFICULTIES:
+        weight = vs.AI_DIFFICULTY_SETTINGS[name]["lookahead_weight"]
+        cases.append(Case(
+            f"ai_best_move_{name.lower()}",
+            lambda weight=weight: vs.ai_best_move(grid, "T", "S", lookahead_weight=weight),
+        ))
+    return cases
+
+
+def game_cases():
+    import main
+    import tetris_vs_ai as vs
+
+    def second_of_main(game):
+        for _ in range(main.LOGIC_HZ):
+            game.update(main.LOGIC_DT_MS)
+
+    def second_of_vs(game):
+        for _ in range(vs.LOGIC_HZ):
+            game.update(vs.LOGIC_DT_MS)
+
+    return [
+        Case("main_game_update_1s", second_of_main, setup=lambda: main.Game(seed=1)),
+        Case("vs_game_update_1s", second_of_vs, setup=lambda: vs.Game(seed=1)),
+    ]
+
+
+def render_cases():
+    import pygame
+
+    import main
+    import tetris_vs_ai as vs
+
+    rng = random.Random(1234)
+    grid = make_grid(8, rng)
+    snapshot = ["".join(row) for row in grid]
+    surf = pygame.Surface((vs.WINDOW_W, vs.WINDOW_H))
+    board_surf = pygame.Surface((main.BOARD_W, main.BOARD_H))
+    game = vs.Game(seed=1)
+    game.board.set_grid([row[:] for row in grid])
+    bounces = [vs.Bounce(c, 19) for c in range(4)]
+    main_game = main.Game(seed=1)
+    main_game.grid = [row[:] for row in grid]
+
+    return [
+        Case("draw_background", lambda: vs.draw_background(surf, 1 / 60)),
+        Case("draw_scanlines", lambda: vs.draw_scanlines(surf)),
+        Case("draw_board", lambda: vs.draw_board(surf, grid, bounces=bounces)),
+        Case("draw_grid_snapshot", lambda: vs.draw_grid_snapshot(surf, snapshot)),
+        Case("draw_piece", lambda: vs.draw_piece(surf, game.current, glow_pulse=0.5, anim=game.anim)),
+        Case("draw_next_box", lambda: vs.draw_next_box(surf, game.next_piece, 400, 100)),
+        Case("draw_side_panel", lambda: vs.draw_side_panel(surf, 400, "PLAYER", game, 123456)),
+        Case("draw_center_overlay", lambda: vs.draw_center_overlay(surf, "PAUSED", "Press P to resume")),
+        Case("main_draw_grid", lambda: (main.draw_grid_background(board_surf), main.draw_grid(board_surf, main_game.grid))),
+        Case("main_draw_piece", lambda: main.draw_piece(board_surf, main_game.current)),
+    ]
+
+
+def all_cases():
+    return engine_cases() + ai_cases() + game_cases() + render_cases()
+
+
+# ----------------------------
+# Reporting
+# ----------------------------
+def machine_info():
+    import pygame
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+        "cpu_count": os.cpu_count(),
+        "python": f"{platform.python_implementation()} {platform.python_version()}",
+        "pygame": pygame.version.ver,
+        "commit": commit,
+        "time": round(time.time()),
+    }
+
+
+def compare(results, baseline, threshold):
+    """{name: (ratio, status)} for every case both runs have; ratio is now / baseline best time."""
+    out = {}
+    base = baseline.get("results", {})
+    for name, r in results.items():
+        if name not in base or not base[name].get("best_us"):
+            continue
+        ratio = r["best_us"] / base[name]["best_us"]
+        if ratio > 1 + threshold:
+            status = "REGRESSED"
+        elif ratio < 1 / (1 + threshold):
+            status = "faster"
+        else:
+            status = "ok"
+        out[name] = (ratio, status)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Sam Stackerz engine, AI and renderer")
+    parser.add_argument("--filter", default=None, help="only cases whose name matches this regex")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed batches per case; the best one counts")
+    parser.add_argument("--min-time", type=float, default=MIN_BATCH_S, help="seconds per timed batch")
+    parser.add_argument("--out", default=None, help="write the results JSON here")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed slowdown, 0.15 = 15%%")
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with this run")
+    args = parser.parse_args()
+
+    cases = all_cases()
+    if args.filter:
+        pattern = re.compile(args.filter)
+        cases = [c for c in cases if pattern.search(c.name)]
+    if not cases:
+        print("no cases match")
+        sys.exit(2)
+
+    results = {}
+    for case in cases:
+        results[case.name] = case.measure(max(1, args.repeat), args.min_time)
+    report = {"machine": machine_info(), "threshold": args.threshold, "results": results}
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    verdicts = compare(results, baseline, args.threshold) if baseline else {}
+
+    print(f"{'case':<26}{'best us':>12}{'median us':>12}{'baseline':>12}{'ratio':>8}  status")
+    for name, r in results.items():
+        ratio, status = verdicts.get(name, (None, ""))
+        base_us = baseline["results"][name]["best_us"] if name in verdicts else None
+        print(f"{name:<26}{r['best_us']:>12.2f}{r['median_us']:>12.2f}"
+              f"{base_us if base_us is not None else '-':>12}{f'{ratio:.2f}x' if ratio else '-':>8}  {status}")
+    if baseline:
+        theirs = baseline.get("machine", {})
+        ours = report["machine"]
+        differs = [k for k in ("machine", "processor", "cpu_count", "python", "pygame") if theirs.get(k) != ours.get(k)]
+        if differs:
+            print(f"note: baseline was recorded on a different setup ({', '.join(differs)}); ratios are indicative only")
+
+    report["comparison"] = {name: {"ratio": round(ratio, 3), "status": status} for name, (ratio, status) in verdicts.items()}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    if args.save_baseline:
+        if args.filter and os.path.exists(args.baseline):
+            # a partial run only refreshes the cases it measured
+            with open(args.baseline, encoding="utf-8") as f:
+                merged = json.load(f)
+            merged["machine"] = report["machine"]
+            merged["results"].update(results)
+        else:
+            merged = {"machine": report["machine"], "results": results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(merged, f, indent=2)
+            f.write("\n")
+        print(f"baseline saved to {args.baseline}")
+
+    regressed = [name for name, (_, status) in verdicts.items() if status == "REGRESSED"]
+    if regressed:
+        print(f"{len(regressed)} regressed beyond {args.threshold:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
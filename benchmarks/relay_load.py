@@ -0,0 +1,380 @@
+"""Load generator for the online relay servers.
+
+Spawns simulated players that speak the same protocol as OnlineClient, pairs
+them into rooms, streams snapshot/attack/ping traffic and measures relay
+latency, throughput and failures. Works against online_server.py (tcp://) and
+the web server in web/server.js (ws://), and prints the same report for both.
+
+Run from the repo root, e.g.:
+    python online_server.py --port 8765 &
+    python -m benchmarks.relay_load tcp://127.0.0.1:8765 --clients 1000 --duration 30
+    python -m benchmarks.relay_load ws://127.0.0.1:8080 --clients 1000 --duration 30
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import struct
+import sys
+import time
+from urllib.parse import urlparse
+
+from online_protocol import WIRE_BINARY, WIRE_JSON, encode_message, read_message
+
+# key carrying the sender's perf_counter() on latency-sampled messages
+TAG = "lt"
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[idx]
+
+
+def make_grid(rng, filled):
+    rows = ["." * 10] * (20 - filled)
+    for _ in range(filled):
+        row = [rng.choice("12345678") for _ in range(10)]
+        row[rng.randrange(10)] = "."
+        rows.append("".join(row))
+    return rows
+
+
+class Stats:
+    def __init__(self):
+        self.connect_failures = 0
+        self.join_failures = 0
+        self.disconnects = 0
+        self.started_clients = 0
+        self.sent = {}
+        self.received = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latencies_ms = []
+        self.connect_ms = []
+
+    def count(self, table, mtype):
+        table[mtype] = table.get(mtype, 0) + 1
+
+
+# ----------------------------
+# Transports
+# ----------------------------
+class TcpConn:
+    """online_server.py framing: newline JSON, optionally switching to binary after join."""
+
+    def __init__(self, reader, writer, wire):
+        self.reader = reader
+        self.writer = writer
+        self.requested_wire = wire
+        self.wire = WIRE_JSON
+        self.buffer = b""
+
+    @classmethod
+    async def open(cls, host, port, wire):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, wire)
+
+    def join_payload(self, room, name):
+        msg = {"type": "join", "room": room, "name": name}
+        if self.requested_wire != WIRE_JSON:
+            msg["wire"] = self.requested_wire
+        return msg
+
+    async def send(self, msg):
+        data = encode_message(msg, self.wire)
+        self.writer.write(data)
+        await self.writer.drain()
+        return len(data)
+
+    async def recv(self):
+        """Return (msg, nbytes) or (None, 0) on close."""
+        while True:
+            before = len(self.buffer)
+            msg, self.buffer = read_message(self.buffer, self.wire)
+            if msg is not None:
+                if msg.get("type") == "joined" and msg.get("wire") == WIRE_BINARY:
+                    self.wire = WIRE_BINARY
+                if msg:
+                    return msg, before - len(self.buffer)
+                continue
+            chunk = await self.reader.read(65536)
+            if not chunk:
+                return None, 0
+            self.buffer += chunk
+
+    def close(self):
+        self.writer.close()
+
+
+class WsConn:
+    """Just enough of RFC 6455 to talk JSON text frames to web/server.js."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host, port, path):
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        writer.write(
+            (
+                f"GET {path or '/'} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+                f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+            ).encode("ascii")
+        )
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        if b" 101 " not in head.split(b"\r\n", 1)[0]:
+            writer.close()
+            raise ConnectionError("websocket upgrade refused")
+        return cls(reader, writer)
+
+    def join_payload(self, room, name):
+        return {"type": "join", "room": room, "name": name}
+
+    def _frame(self, opcode, payload):
+        n = len(payload)
+        if n < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | n)
+        elif n < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, n)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, n)
+        mask = os.urandom(4)
+        if n:
+            full_mask = (mask * (n // 4 + 1))[:n]
+            payload = (int.from_bytes(payload, "big") ^ int.from_bytes(full_mask, "big")).to_bytes(n, "big")
+        return header + mask + payload
+
+    async def send(self, msg):
+        data = self._frame(0x1, json.dumps(msg).encode("utf-8"))
+        self.writer.write(data)
+        await self.writer.drain()
+        return len(data)
+
+    async def recv(self):
+        while True:
+            try:
+                b1, b2 = await self.reader.readexactly(2)
+                n = b2 & 0x7F
+                if n == 126:
+                    (n,) = struct.unpack("!H", await self.reader.readexactly(2))
+                elif n == 127:
+                    (n,) = struct.unpack("!Q", await self.reader.readexactly(8))
+                payload = await self.reader.readexactly(n)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return None, 0
+            opcode = b1 & 0x0F
+            if opcode == 0x8:
+                return None, 0
+            if opcode == 0x9:
+                self.writer.write(self._frame(0xA, payload))
+                continue
+            if opcode != 0x1:
+                continue
+            try:
+                msg = json.loads(payload.decode("utf-8"))
+            except Exception:
+                continue
+            if isinstance(msg, dict):
+                return msg, n + 2
+
+    def close(self):
+        self.writer.close()
+
+
+# ----------------------------
+# Simulated player
+# ----------------------------
+async def player(idx, args, target, stats, deadline):
+    rng = random.Random(args.seed * 100003 + idx)
+    room = f"load-{args.run_id}-{idx // 2}"
+    t0 = time.perf_counter()
+    try:
+        if target.scheme == "ws":
+            conn = await asyncio.wait_for(WsConn.open(target.hostname, target.port, target.path), args.timeout)
+        else:
+            conn = await asyncio.wait_for(TcpConn.open(target.hostname, target.port, args.wire), args.timeout)
+    except Exception:
+        stats.connect_failures += 1
+        return
+    stats.connect_ms.append((time.perf_counter() - t0) * 1000)
+    stats.started_clients += 1
+
+    started = asyncio.Event()
+    closed = asyncio.Event()
+
+    async def reader():
+        while True:
+            msg, nbytes = await conn.recv()
+            if msg is None:
+                break
+            now = time.perf_counter()
+            mtype = msg.get("type")
+            stats.count(stats.received, mtype)
+            stats.bytes_received += nbytes
+            if TAG in msg:
+                stats.latencies_ms.append((now - msg[TAG]) * 1000)
+            if mtype == "heartbeat":
+                await conn.send(msg)
+            elif mtype == "start":
+                started.set()
+            elif mtype == "lobby" and msg.get("you") == 0 and len(msg.get("players", [])) >= 2:
+                # web server: the host starts the match once the room has two players
+                await conn.send({"type": "startgame"})
+            elif mtype == "error":
+                stats.join_failures += 1
+                break
+        closed.set()
+
+    read_task = asyncio.create_task(reader())
+    try:
+        await conn.send(conn.join_payload(room, f"bot{idx}"))
+        try:
+            await asyncio.wait_for(started.wait(), args.timeout)
+        except asyncio.TimeoutError:
+            stats.join_failures += 1
+            return
+
+        # each traffic type runs on its own Poisson-ish schedule
+        rates = {"snapshot": args.snapshot_hz, "attack": args.attack_hz, "ping": args.ping_hz}
+        due = {k: time.perf_counter() + rng.expovariate(v) for k, v in rates.items() if v > 0}
+        filled = 0
+        score = 0
+        sent_count = 0
+        while due and time.perf_counter() < deadline and not closed.is_set():
+            mtype, when = min(due.items(), key=lambda kv: kv[1])
+            delay = when - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            due[mtype] = when + rng.expovariate(rates[mtype])
+
+            if mtype == "snapshot":
+                filled = min(18, max(0, filled + rng.choice((-1, 0, 0, 1))))
+                score += rng.randrange(0, 400)
+                msg = {"type": "snapshot", "grid": make_grid(rng, filled), "score": score,
+                       "lines": score // 1000, "game_over": False}
+            elif mtype == "attack":
+                msg = {"type": "attack", "amount": rng.randint(1, 4)}
+            else:
+                msg = {"type": "ping"}
+            sent_count += 1
+            if sent_count % args.latency_sample == 0:
+                msg[TAG] = time.perf_counter()
+            stats.bytes_sent += await conn.send(msg)
+            stats.count(stats.sent, mtype)
+    except Exception:
+        pass
+    finally:
+        if closed.is_set() and time.perf_counter() < deadline:
+            stats.disconnects += 1
+        read_task.cancel()
+        conn.close()
+
+
+async def run(args):
+    target = urlparse(args.target)
+    if target.scheme not in ("tcp", "ws") or not target.port:
+        raise SystemExit("target must look like tcp://host:port or ws://host:port")
+    stats = Stats()
+    start = time.perf_counter()
+    # every client gets the full duration after the ramp-up finishes
+    ramp_s = args.clients / args.spawn_rate
+    deadline = start + ramp_s + args.timeout + args.duration
+    tasks = []
+    for i in range(args.clients):
+        tasks.append(asyncio.create_task(player(i, args, target, stats, deadline)))
+        await asyncio.sleep(1 / args.spawn_rate)
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return stats, time.perf_counter() - start, deadline - start - args.duration
+
+
+def report(args, stats, elapsed, traffic_start):
+    lat = sorted(stats.latencies_ms)
+    conn_ms = sorted(stats.connect_ms)
+    traffic_s = max(1e-6, elapsed - traffic_start)
+    total_sent = sum(stats.sent.values())
+    total_recv = sum(stats.received.values())
+
+    def ms(v):
+        return None if v is None else round(v, 3)
+
+    return {
+        "target": args.target,
+        "wire": args.wire if args.target.startswith("tcp") else "websocket-json",
+        "clients": args.clients,
+        "rooms": (args.clients + 1) // 2,
+        "duration_s": args.duration,
+        "rates_hz": {"snapshot": args.snapshot_hz, "attack": args.attack_hz, "ping": args.ping_hz},
+        "connected": stats.started_clients,
+        "connect_failures": stats.connect_failures,
+        "join_failures": stats.join_failures,
+        "disconnects": stats.disconnects,
+        "connect_ms": {"p50": ms(percentile(conn_ms, 0.5)), "p99": ms(percentile(conn_ms, 0.99))},
+        "sent": stats.sent,
+        "received": stats.received,
+        "msgs_sent_per_s": round(total_sent / traffic_s, 1),
+        "msgs_received_per_s": round(total_recv / traffic_s, 1),
+        "bytes_sent_per_s": round(stats.bytes_sent / traffic_s, 1),
+        "bytes_received_per_s": round(stats.bytes_received / traffic_s, 1),
+        "latency_samples": len(lat),
+        "latency_ms": {
+            "p50": ms(percentile(lat, 0.50)),
+            "p90": ms(percentile(lat, 0.90)),
+            "p99": ms(percentile(lat, 0.99)),
+            "max": ms(lat[-1] if lat else None),
+        },
+    }
+
+
+def raise_fd_limit():
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a Sam Stackerz relay server")
+    parser.add_argument("target", help="tcp://host:port (online_server.py) or ws://host:port (web/server.js)")
+    parser.add_argument("--clients", type=int, default=200, help="simulated players (two per room)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of traffic after ramp-up")
+    parser.add_argument("--spawn-rate", type=float, default=200.0, help="new connections per second")
+    parser.add_argument("--snapshot-hz", type=float, default=1000 / 150, help="per client; the game sends every 150 ms")
+    parser.add_argument("--attack-hz", type=float, default=0.2)
+    parser.add_argument("--ping-hz", type=float, default=1.0)
+    parser.add_argument("--latency-sample", type=int, default=10, help="timestamp every Nth message")
+    parser.add_argument("--wire", choices=(WIRE_JSON, WIRE_BINARY), default=WIRE_JSON, help="tcp targets only")
+    parser.add_argument("--timeout", type=float, default=10.0, help="connect/match-start timeout")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--run-id", default=None, help="room name prefix; random by default")
+    parser.add_argument("--report", default=None, help="also write the JSON report here")
+    args = parser.parse_args()
+    args.run_id = args.run_id or f"{random.randrange(16**6):06x}"
+    args.latency_sample = max(1, args.latency_sample)
+
+    raise_fd_limit()
+    stats, elapsed, traffic_start = asyncio.run(run(args))
+    result = report(args, stats, elapsed, traffic_start)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(text + "\n")
+    if stats.connect_failures or stats.join_failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Compare JSON and binary online framing: size, bandwidth and codec cost.
+
+Run from the repo root:  python -m benchmarks.wire_bench
+"""
+import argparse
+import random
+import time
+
+from online_protocol import WIRE_BINARY, WIRE_FORMATS, WIRE_JSON, encode_message, read_message
+
+SNAPSHOT_INTERVAL_MS = 150  # matches the snapshot timer in tetris_vs_ai.main
+
+
+def make_grid(filled_rows, rng):
+    grid = []
+    for r in range(20):
+        if r < 20 - filled_rows:
+            grid.append("." * 10)
+        else:
+            row = [rng.choice("12345678") for _ in range(10)]
+            row[rng.randrange(10)] = "."
+            grid.append("".join(row))
+    return grid
+
+
+def sample_messages():
+    rng = random.Random(1234)
+    return {
+        "snapshot_empty": {"type": "snapshot", "grid": make_grid(0, rng), "score": 0, "lines": 0, "game_over": False},
+        "snapshot_mid": {"type": "snapshot", "grid": make_grid(8, rng), "score": 48200, "lines": 57, "game_over": False},
+        "snapshot_high": {"type": "snapshot", "grid": make_grid(17, rng), "score": 913450, "lines": 212, "game_over": False},
+        "attack": {"type": "attack", "amount": 4},
+        "ping": {"type": "ping"},
+    }
+
+
+def time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(iterations):
+    results = []
+    for name, msg in sample_messages().items():
+        for wire in WIRE_FORMATS:
+            data = encode_message(msg, wire)
+            decoded, rest = read_message(data, wire)
+            assert decoded == msg and not rest, (name, wire)
+            results.append({
+                "message": name,
+                "wire": wire,
+                "bytes": len(data),
+                "encode_us": time_per_call(lambda: encode_message(msg, wire), iterations),
+                "decode_us": time_per_call(lambda: read_message(data, wire), iterations),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the online wire formats")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    snaps_per_sec = 1000 / SNAPSHOT_INTERVAL_MS
+    print(f"{'message':<16}{'wire':<8}{'bytes':>7}{'B/s @snap':>11}{'enc us':>9}{'dec us':>9}")
+    for r in results:
+        bps = r["bytes"] * snaps_per_sec if r["message"].startswith("snapshot") else float("nan")
+        print(f"{r['message']:<16}{r['wire']:<8}{r['bytes']:>7}{bps:>11.0f}{r['encode_us']:>9.2f}{r['decode_us']:>9.2f}")
+
+    by_key = {(r["message"], r["wire"]): r for r in results}
+    for name in sample_messages():
+        ratio = by_key[(name, WIRE_BINARY)]["bytes"] / by_key[(name, WIRE_JSON)]["bytes"]
+        print(f"{name}: binary is {ratio:.0%} of JSON size")
+
+
+if __name__ == "__main__":
+    main()
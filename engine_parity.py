@@ -0,0 +1,343 @@
+"""Cross-engine parity: main.py's web-replica Game, tetris_vs_ai's Game and the web RNG.
+
+Every seed gets a scripted game (per piece: some rotations, a sideways shift,
+a hard drop) that is played through both Python engines. Per lock the
+harness compares the piece, where it locked, lines, score and attack, and
+stops each game at its first divergence. Piece sequences are checked
+separately against web/rng_fixture.json, which --write-fixture generates by
+running the RNG and bag code from web/client.js under node.
+
+Run from the repo root:  python engine_parity.py --games 20000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web", "rng_fixture.json")
+CLIENT_JS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web", "client.js")
+SCRIPT_SALT = 0x5C417  # keeps the input script independent of the piece RNG
+SCRIPT_RANDOM_MOVES = 0.1  # share of placements picked at random instead of by the heuristic
+FIELDS = ("kind", "x", "y", "rotation", "lines", "score", "attack", "game_over")
+
+
+# ----------------------------
+# Web fixture
+# ----------------------------
+def _extract(source, pattern, what):
+    match = re.search(pattern, source, re.S | re.M)
+    if match is None:
+        raise SystemExit(f"could not find {what} in {CLIENT_JS}")
+    return match.group(0)
+
+
+def web_sequences(seeds, pieces):
+    """Piece sequences from the web client's own RNG and bag code, run under node."""
+    with open(CLIENT_JS, encoding="utf-8") as f:
+        source = f.read()
+    script = "\n".join((
+        _extract(source, r"^const TETROMINOES = \{.*?^\};", "TETROMINOES"),
+        _extract(source, r"^class RNG \{.*?^\}", "class RNG"),
+        "class WebBag {",
+        "  constructor(seed) { this.rng = new RNG(seed); this.bag = []; }",
+        _extract(source, r"^  nextKind\(\) \{.*?^  \}", "Game.nextKind"),
+        "}",
+        f"const seeds = {json.dumps(list(seeds))};",
+        "const out = {};",
+        "for (const seed of seeds) {",
+        "  const bag = new WebBag(seed);",
+        "  let s = '';",
+        f"  for (let i = 0; i < {pieces}; i++) s += bag.nextKind();",
+        "  out[seed] = s;",
+        "}",
+        "process.stdout.write(JSON.stringify(out));",
+    ))
+    result = subprocess.run(["node", "-e", script], capture_output=True, text=True, check=True)
+    return {int(k): v for k, v in json.loads(result.stdout).items()}
+
+
+def write_fixture(path, count, pieces):
+    seeds = sorted(random.Random(0).sample(range(1, 1_000_000), count))
+    fixture = {"source": "web/client.js RNG + Game.nextKind", "pieces": pieces,
+               "sequences": {str(k): v for k, v in web_sequences(seeds, pieces).items()}}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixture, f, indent=0, sort_keys=True)
+        f.write("\n")
+    print(f"wrote {count} seeds x {pieces} pieces to {path}")
+
+
+def load_fixture(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {int(k): v for k, v in json.load(f)["sequences"].items()}
+    except FileNotFoundError:
+        return {}
+
+
+# ----------------------------
+# Engine adapters
+# ----------------------------
+class ScriptedBag:
+    """Stands in for tetris_engine.Bag so both engines are dealt the same pieces."""
+
+    def __init__(self, kinds):
+        self.kinds = iter(kinds)
+
+    def next_kind(self):
+        return next(self.kinds)
+
+
+class MainEngine:
+    def __init__(self, seed):
+        import main
+        self.game = main.Game(seed=seed)
+
+    @staticmethod
+    def bag_order(seed, n):
+        """Kinds in the order the RNG and bag produce them."""
+        import main
+        probe = main.Game(seed=seed)
+        # reset() draws the next piece before the current one, as the web client does
+        out = [probe.next.kind, probe.current.kind]
+        while len(out) < n:
+            out.append(probe.next_kind())
+        return out
+
+    @staticmethod
+    def deal_order(seed, n):
+        """Kinds in the order they are played."""
+        first, second, *rest = MainEngine.bag_order(seed, n)
+        return [second, first, *rest]
+
+    def play(self, rotations, shift):
+        g = self.game
+        for _ in range(rotations):
+            g.rotate_current()
+        step = 1 if shift > 0 else -1
+        for _ in range(abs(shift)):
+            if not g.move(step, 0):
+                break
+        g.hard_drop()
+        piece = g.current
+        locked = (piece.kind, piece.x, piece.y, piece.rotation)
+        g.lock_piece()
+        return locked + (g.lines, g.score, g.last_attack, g.game_over)
+
+
+class VsAiEngine:
+    def __init__(self, seed, kinds=None):
+        import tetris_vs_ai
+        from tetris_engine import Piece
+        g = self.game = tetris_vs_ai.Game(seed=seed)
+        if kinds is not None:
+            g.bag = ScriptedBag(kinds[2:])
+            g.current = Piece(kinds[0])
+            g.next_piece = Piece(kinds[1])
+
+    @staticmethod
+    def bag_order(seed, n):
+        """Kinds in the order the bag produces them, which is also the order they are played."""
+        from tetris_engine import Bag
+        bag = Bag(seed=seed)
+        return [bag.next_kind() for _ in range(n)]
+
+    def play(self, rotations, shift):
+        g = self.game
+        for _ in range(rotations):
+            if g.try_rotate():
+                # the script spaces rotations past Game.rotate_ms, so the animation has finished
+                g.current.rotation = g.anim.rot_to
+                g.anim.rotating = False
+        step = 1 if shift > 0 else -1
+        for _ in range(abs(shift)):
+            if not g.try_move(step, 0):
+                break
+        g.hard_drop()
+        piece = g.current
+        locked = (piece.kind, piece.x, piece.y, piece.rotation)
+        g.lock_current()
+        g.spawn_next()
+        return locked + (g.board.lines, g.board.score, g.last_attack, g.game_over)
+
+
+# ----------------------------
+# Input script
+# ----------------------------
+def script_move(grid, kind, rng):
+    """(rotation taps, sideways shift) for the next piece.
+
+    Mostly a cheap column-height placement heuristic, so games last and clear
+    lines (and reach combos and back-to-backs) instead of topping out in a few
+    pieces; a share of random placements keeps odd positions and kicks covered.
+    """
+    if rng.random() < SCRIPT_RANDOM_MOVES:
+        return rng.randrange(4), rng.randint(-5, 5)
+    from tetris_engine import COLS, ROWS, piece_rotations
+
+    heights = [0] * COLS
+    for c in range(COLS):
+        for r in range(ROWS):
+            if grid[r][c] != ".":
+                heights[c] = ROWS - r
+                break
+    row_fill = [sum(cell != "." for cell in row) for row in grid]
+    best = None
+    for rot, shape in enumerate(piece_rotations(kind)):
+        cells = [(c, r) for r in range(4) for c in range(4) if shape[r][c] != "."]
+        lo = min(c for c, _ in cells)
+        hi = max(c for c, _ in cells)
+        for x in range(-lo, COLS - hi):
+            # top row the piece rests at when dropped straight down
+            y = min(ROWS - heights[x + c] - 1 - r for c, r in cells)
+            if y + min(r for _, r in cells) < 0:
+                continue
+            new_heights = list(heights)
+            added = {}
+            for c, r in cells:
+                new_heights[x + c] = max(new_heights[x + c], ROWS - (y + r))
+                added[y + r] = added.get(y + r, 0) + 1
+            lines = sum(1 for row, n in added.items() if row_fill[row] + n == COLS)
+            holes = sum(new_heights[x + c] - heights[x + c] for c in set(c for c, _ in cells)) - len(cells)
+            bump = sum(abs(new_heights[i] - new_heights[i + 1]) for i in range(COLS - 1))
+            score = 0.76 * lines - 0.51 * (sum(new_heights) - 4 * lines) - 0.36 * holes - 0.18 * bump
+            if best is None or score > best[0]:
+                best = (score, rot, x)
+    if best is None:
+        return rng.randrange(4), rng.randint(-5, 5)
+    return best[1], best[2] - 3  # pieces spawn at x=3 in both engines
+
+
+# ----------------------------
+# Worker
+# ----------------------------
+_fixture = {}
+
+
+def _init_worker(fixture):
+    global _fixture
+    _fixture = fixture
+
+
+def first_difference(a, b):
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return i
+    return None if len(a) == len(b) else min(len(a), len(b))
+
+
+def run_seed(args):
+    """One seeded game through every check; returns {check: divergence or None}."""
+    seed, pieces, shared = args
+    main_kinds = MainEngine.bag_order(seed, pieces + 2)
+    result = {"seed": seed}
+
+    web = _fixture.get(seed)
+    if web is not None:
+        n = min(len(web), len(main_kinds))
+        i = first_difference(web[:n], "".join(main_kinds[:n]))
+        result["web_vs_main_pieces"] = None if i is None else {
+            "piece": i, "web": web[i], "main": main_kinds[i]}
+
+    engine_kinds = VsAiEngine.bag_order(seed, pieces + 2)
+    i = first_difference(engine_kinds, main_kinds)
+    result["vs_ai_vs_main_pieces"] = None if i is None else {
+        "piece": i, "vs_ai": engine_kinds[i], "main": main_kinds[i]}
+
+    main_engine = MainEngine(seed)
+    vs_ai = VsAiEngine(seed, MainEngine.deal_order(seed, pieces + 2) if shared else None)
+    script = random.Random(seed ^ SCRIPT_SALT)
+    result["rules"] = None
+    for n in range(pieces):
+        rotations, shift = script_move(main_engine.game.grid, main_engine.game.current.kind, script)
+        a = main_engine.play(rotations, shift)
+        b = vs_ai.play(rotations, shift)
+        if a != b:
+            field = next(f for f, x, y in zip(FIELDS, a, b) if x != y)
+            result["rules"] = {"piece": n, "field": field, "main": dict(zip(FIELDS, a)),
+                               "vs_ai": dict(zip(FIELDS, b))}
+            break
+        if a[-1]:
+            break  # both topped out together
+    return result
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Parity between main.py, tetris_vs_ai.py and the web client")
+    parser.add_argument("--games", type=int, default=20000)
+    parser.add_argument("--first-seed", type=int, default=1)
+    parser.add_argument("--pieces", type=int, default=100, help="scripted pieces per game")
+    parser.add_argument("--own-bags", action="store_true",
+                        help="let tetris_vs_ai deal its own pieces instead of main.py's sequence")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--fixture", default=FIXTURE_PATH)
+    parser.add_argument("--write-fixture", type=int, metavar="SEEDS", default=0,
+                        help="regenerate the web fixture with this many seeds (needs node) and exit")
+    parser.add_argument("--fixture-pieces", type=int, default=140)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.write_fixture:
+        write_fixture(args.fixture, args.write_fixture, args.fixture_pieces)
+        return
+
+    fixture = load_fixture(args.fixture)
+    # fixture seeds are sparse; play them as well as the requested range
+    seeds = sorted(set(range(args.first_seed, args.first_seed + args.games)) | set(fixture))
+    work = [(seed, args.pieces, not args.own_bags) for seed in seeds]
+
+    started = time.perf_counter()
+    checks = ("web_vs_main_pieces", "vs_ai_vs_main_pieces", "rules")
+    counts = {c: [0, 0] for c in checks}  # checked, diverged
+    first = {}
+    # close/join rather than the context manager: pygame in the workers swallows
+    # the SIGTERM that Pool.terminate() sends, and the exit would hang
+    pool = multiprocessing.Pool(args.jobs, _init_worker, (fixture,))
+    try:
+        for result in pool.imap_unordered(run_seed, work, chunksize=64):
+            for check in checks:
+                if check not in result:
+                    continue
+                counts[check][0] += 1
+                divergence = result[check]
+                if divergence is not None:
+                    counts[check][1] += 1
+                    if check not in first or result["seed"] < first[check]["seed"]:
+                        first[check] = {"seed": result["seed"], **divergence}
+    finally:
+        pool.close()
+        pool.join()
+
+    report = {
+        "games": len(seeds),
+        "pieces_per_game": args.pieces,
+        "shared_pieces": not args.own_bags,
+        "elapsed_s": round(time.perf_counter() - started, 2),
+        "checks": {c: {"checked": counts[c][0], "diverged": counts[c][1], "first": first.get(c)} for c in checks},
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['games']} games x {args.pieces} pieces in {report['elapsed_s']}s"
+              f"{' (shared piece sequence)' if report['shared_pieces'] else ''}")
+        for check, info in report["checks"].items():
+            status = "OK" if not info["diverged"] else f"{info['diverged']} diverged"
+            print(f"  {check:<22} {info['checked']:>7} checked  {status}")
+            if info["first"] is not None:
+                print(f"    first: {json.dumps(info['first'])}")
+    sys.exit(1 if any(counts[c][1] for c in checks) else 0)
+
+
+if __name__ == "__main__":
+    main()
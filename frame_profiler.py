@@ -0,0 +1,128 @@
+import json
+import time
+from collections import deque
+
+# ----------------------------
+# Frame-time profiler for the game loop. The loop calls mark(name) as each
+# phase ends, so a phase costs one perf_counter() read; while disabled every
+# call returns on its first line. Nested work (the AI plan inside the update)
+# is timed with now()/span(). Kept free of pygame so tools can load traces.
+# ----------------------------
+HISTORY_FRAMES = 240  # frames behind the on-screen graph and percentiles
+MAX_TRACE_EVENTS = 500_000  # oldest events are dropped past this
+SUMMARY_EVERY_S = 0.5  # percentiles are recomputed at most this often
+WAIT_PHASE = "wait"  # time spent sleeping in clock.tick; not counted as work
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class FrameProfiler:
+    def __init__(self, enabled=False, trace_path=None, history=HISTORY_FRAMES, max_trace_events=MAX_TRACE_EVENTS):
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.frames = deque(maxlen=history)  # (work_ms, total_ms) per finished frame
+        self.phases = {}  # name -> deque of ms per frame it ran in
+        self.phase_order = []  # first-seen order, for a stable overlay
+        self.trace = deque(maxlen=max_trace_events)  # (name, start, end) in perf_counter seconds
+        self.origin = time.perf_counter()
+        self.frame_started = None
+        self.last_mark = None
+        self.current = {}  # phase -> ms, for the frame in progress
+        self.summary_cache = None
+        self.summary_at = 0.0
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        # a frame that was in flight when the profiler turned on is not whole
+        self.frame_started = None
+        self.last_mark = None
+        self.current = {}
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.frame_started is not None:
+            self._finish_frame(now)
+        self.frame_started = self.last_mark = now
+
+    def mark(self, name):
+        """End the phase that began at the previous mark (or frame start)."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.last_mark is not None:
+            self._add(name, self.last_mark, now)
+        self.last_mark = now
+
+    def now(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def span(self, name, started):
+        """Record work nested inside a phase, started at a now() reading."""
+        if not self.enabled or not started:
+            return
+        self._add(name, started, time.perf_counter())
+
+    def _add(self, name, start, end):
+        self.current[name] = self.current.get(name, 0.0) + (end - start) * 1000.0
+        if self.trace_path:
+            self.trace.append((name, start, end))
+
+    def _finish_frame(self, now):
+        total_ms = (now - self.frame_started) * 1000.0
+        work_ms = total_ms - self.current.get(WAIT_PHASE, 0.0)
+        self.frames.append((work_ms, total_ms))
+        for name, ms in self.current.items():
+            series = self.phases.get(name)
+            if series is None:
+                series = self.phases[name] = deque(maxlen=self.frames.maxlen)
+                self.phase_order.append(name)
+            series.append(ms)
+        if self.trace_path:
+            self.trace.append(("frame", self.frame_started, now))
+        self.current = {}
+
+    def summary(self):
+        """{"frame": (p50, p95, p99, max), phase: ...} in ms over the history window, cached briefly."""
+        now = time.perf_counter()
+        if self.summary_cache is not None and now - self.summary_at < SUMMARY_EVERY_S:
+            return self.summary_cache
+        out = {}
+        series = [("frame", [w for w, _ in self.frames])]
+        series += [(name, list(self.phases[name])) for name in self.phase_order if name != WAIT_PHASE]
+        for name, values in series:
+            values.sort()
+            if values:
+                out[name] = (percentile(values, 0.5), percentile(values, 0.95), percentile(values, 0.99), values[-1])
+        self.summary_cache = out
+        self.summary_at = now
+        return out
+
+    def write_trace(self, path=None):
+        """Write the recorded spans as Chrome trace JSON (chrome://tracing, Perfetto)."""
+        path = path or self.trace_path
+        if not path or not self.trace:
+            return None
+        origin = self.origin
+        events = [
+            {
+                "name": name,
+                "cat": "frame" if name == "frame" else "phase",
+                "ph": "X",
+                "ts": round((start - origin) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": 1,
+                "tid": 1,
+            }
+            for name, start, end in self.trace
+        ]
+        # frames first at equal timestamps so viewers nest the phases under them
+        events.sort(key=lambda e: (e["ts"], e["cat"] != "frame", -e["dur"]))
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
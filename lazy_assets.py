@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+
+import pygame
+
+# ----------------------------
+# Deferred fonts and sounds, shared by both game entry points. Nothing loads
+# at import: the window opens first, then a background thread warms every
+# asset while a loading screen runs. Anything needed before the thread gets
+# to it loads on the spot; the lock makes each load happen once.
+# ----------------------------
+_asset_lock = threading.Lock()
+
+
+class LazyAsset:
+    __slots__ = ("loader", "args", "value", "loaded")
+
+    def __init__(self, loader, *args):
+        self.loader = loader
+        self.args = args
+        self.value = None
+        self.loaded = False
+
+    def get(self):
+        if not self.loaded:
+            with _asset_lock:
+                if not self.loaded:
+                    self.value = self.loader(*self.args)
+                    self.loaded = True
+        return self.value
+
+
+class LazyFont(LazyAsset):
+    __slots__ = ()
+
+    def render(self, *args):
+        return self.get().render(*args)
+
+
+def load_font(name, size):
+    # SysFont scans the installed fonts on first use, the slow part of startup
+    if not pygame.font.get_init():
+        pygame.font.init()
+    return pygame.font.SysFont(name, size)
+
+
+def load_sound(name):
+    try:
+        if pygame.mixer.get_init() is None:
+            return None
+        if not os.path.exists(name):
+            return None
+        return pygame.mixer.Sound(name)
+    except Exception:
+        return None
+
+
+def warm_assets(assets):
+    for asset in assets:
+        asset.get()
+
+
+def start_loader(assets):
+    """Warm assets on a background thread; the caller shows a loading screen until it ends."""
+    loader = threading.Thread(target=warm_assets, args=(assets,), name="assets", daemon=True)
+    loader.start()
+    return loader
+
+
+def loaded_fraction(assets):
+    return sum(1 for asset in assets if asset.loaded) / len(assets)
+
+
+class StartupTimer:
+    """Milestones, in ms since the entry module started importing, up to the first interactive frame."""
+
+    def __init__(self, t0):
+        self.t0 = t0
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, (time.perf_counter() - self.t0) * 1000.0))
+
+    def report(self):
+        return "startup: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.marks)
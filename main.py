@@ -1,7 +1,14 @@
+import time
+
+STARTUP_T0 = time.perf_counter()  # taken before pygame's own import, which players wait through too
+
+import os
 import pygame
 import random
 import sys
 
+from lazy_assets import LazyFont, StartupTimer, load_font, loaded_fraction, start_loader
+
 # Configuration - EXACT SAME AS WEB
 CELL = 28
 COLS = 10
@@ -9,9 +16,13 @@ ROWS = 20
 BOARD_W = COLS * CELL
 BOARD_H = ROWS * CELL
 FPS = 60
+LOGIC_HZ = 240  # fixed logic tick rate, independent of FPS
+LOGIC_DT_MS = 1000.0 / LOGIC_HZ
+MAX_FRAME_MS = 250  # longer stalls are dropped, not caught up
 
 WIDTH = BOARD_W + 200
 HEIGHT = BOARD_H
+STARTUP_TIMING = os.environ.get("TETRIS_STARTUP_TIMING", "")  # "1": print startup milestones; "exit": then quit
 
 # Colors - EXACT SAME AS WEB
 COLORS_MAP = {
@@ -26,13 +37,15 @@ COLORS_MAP = {
     '8': (134, 134, 134),   # Garbage gray
 }
 
-pygame.init()
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption('Sam Stackerz - Desktop')
+# The window is created by open_window() when main() starts, not at import;
+# the fonts load on a background thread behind a loading bar once it shows
+screen = None
 clock = pygame.time.Clock()
-font_small = pygame.font.SysFont('Consolas', 16)
-font_medium = pygame.font.SysFont('Consolas', 20)
-font_large = pygame.font.SysFont('Consolas', 24)
+font_small = LazyFont(load_font, 'Consolas', 16)
+font_medium = LazyFont(load_font, 'Consolas', 20)
+font_large = LazyFont(load_font, 'Consolas', 24)
+ASSETS = [font_small, font_medium, font_large]
+startup = StartupTimer(STARTUP_T0)
 
 # Tetrominoes - EXACT SAME AS WEB
 TETROMINOES = {
@@ -70,6 +83,31 @@ def rotate(shape):
     return out
 
 
+class Piece:
+    """Falling piece; the four rotations are built once per kind and shared"""
+    __slots__ = ('kind', 'rotation', 'x', 'y', 'rotations')
+    
+    def __init__(self, kind):
+        self.kind = kind
+        self.rotation = 0
+        self.x = 3
+        self.y = 0
+        self.rotations = piece_rotations(kind)
+
+
+_ROTATIONS = {}
+
+
+def piece_rotations(kind):
+    rotations = _ROTATIONS.get(kind)
+    if rotations is None:
+        rotations = [TETROMINOES[kind]]
+        for _ in range(3):
+            rotations.append(rotate(rotations[-1]))
+        rotations = _ROTATIONS[kind] = tuple(rotations)
+    return rotations
+
+
 def create_empty_grid():
     """Create empty grid"""
     return [['.' for _ in range(COLS)] for _ in range(ROWS)]
@@ -86,6 +124,7 @@ class Game:
     
     def reset(self):
         self.grid = create_empty_grid()
+        self.filled = 0  # occupied cells, for the perfect clear check
         self.score = 0
         self.lines = 0
         self.level = 1
@@ -113,21 +152,12 @@ class Game:
         return self.bag.pop()
     
     def make_piece(self, kind):
-        rotations = [TETROMINOES[kind]]
-        for _ in range(3):
-            rotations.append(rotate(rotations[-1]))
-        return {
-            'kind': kind,
-            'rotation': 0,
-            'x': 3,
-            'y': 0,
-            'rotations': rotations
-        }
+        return Piece(kind)
     
     def spawn(self, piece):
-        piece['x'] = 3
-        piece['y'] = 0
-        piece['rotation'] = 0
+        piece.x = 3
+        piece.y = 0
+        piece.rotation = 0
         self.current = piece
         self.last_move_was_rotate = False
         self.grounded_ms = 0
@@ -136,20 +166,20 @@ class Game:
     
     def shape(self, piece, rot=None):
         if rot is None:
-            rot = piece['rotation']
-        return piece['rotations'][(rot + 4) % 4]
+            rot = piece.rotation
+        return piece.rotations[(rot + 4) % 4]
     
     def collide(self, piece, dx, dy, rot=None):
         if rot is None:
-            rot = piece['rotation']
+            rot = piece.rotation
         s = self.shape(piece, rot)
         for r in range(4):
             for c in range(4):
                 v = s[r][c]
                 if v == '.':
                     continue
-                nx = piece['x'] + c + dx
-                ny = piece['y'] + r + dy
+                nx = piece.x + c + dx
+                ny = piece.y + r + dy
                 if nx < 0 or nx >= COLS or ny >= ROWS:
                     return True
                 if ny >= 0 and self.grid[ny][nx] != '.':
@@ -158,21 +188,21 @@ class Game:
     
     def move(self, dx, dy):
         if not self.collide(self.current, dx, dy):
-            self.current['x'] += dx
-            self.current['y'] += dy
+            self.current.x += dx
+            self.current.y += dy
             self.grounded_ms = 0
             self.last_move_was_rotate = False
             return True
         return False
     
     def rotate_current(self):
-        new_rot = (self.current['rotation'] + 1) % 4
+        new_rot = (self.current.rotation + 1) % 4
         kicks = [[0, 0], [-1, 0], [1, 0], [-2, 0], [2, 0], [0, -1]]
         for dx, dy in kicks:
             if not self.collide(self.current, dx, dy, new_rot):
-                self.current['x'] += dx
-                self.current['y'] += dy
-                self.current['rotation'] = new_rot
+                self.current.x += dx
+                self.current.y += dy
+                self.current.rotation = new_rot
                 self.last_move_was_rotate = True
                 self.grounded_ms = 0
                 return True
@@ -180,14 +210,14 @@ class Game:
     
     def hard_drop(self):
         while not self.collide(self.current, 0, 1):
-            self.current['y'] += 1
+            self.current.y += 1
         self.grounded_ms = self.lock_delay_ms
     
     def detect_t_spin(self):
-        if self.current['kind'] != 'T' or not self.last_move_was_rotate:
+        if self.current.kind != 'T' or not self.last_move_was_rotate:
             return False
-        cx = self.current['x'] + 2
-        cy = self.current['y'] + 1
+        cx = self.current.x + 2
+        cy = self.current.y + 1
         corners = [[cx - 1, cy - 1], [cx + 1, cy - 1], [cx - 1, cy + 1], [cx + 1, cy + 1]]
         blocked = 0
         for x, y in corners:
@@ -200,28 +230,30 @@ class Game:
     def lock_piece(self):
         self.last_attack = 0
         s = self.shape(self.current)
+        touched = set()
         for r in range(4):
             for c in range(4):
                 v = s[r][c]
                 if v == '.':
                     continue
-                x = self.current['x'] + c
-                y = self.current['y'] + r
+                x = self.current.x + c
+                y = self.current.y + r
                 if 0 <= y < ROWS and 0 <= x < COLS:
+                    if self.grid[y][x] == '.':
+                        self.filled += 1
                     self.grid[y][x] = v
+                    touched.add(y)
         
         t_spin = self.detect_t_spin()
-        cleared_rows = []
-        for r in range(ROWS):
-            if all(cell != '.' for cell in self.grid[r]):
-                cleared_rows.append(r)
+        # only the rows the piece landed in can have filled up
+        cleared_rows = [r for r in sorted(touched) if '.' not in self.grid[r]]
         cleared = len(cleared_rows)
         
         if cleared > 0:
             self.combo += 1
-            self.grid = [row for idx, row in enumerate(self.grid) if idx not in cleared_rows]
-            while len(self.grid) < ROWS:
-                self.grid.insert(0, ['.' for _ in range(COLS)])
+            kept = [row for idx, row in enumerate(self.grid) if idx not in cleared_rows]
+            self.grid = [['.' for _ in range(COLS)] for _ in cleared_rows] + kept
+            self.filled -= COLS * cleared
         else:
             self.combo = -1
         
@@ -246,7 +278,7 @@ class Game:
         combo_bonus = max(0, self.combo) * 50
         attack += max(0, self.combo - 1)
         
-        perfect_clear = cleared > 0 and all(all(cell == '.' for cell in row) for row in self.grid)
+        perfect_clear = cleared > 0 and self.filled == 0
         if perfect_clear:
             base += 2000
             attack += 6
@@ -270,7 +302,7 @@ class Game:
         while self.fall_ms >= speed:
             self.fall_ms -= speed
             if not self.collide(self.current, 0, 1):
-                self.current['y'] += 1
+                self.current.y += 1
                 self.grounded_ms = 0
             else:
                 self.grounded_ms += speed
@@ -306,29 +338,70 @@ def draw_grid(surface, grid):
 
 def draw_piece(surface, piece):
     """Draw falling piece"""
-    shape = piece['rotations'][piece['rotation']]
+    shape = piece.rotations[piece.rotation]
     for r in range(4):
         for c in range(4):
             v = shape[r][c]
             if v == '.':
                 continue
-            x = piece['x'] + c
-            y = piece['y'] + r
+            x = piece.x + c
+            y = piece.y + r
             if y >= 0:
                 draw_cell(surface, x, y, v)
 
 
+def open_window():
+    """Show the window, then start loading fonts; returns the loader thread"""
+    global screen
+    startup.mark("imported")
+    # no sounds here, so skip pygame.init()'s mixer setup
+    pygame.display.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption('Sam Stackerz - Desktop')
+    screen.fill(COLORS_MAP['.'])
+    pygame.display.flip()
+    startup.mark("window")
+    pygame.font.init()
+    return start_loader(ASSETS)
+
+
+def draw_loading(surface):
+    """Progress bar while the fonts load (no text: fonts are what is loading)"""
+    surface.fill(COLORS_MAP['.'])
+    x = BOARD_W // 4
+    w = WIDTH - 2 * x
+    y = HEIGHT // 2
+    pygame.draw.rect(surface, COLORS_MAP['3'], (x, y, w, 10), 1)
+    pygame.draw.rect(surface, COLORS_MAP['3'], (x + 2, y + 2, int((w - 4) * loaded_fraction(ASSETS)), 6))
+
+
 def main():
     """Main game loop"""
+    loader = open_window()
     game = Game()
     running = True
     paused = False
     
     # Create board surface
     board_surface = pygame.Surface((BOARD_W, BOARD_H))
+    logic_accum_ms = 0.0
     
     while running:
         dt = clock.tick(FPS) / 1000.0 * 1000  # Convert to ms
+        logic_accum_ms += min(dt, MAX_FRAME_MS)
+        
+        # Loading: only quit works, and the game clock does not run
+        if loader is not None:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    running = False
+            logic_accum_ms = 0.0
+            if loader.is_alive():
+                draw_loading(screen)
+                pygame.display.flip()
+                continue
+            loader = None
+            startup.mark("assets")
         
         # Handle events
         for event in pygame.event.get():
@@ -354,9 +427,11 @@ def main():
                 if event.key == pygame.K_DOWN:
                     game.soft_drop = False
         
-        # Update game
-        if not game.game_over and not paused:
-            game.update(dt)
+        # Update game in fixed ticks
+        while logic_accum_ms >= LOGIC_DT_MS:
+            logic_accum_ms -= LOGIC_DT_MS
+            if not game.game_over and not paused:
+                game.update(LOGIC_DT_MS)
         
         # Draw board
         draw_grid_background(board_surface)
@@ -408,6 +483,11 @@ def main():
             screen.blit(gameover_text, text_rect)
         
         pygame.display.flip()
+        if STARTUP_TIMING and startup.marks[-1][0] == "assets":
+            startup.mark("interactive")
+            print(startup.report())
+            if STARTUP_TIMING == "exit":
+                running = False
     
     pygame.quit()
 
@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+
+# Append-only JSONL record of every match the relay pairs. Relay threads only
+# append a dict to an in-memory queue; one flusher thread serialises the batch
+# and writes it with a single append + fsync, so no connection thread ever
+# waits on the disk.
+FLUSH_INTERVAL_S = 2.0
+MAX_PENDING = 50_000  # records held while the disk is stalled; newer ones are dropped past this
+
+
+class MatchLog:
+    def __init__(self, path, interval=FLUSH_INTERVAL_S, max_pending=MAX_PENDING):
+        self.path = path
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = deque()  # append/popleft are atomic, so record() needs no lock
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def record(self, event: str, **fields):
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self.pending.append({"event": event, "time": round(time.time(), 3), **fields})
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        batch = []
+        pending = self.pending
+        while pending:
+            batch.append(pending.popleft())
+        if not batch:
+            return
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in batch)
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError:
+            # keep the batch for the next tick rather than losing it
+            self.failed_flushes += 1
+            pending.extendleft(reversed(batch))
+            return
+        self.written += len(batch)
+
+    def stats(self) -> dict:
+        return {
+            "match_log_pending": len(self.pending),
+            "match_log_written": self.written,
+            "match_log_dropped": self.dropped,
+            "match_log_failed_flushes": self.failed_flushes,
+        }
+
+
+# ----------------------------
+# Query CLI
+# ----------------------------
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # a torn last line from a crash
+
+
+def player_stats(records, since=None):
+    """Aggregate "end" records into per-player totals, keyed by name."""
+    players = {}
+    for rec in records:
+        if rec.get("event") != "end" or (since is not None and rec.get("time", 0) < since):
+            continue
+        names = rec.get("players") or []
+        attacks = rec.get("attacks") or [0] * len(names)
+        for i, name in enumerate(names):
+            s = players.setdefault(name, {
+                "matches": 0, "wins": 0, "losses": 0, "forfeits": 0, "voided": 0,
+                "attack_sent": 0, "attack_received": 0, "seconds": 0.0,
+            })
+            s["matches"] += 1
+            s["seconds"] += rec.get("duration_s", 0.0)
+            s["attack_sent"] += attacks[i]
+            s["attack_received"] += sum(attacks) - attacks[i]
+            if rec.get("reason") == "void":
+                if rec.get("voided_by") == i:
+                    s["voided"] += 1
+            elif rec.get("winner") == i:
+                s["wins"] += 1
+            elif rec.get("winner") is not None:
+                s["losses"] += 1
+                if rec.get("reason") == "forfeit":
+                    s["forfeits"] += 1
+    for s in players.values():
+        s["seconds"] = round(s["seconds"], 1)
+        s["win_rate"] = round(s["wins"] / s["matches"], 3) if s["matches"] else 0.0
+    return players
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-player stats from a relay match log")
+    parser.add_argument("path", help="JSONL file written by online_server.py --match-log")
+    parser.add_argument("--player", help="only this player")
+    parser.add_argument("--since-hours", type=float, default=None, help="only matches ending in the last N hours")
+    parser.add_argument("--top", type=int, default=20, help="rows to print, by matches played")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    since = time.time() - args.since_hours * 3600 if args.since_hours is not None else None
+    stats = player_stats(read_records(args.path), since)
+    if args.player is not None:
+        stats = {args.player: stats[args.player]} if args.player in stats else {}
+    rows = sorted(stats.items(), key=lambda kv: (-kv[1]["matches"], kv[0]))[: args.top]
+
+    if args.json:
+        json.dump(dict(rows), sys.stdout, indent=2)
+        print()
+        return
+    if not rows:
+        print("no matches")
+        return
+    print(f"{'player':<20} {'played':>6} {'won':>5} {'lost':>5} {'fft':>4} {'void':>4} "
+          f"{'win%':>6} {'atk+':>6} {'atk-':>6} {'mins':>7}")
+    for name, s in rows:
+        print(f"{name[:20]:<20} {s['matches']:>6} {s['wins']:>5} {s['losses']:>5} {s['forfeits']:>4} "
+              f"{s['voided']:>4} {s['win_rate'] * 100:>5.1f}% {s['attack_sent']:>6} {s['attack_received']:>6} "
+              f"{s['seconds'] / 60:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
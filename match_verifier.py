@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import deque
+
+from tetris_engine import GARBAGE_POLICY, Bag, Board, Piece, board_checksum, t_spin_corners
+
+# The relay's authoritative mode: every match is re-simulated from its seed and
+# the players' lockstep event streams. Events are queued by the connection
+# threads and applied by one verifier thread in a batch per tick, across all
+# rooms, so the cost is a few board operations per lock rather than a
+# simulation loop per match.
+VERIFY_TICK_S = 0.05
+VERIFIED_TYPES = frozenset({"lock", "garbage", "checksum", "snapshot"})
+
+
+class VerificationError(Exception):
+    pass
+
+
+class PlayerState:
+    """Authoritative copy of one player's board, advanced only by that player's events."""
+
+    def __init__(self, seed, garbage_policy=GARBAGE_POLICY):
+        self.board = Board(garbage_seed=seed, garbage_policy=garbage_policy)
+        self.bag = Bag(seed=seed)
+        self.kind = self.bag.next_kind()
+        self.next_kind = self.bag.next_kind()
+        self.pieces = 0
+        self.owed_garbage = 0  # rows we have sent this player and it has not applied yet
+        self.topped_out = False
+
+    def lock(self, msg):
+        """Check one lock event against the rules and apply it. Returns the attack it sends."""
+        if self.topped_out:
+            raise VerificationError("lock after top-out")
+        if msg.get("n") != self.pieces + 1:
+            raise VerificationError(f"lock {msg.get('n')} out of order, expected {self.pieces + 1}")
+        piece = Piece(self.kind)
+        piece.x = int(msg["x"])
+        piece.y = int(msg["y"])
+        piece.rotation = int(msg["r"]) % 4
+        board = self.board
+        # reachability from the spawn point is not searched; the placement must be
+        # a legal, resting position for the piece the bag actually dealt
+        if board.collision(piece):
+            raise VerificationError("piece overlaps the stack")
+        if not board.collision(piece, dy=1):
+            raise VerificationError("piece locked in mid-air")
+        t_spin = bool(msg.get("ts"))
+        if t_spin and (piece.kind != "T" or t_spin_corners(board.grid, piece) < 3):
+            raise VerificationError("impossible T-spin")
+        _, attack, _ = board.lock(piece, t_spin=t_spin)
+        self.pieces += 1
+        self.kind = self.next_kind
+        self.next_kind = self.bag.next_kind()
+        if board.collision(Piece(self.kind)):
+            self.topped_out = True
+        return attack
+
+    def garbage(self, msg):
+        n = int(msg["n"])
+        if n <= 0 or n > self.owed_garbage:
+            raise VerificationError(f"applied {n} garbage rows, only {self.owed_garbage} owed")
+        self.owed_garbage -= n
+        self.board.add_garbage(n)
+
+    def checksum(self, msg):
+        if msg.get("n") != self.pieces:
+            return
+        board = self.board
+        if int(msg["crc"]) != board_checksum(board.grid, board.score, board.lines):
+            raise VerificationError("board checksum mismatch")
+
+    def snapshot(self):
+        board = self.board
+        return {
+            "type": "snapshot",
+            "grid": ["".join(row) for row in board.grid],
+            "score": board.score,
+            "lines": board.lines,
+            "game_over": self.topped_out,
+            "n": self.pieces,
+        }
+
+
+class Match:
+    def __init__(self, code, seed, garbage_policy=GARBAGE_POLICY):
+        self.code = code
+        self.players = (PlayerState(seed, garbage_policy), PlayerState(seed, garbage_policy))
+        self.events = deque()  # (player index, msg); appended by connection threads
+        self.void = False
+
+
+class MatchAuthority:
+    """Verifies every authoritative match on one thread, one batch per tick.
+
+    emit is called from the verifier thread with a list of results:
+    (room code, player index, "relay", msg) for messages to pass on as that
+    player's, and (room code, player index, "reject", reason) for a player
+    whose stream broke the rules; the match is void after that.
+    """
+
+    def __init__(self, emit, tick=VERIFY_TICK_S):
+        self.emit = emit
+        self.tick = tick
+        self.lock = threading.Lock()
+        self.matches: dict[str, Match] = {}
+        self.ticks = 0
+        self.events = 0
+        self.rejected = 0
+        self.max_tick_ms = 0.0
+
+    def open(self, code, seed, garbage_policy=GARBAGE_POLICY):
+        with self.lock:
+            self.matches[code] = Match(code, seed, garbage_policy)
+
+    def close(self, code):
+        with self.lock:
+            self.matches.pop(code, None)
+
+    def submit(self, code, index, msg):
+        match = self.matches.get(code)
+        if match is not None and index in (0, 1):
+            match.events.append((index, msg))
+
+    def run(self):
+        next_tick = time.perf_counter()
+        while True:
+            next_tick += self.tick
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+            self.step()
+
+    def step(self):
+        started = time.perf_counter()
+        with self.lock:
+            busy = [m for m in self.matches.values() if m.events]
+        results = []
+        for match in busy:
+            self._advance(match, results)
+        self.ticks += 1
+        self.max_tick_ms = max(self.max_tick_ms, (time.perf_counter() - started) * 1000.0)
+        if results:
+            self.emit(results)
+
+    def _advance(self, match, results):
+        events = match.events
+        while events:
+            index, msg = events.popleft()
+            if match.void:
+                continue
+            self.events += 1
+            player = match.players[index]
+            mtype = msg.get("type")
+            try:
+                if mtype == "lock":
+                    attack = player.lock(msg)
+                    if attack > 0:
+                        match.players[1 - index].owed_garbage += attack
+                        results.append((match.code, index, "relay", {"type": "attack", "amount": attack}))
+                elif mtype == "garbage":
+                    player.garbage(msg)
+                elif mtype == "checksum":
+                    player.checksum(msg)
+                elif mtype == "snapshot":
+                    results.append((match.code, index, "relay", player.snapshot()))
+            except VerificationError as exc:
+                reason = str(exc)
+            except (KeyError, TypeError, ValueError):
+                reason = f"malformed {mtype} event"
+            else:
+                continue
+            match.void = True
+            self.rejected += 1
+            results.append((match.code, index, "reject", reason))
+
+    def stats(self) -> dict:
+        return {
+            "verified_matches": len(self.matches),
+            "verify_ticks": self.ticks,
+            "verify_events": self.events,
+            "verify_rejected": self.rejected,
+            "verify_max_tick_ms": round(self.max_tick_ms, 3),
+        }
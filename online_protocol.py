@@ -0,0 +1,364 @@
+import json
+import struct
+
+# ----------------------------
+# Wire formats
+# ----------------------------
+# Every connection starts out speaking newline-delimited JSON. A client may ask
+# for the binary framing by sending {"type": "join", "wire": "binary"}; once the
+# server answers with a "joined" message carrying "wire": "binary", both sides
+# switch to length-prefixed frames for everything that follows.
+WIRE_JSON = "json"
+WIRE_BINARY = "binary"
+WIRE_FORMATS = (WIRE_JSON, WIRE_BINARY)
+
+BOARD_COLS = 10
+BOARD_ROWS = 20
+
+# frame = varint(length) + type byte + payload
+MSG_JSON = 0  # fallback: payload is a UTF-8 JSON object
+MSG_ATTACK = 1
+MSG_SNAPSHOT = 2
+MSG_GAMEOVER = 3
+MSG_PING = 4
+MSG_START = 5
+MSG_WAITING = 6
+MSG_JOINED = 7
+MSG_OPPONENT_LEFT = 8
+MSG_ERROR = 9
+MSG_INPUT = 10
+MSG_LOCK = 11
+MSG_GARBAGE = 12
+MSG_CHECKSUM = 13
+MSG_FROM = 14  # wrapper: player index byte, then an inner type byte + payload
+MSG_PONG = 15
+MSG_SEQ = 16  # wrapper: varint room sequence number, then an inner type byte + payload
+
+# gameplay messages the relay sequences and keeps for session resumption;
+# both ends count these to agree on what was delivered before a drop
+RESUMABLE_TYPES = frozenset({"attack", "snapshot", "gameover", "input", "lock", "garbage", "checksum", "resync"})
+
+# lockstep input keys, one byte each
+INPUT_KEYS = ("L", "R", "U", "S1", "S0")
+_INPUT_CODES = {k: i for i, k in enumerate(INPUT_KEYS)}
+# piece x/y can hang a little outside the board, so they are sent offset by this
+POS_BIAS = 8
+
+CELL_CHARS = ".12345678"
+_CELL_SET = set(CELL_CHARS)
+_EMPTY_ROW = "." * BOARD_COLS
+_TO_HEX = str.maketrans(".", "0")
+_FROM_HEX = str.maketrans("0", ".")
+
+MAX_FRAME_BYTES = 64 * 1024
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+# ----------------------------
+# Primitives
+# ----------------------------
+def encode_varint(value):
+    if value < 0:
+        raise ProtocolError("varint must be non-negative")
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(data, pos=0):
+    """Return (value, new_pos), or (None, pos) if data ends mid-varint."""
+    result = 0
+    shift = 0
+    while pos < len(data):
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+        if shift > 63:
+            raise ProtocolError("varint too long")
+    return None, pos
+
+
+def _encode_str(text):
+    raw = str(text).encode("utf-8")
+    return encode_varint(len(raw)) + raw
+
+
+def _decode_str(data, pos):
+    n, pos = decode_varint(data, pos)
+    if n is None or pos + n > len(data):
+        raise ProtocolError("truncated string")
+    return data[pos:pos + n].decode("utf-8"), pos + n
+
+
+def _is_uint(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+# ----------------------------
+# Boards
+# ----------------------------
+def encode_board(grid):
+    """Pack a 10x20 grid of row strings as: empty top-row count, then 4-bit cells.
+
+    Cell codes 0-8 are single hex digits, so the packing is just fromhex().
+    """
+    empty = 0
+    while empty < BOARD_ROWS and grid[empty] == _EMPTY_ROW:
+        empty += 1
+    return bytes([empty]) + bytes.fromhex("".join(grid[empty:]).translate(_TO_HEX))
+
+
+def decode_board(data, pos):
+    empty = data[pos]
+    pos += 1
+    if empty > BOARD_ROWS:
+        raise ProtocolError("bad board row count")
+    end = pos + (BOARD_ROWS - empty) * BOARD_COLS // 2
+    if end > len(data):
+        raise ProtocolError("truncated board")
+    flat = data[pos:end].hex().translate(_FROM_HEX)
+    if not _CELL_SET.issuperset(flat):
+        raise ProtocolError("bad board cells")
+    grid = [_EMPTY_ROW] * empty
+    grid.extend(flat[i:i + BOARD_COLS] for i in range(0, len(flat), BOARD_COLS))
+    return grid, end
+
+
+def _is_board(grid):
+    if not isinstance(grid, list) or len(grid) != BOARD_ROWS:
+        return False
+    for row in grid:
+        if not isinstance(row, str) or len(row) != BOARD_COLS:
+            return False
+    return set("".join(grid)) <= _CELL_SET
+
+
+# ----------------------------
+# Binary messages
+# ----------------------------
+def _encode_body(msg):
+    """Return (type_byte, payload) for msg, or None if it needs the JSON fallback."""
+    mtype = msg.get("type")
+    keys = set(msg)
+
+    # attack, snapshot and ping may carry a trailing sender clock stamp (ms)
+    stamp_key = {"attack": "at", "snapshot": "at", "ping": "t0"}.get(mtype)
+    stamp = b""
+    if stamp_key in keys and _is_uint(msg[stamp_key]):
+        stamp = encode_varint(msg[stamp_key])
+        keys.discard(stamp_key)
+
+    if mtype == "attack" and keys == {"type", "amount"} and _is_uint(msg["amount"]):
+        return MSG_ATTACK, encode_varint(msg["amount"]) + stamp
+
+    if mtype == "snapshot" and keys == {"type", "grid", "score", "lines", "game_over"}:
+        if _is_board(msg["grid"]) and _is_uint(msg["score"]) and _is_uint(msg["lines"]):
+            return MSG_SNAPSHOT, (
+                encode_varint(msg["score"])
+                + encode_varint(msg["lines"])
+                + struct.pack("B", 1 if msg["game_over"] else 0)
+                + encode_board(msg["grid"])
+                + stamp
+            )
+
+    if mtype == "ping" and keys == {"type"}:
+        return MSG_PING, stamp
+
+    if mtype == "pong" and keys == {"type", "t0", "t1", "t2"}:
+        if _is_uint(msg["t0"]) and _is_uint(msg["t1"]) and _is_uint(msg["t2"]):
+            return MSG_PONG, encode_varint(msg["t0"]) + encode_varint(msg["t1"]) + encode_varint(msg["t2"])
+
+    if keys == {"type"}:
+        simple = {"gameover": MSG_GAMEOVER, "opponent_left": MSG_OPPONENT_LEFT}
+        if mtype in simple:
+            return simple[mtype], b""
+
+    if mtype == "start" and keys == {"type", "seed", "you", "opponent"}:
+        if _is_uint(msg["seed"]) and _is_uint(msg["you"]) and msg["you"] < 256:
+            return MSG_START, (
+                encode_varint(msg["seed"]) + struct.pack("B", msg["you"]) + _encode_str(msg["opponent"])
+            )
+
+    if mtype in ("waiting", "error") and keys == {"type", "message"}:
+        return (MSG_WAITING if mtype == "waiting" else MSG_ERROR), _encode_str(msg["message"])
+
+    if mtype == "joined" and keys == {"type", "room", "slot"} and _is_uint(msg["slot"]):
+        return MSG_JOINED, _encode_str(msg["room"]) + encode_varint(msg["slot"])
+
+    # lockstep stream: a few bytes per event
+    if mtype == "input" and keys == {"type", "t", "k"} and _is_uint(msg["t"]) and msg["k"] in _INPUT_CODES:
+        return MSG_INPUT, encode_varint(msg["t"]) + bytes([_INPUT_CODES[msg["k"]]])
+
+    if mtype == "lock" and keys == {"type", "t", "n", "x", "y", "r", "ts"}:
+        x = msg["x"] + POS_BIAS if isinstance(msg["x"], int) else -1
+        y = msg["y"] + POS_BIAS if isinstance(msg["y"], int) else -1
+        if _is_uint(msg["t"]) and _is_uint(msg["n"]) and 0 <= x < 256 and 0 <= y < 256 and msg["r"] in (0, 1, 2, 3):
+            flags = msg["r"] | (4 if msg["ts"] else 0)
+            return MSG_LOCK, encode_varint(msg["t"]) + encode_varint(msg["n"]) + bytes([x, y, flags])
+
+    if mtype == "garbage" and keys == {"type", "t", "n"} and _is_uint(msg["t"]) and _is_uint(msg["n"]):
+        return MSG_GARBAGE, encode_varint(msg["t"]) + encode_varint(msg["n"])
+
+    if mtype == "checksum" and keys == {"type", "t", "n", "crc"}:
+        if _is_uint(msg["t"]) and _is_uint(msg["n"]) and _is_uint(msg["crc"]) and msg["crc"] < 2**32:
+            return MSG_CHECKSUM, encode_varint(msg["t"]) + encode_varint(msg["n"]) + struct.pack(">I", msg["crc"])
+
+    return None
+
+
+def _with_stamp(msg, key, body, pos):
+    if pos < len(body):
+        msg[key], _ = decode_varint(body, pos)
+    return msg
+
+
+def _decode_body(mtype, body):
+    if mtype == MSG_JSON:
+        msg = json.loads(body.decode("utf-8"))
+        if not isinstance(msg, dict):
+            raise ProtocolError("JSON frame is not an object")
+        return msg
+    if mtype == MSG_ATTACK:
+        amount, pos = decode_varint(body, 0)
+        return _with_stamp({"type": "attack", "amount": amount}, "at", body, pos)
+    if mtype == MSG_SNAPSHOT:
+        score, pos = decode_varint(body, 0)
+        lines, pos = decode_varint(body, pos)
+        game_over = bool(body[pos])
+        grid, pos = decode_board(body, pos + 1)
+        msg = {"type": "snapshot", "grid": grid, "score": score, "lines": lines, "game_over": game_over}
+        return _with_stamp(msg, "at", body, pos)
+    if mtype == MSG_GAMEOVER:
+        return {"type": "gameover"}
+    if mtype == MSG_PING:
+        return _with_stamp({"type": "ping"}, "t0", body, 0)
+    if mtype == MSG_PONG:
+        t0, pos = decode_varint(body, 0)
+        t1, pos = decode_varint(body, pos)
+        t2, _ = decode_varint(body, pos)
+        return {"type": "pong", "t0": t0, "t1": t1, "t2": t2}
+    if mtype == MSG_OPPONENT_LEFT:
+        return {"type": "opponent_left"}
+    if mtype == MSG_START:
+        seed, pos = decode_varint(body, 0)
+        you = body[pos]
+        opponent, _ = _decode_str(body, pos + 1)
+        return {"type": "start", "seed": seed, "you": you, "opponent": opponent}
+    if mtype in (MSG_WAITING, MSG_ERROR):
+        message, _ = _decode_str(body, 0)
+        return {"type": "waiting" if mtype == MSG_WAITING else "error", "message": message}
+    if mtype == MSG_JOINED:
+        room, pos = _decode_str(body, 0)
+        slot, _ = decode_varint(body, pos)
+        return {"type": "joined", "room": room, "slot": slot}
+    if mtype == MSG_INPUT:
+        t, pos = decode_varint(body, 0)
+        return {"type": "input", "t": t, "k": INPUT_KEYS[body[pos]]}
+    if mtype == MSG_LOCK:
+        t, pos = decode_varint(body, 0)
+        n, pos = decode_varint(body, pos)
+        x, y, flags = body[pos:pos + 3]
+        return {"type": "lock", "t": t, "n": n, "x": x - POS_BIAS, "y": y - POS_BIAS, "r": flags & 3, "ts": (flags >> 2) & 1}
+    if mtype == MSG_GARBAGE:
+        t, pos = decode_varint(body, 0)
+        n, _ = decode_varint(body, pos)
+        return {"type": "garbage", "t": t, "n": n}
+    if mtype == MSG_CHECKSUM:
+        t, pos = decode_varint(body, 0)
+        n, pos = decode_varint(body, pos)
+        (crc,) = struct.unpack(">I", body[pos:pos + 4])
+        return {"type": "checksum", "t": t, "n": n, "crc": crc}
+    raise ProtocolError(f"unknown message type {mtype}")
+
+
+def _encode_typed(msg):
+    encoded = _encode_body(msg)
+    if encoded is None:
+        return bytes([MSG_JSON]) + json.dumps(msg, separators=(",", ":")).encode("utf-8")
+    mtype, body = encoded
+    return bytes([mtype]) + body
+
+
+def encode_binary(msg):
+    sender = msg.get("from")
+    if isinstance(sender, int) and 0 <= sender < 256 and not isinstance(sender, bool):
+        # messages fanned out to spectators keep their compact form behind a 2-byte tag
+        inner = dict(msg)
+        del inner["from"]
+        typed = bytes([MSG_FROM, sender]) + _encode_typed(inner)
+    elif _is_uint(msg.get("seq")):
+        inner = dict(msg)
+        seq = inner.pop("seq")
+        typed = bytes([MSG_SEQ]) + encode_varint(seq) + _encode_typed(inner)
+    else:
+        typed = _encode_typed(msg)
+    return encode_varint(len(typed)) + typed
+
+
+def encode_json(msg):
+    return (json.dumps(msg) + "\n").encode("utf-8")
+
+
+def encode_message(msg, wire=WIRE_JSON):
+    if wire == WIRE_BINARY:
+        return encode_binary(msg)
+    return encode_json(msg)
+
+
+def read_message(buffer, wire=WIRE_JSON, max_bytes=MAX_FRAME_BYTES):
+    """Pull one message off the front of buffer.
+
+    Returns (msg, rest). msg is None when buffer does not yet hold a whole
+    message, and {} when a complete but unreadable message was skipped.
+    Raises ProtocolError for a frame or line longer than max_bytes, before
+    any of it is parsed.
+    """
+    if wire == WIRE_BINARY:
+        length, pos = decode_varint(buffer, 0)
+        if length is None:
+            return None, buffer
+        if length == 0 or length > max_bytes:
+            raise ProtocolError(f"bad frame length {length}")
+        end = pos + length
+        if end > len(buffer):
+            return None, buffer
+        try:
+            if buffer[pos] == MSG_FROM:
+                msg = _decode_body(buffer[pos + 2], bytes(buffer[pos + 3:end]))
+                msg["from"] = buffer[pos + 1]
+            elif buffer[pos] == MSG_SEQ:
+                seq, inner = decode_varint(buffer, pos + 1)
+                msg = _decode_body(buffer[inner], bytes(buffer[inner + 1:end]))
+                msg["seq"] = seq
+            else:
+                msg = _decode_body(buffer[pos], bytes(buffer[pos + 1:end]))
+        except Exception:
+            msg = {}
+        return msg, buffer[end:]
+
+    nl = buffer.find(b"\n", 0, max_bytes + 1)
+    if nl < 0:
+        if len(buffer) > max_bytes:
+            raise ProtocolError(f"line longer than {max_bytes} bytes")
+        return None, buffer
+    line = buffer[:nl].strip()
+    rest = buffer[nl + 1:]
+    if not line:
+        return {}, rest
+    try:
+        msg = json.loads(line.decode("utf-8"))
+    except Exception:
+        return {}, rest
+    return (msg if isinstance(msg, dict) else {}), rest
@@ -1,12 +1,24 @@
 import argparse
+import bisect
+import heapq
+import itertools
 import json
 import random
+import secrets
 import socket
 import threading
+import time
+from collections import deque
 from dataclasses import dataclass, field
 
+from match_log import FLUSH_INTERVAL_S, MatchLog
+from match_verifier import VERIFIED_TYPES, MatchAuthority
+from online_protocol import RESUMABLE_TYPES, WIRE_FORMATS, WIRE_JSON, ProtocolError, encode_message, read_message
+from relay_metrics import RelayMetrics, dump_loop, serve_http
+from tetris_engine import GARBAGE_POLICIES, GARBAGE_POLICY
 
-@dataclass
+
+@dataclass(eq=False)
 class ClientConn:
     sock: socket.socket
     addr: tuple
@@ -16,16 +28,277 @@ class ClientConn:
     opponent: "ClientConn | None" = None
     recv_buffer: bytes = b""
     alive: bool = True
+    wire: str = WIRE_JSON
+    netcode: str = "snapshot"
+    spectator: bool = False
+    outbox: "Outbox | None" = None
+    # session resumption: players get a token on join; a dropped player stays
+    # parked in its room (away_since set) until it resumes or the grace ends
+    token: str = ""
+    recv_count: int = 0  # resumable messages received from this player's session
+    away_since: float | None = None
+    last_seen: float = field(default_factory=time.monotonic)  # last byte received
+    probed: bool = False  # a heartbeat went out and no byte has come back since
+    # abuse limits, created on accept: raw bytes, per message type, and strikes
+    byte_bucket: "TokenBucket | None" = None
+    type_buckets: dict = field(default_factory=dict)
+    strikes: "TokenBucket | None" = None
+    rate_limited: int = 0
 
 
 @dataclass
 class Room:
     code: str
     players: list[ClientConn] = field(default_factory=list)
+    # replaced, never mutated in place, so relay threads can iterate without rooms_lock
+    spectators: list[ClientConn] = field(default_factory=list)
+    seed: int | None = None
+    netcode: str = "snapshot"
+    garbage_policy: str = GARBAGE_POLICY
+    # recent relayed messages as (seq, recipient index, msg) so a resuming player
+    # can catch up; lock orders seq assignment with delivery and the resume swap
+    ring: deque = field(default_factory=lambda: deque(maxlen=ROOM_RING_SIZE))
+    next_seq: int = 1
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # tallies for the match log; match_id is cleared once the result is recorded
+    match_id: str = ""
+    started_at: float = 0.0
+    attacks: list[int] = field(default_factory=lambda: [0, 0])
+    scores: list[int] = field(default_factory=lambda: [0, 0])
 
 
-rooms_lock = threading.Lock()
+# re-entrant: a failed send inside a locked section may call remove_client
+rooms_lock = threading.RLock()
 rooms: dict[str, Room] = {}
+clients: set[ClientConn] = set()
+
+NETCODES = ("snapshot", "lockstep")
+ROOM_RING_SIZE = 512
+RESUME_GRACE_S = 20.0
+# authoritative mode: every match runs lockstep and the server re-simulates it,
+# computing attacks and snapshots itself instead of trusting the clients'
+AUTHORITATIVE = False
+UNTRUSTED_TYPES = frozenset({"attack", "snapshot"})  # replaced by the verifier's results
+VOID_DISCONNECT_DELAY_S = 0.5
+sessions: dict[str, ClientConn] = {}
+RELAYED_TYPES = {"attack", "snapshot", "gameover", "ping", "pong", "input", "lock", "garbage", "checksum", "resync"}
+match_log: MatchLog | None = None  # set by serve() when --match-log is given
+
+# Outbound queues: every connection has one, drained by its own writer thread.
+# A queued message of a coalescing type is replaced by a newer one with the
+# same key, so a backed-up reader only ever gets the latest snapshot. Types in
+# a connection's droppable set are skipped once the queue passes its soft
+# limit. Anything else is critical: it is never dropped, and a connection
+# whose queue reaches the hard limit is disconnected instead.
+COALESCE_TYPES = {"snapshot"}
+PLAYER_QUEUE_SOFT = 256
+PLAYER_QUEUE_HARD = 1024
+PLAYER_DROPPABLE = frozenset()
+SPECTATOR_QUEUE_SOFT = 64
+SPECTATOR_QUEUE_HARD = 256
+SPECTATOR_DROPPABLE = frozenset({"ping", "pong", "checksum"})
+
+# A connection silent for HEARTBEAT_S is sent a heartbeat it must echo; one
+# silent for IDLE_TIMEOUT_S (half-open TCP, a hung client) is reaped.
+HEARTBEAT_S = 10.0
+IDLE_TIMEOUT_S = 30.0
+
+# Abuse limits. Bytes are metered and frame size capped before anything is
+# parsed; each message type then has its own token bucket (messages/s, burst).
+# A message over its type's budget is dropped and costs a strike; a client out
+# of strikes, over the byte budget or sending an oversized frame is cut off.
+MAX_FRAME_BYTES = 8 * 1024
+MAX_BYTES_PER_S = 32 * 1024
+MAX_BYTES_BURST = 128 * 1024
+RATE_LIMITS = {
+    "snapshot": (20, 40),
+    "input": (60, 120),
+    "lock": (15, 30),
+    "attack": (15, 30),
+    "garbage": (15, 30),
+    "checksum": (5, 10),
+    "ping": (5, 10),
+    "pong": (5, 10),
+    "gameover": (1, 3),
+    "resync": (2, 5),
+    "heartbeat": (2, 5),
+    "join": (1, 3),
+    "leave": (1, 2),
+    "queue_stats": (2, 5),
+    "server_stats": (2, 5),
+}
+DEFAULT_RATE_LIMIT = (10, 20)
+STRIKES = (1, 20)  # forgiven per second, allowed in a burst
+RATE_LIMIT_SCALE = 1.0  # multiplies every limit above; 0 turns limiting off
+
+MATCHMAKING_ROOM = "*"
+DEFAULT_RATING = 1000
+WAIT_HISTOGRAM_BOUNDS = (1, 2, 5, 10, 30, 60)  # seconds; last bucket is "60+"
+
+
+@dataclass
+class QueueEntry:
+    client: ClientConn
+    rating: int
+    enqueued_at: float
+    active: bool = True
+
+
+class Matchmaker:
+    """Rating-bucketed waiting queue.
+
+    Players sit in FIFO buckets of `bucket_width` rating points. The sorted
+    list of non-empty bucket ids is searched with bisect, so finding the
+    candidates inside a player's window only touches the buckets it covers
+    rather than every waiting player. Windows widen with time spent waiting.
+    """
+
+    def __init__(self, bucket_width=100, base_window=100, widen_per_sec=25, max_window=1000):
+        self.bucket_width = bucket_width
+        self.base_window = base_window
+        self.widen_per_sec = widen_per_sec
+        self.max_window = max_window
+        self.lock = threading.Lock()
+        self.buckets: dict[int, deque[QueueEntry]] = {}
+        self.bucket_keys: list[int] = []
+        self.entries: dict[int, QueueEntry] = {}
+        self.wait_histogram = [0] * (len(WAIT_HISTOGRAM_BOUNDS) + 1)
+        self.matches = 0
+
+    def window(self, entry, now):
+        return min(self.max_window, self.base_window + self.widen_per_sec * (now - entry.enqueued_at))
+
+    def _bucket_of(self, rating):
+        return rating // self.bucket_width
+
+    def _push(self, entry, front=False):
+        key = self._bucket_of(entry.rating)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = deque()
+            bisect.insort(self.bucket_keys, key)
+        if front:
+            bucket.appendleft(entry)
+        else:
+            bucket.append(entry)
+
+    def _head(self, key):
+        """First still-active entry of a bucket; drops cancelled ones and empty buckets."""
+        bucket = self.buckets[key]
+        while bucket and not bucket[0].active:
+            bucket.popleft()
+        if not bucket:
+            del self.buckets[key]
+            self.bucket_keys.pop(bisect.bisect_left(self.bucket_keys, key))
+            return None
+        return bucket[0]
+
+    def _take(self, entry):
+        bucket = self.buckets[self._bucket_of(entry.rating)]
+        bucket.popleft()
+        entry.active = False
+        self.entries.pop(id(entry.client), None)
+        self._head(self._bucket_of(entry.rating))
+
+    def _find(self, entry, now):
+        """Closest-rated bucket head within entry's window, or None."""
+        window = self.window(entry, now)
+        lo = self._bucket_of(max(0, int(entry.rating - window)))
+        hi = self._bucket_of(int(entry.rating + window))
+        best = None
+        i = bisect.bisect_left(self.bucket_keys, lo)
+        while i < len(self.bucket_keys) and self.bucket_keys[i] <= hi:
+            key = self.bucket_keys[i]
+            head = self._head(key)
+            if head is None:
+                continue  # bucket removed, same index now holds the next key
+            i += 1
+            diff = abs(head.rating - entry.rating)
+            if diff <= window and (best is None or diff < abs(best.rating - entry.rating)):
+                best = head
+        return best
+
+    def _record_wait(self, entry, now):
+        waited = now - entry.enqueued_at
+        idx = bisect.bisect_right(WAIT_HISTOGRAM_BOUNDS, waited)
+        self.wait_histogram[idx] += 1
+
+    def enqueue(self, client, rating):
+        """Queue a client; returns (entry, opponent) if it was matched immediately."""
+        now = time.monotonic()
+        entry = QueueEntry(client=client, rating=max(0, int(rating)), enqueued_at=now)
+        with self.lock:
+            # a repeated join replaces the client's old entry instead of matching it
+            old = self.entries.pop(id(client), None)
+            if old is not None:
+                old.active = False
+            opponent = self._find(entry, now)
+            if opponent is not None:
+                self._take(opponent)
+                self._record_wait(opponent, now)
+                self._record_wait(entry, now)
+                self.matches += 1
+                return entry, opponent
+            self.entries[id(client)] = entry
+            self._push(entry)
+        return None
+
+    def requeue(self, entry):
+        """Put a matched entry back at the front of its bucket, keeping its wait time."""
+        with self.lock:
+            entry.active = True
+            self.entries[id(entry.client)] = entry
+            self._push(entry, front=True)
+
+    def cancel(self, client):
+        with self.lock:
+            entry = self.entries.pop(id(client), None)
+            if entry is not None:
+                entry.active = False
+
+    def sweep(self):
+        """Retry the oldest player of every bucket with its widened window."""
+        now = time.monotonic()
+        pairs = []
+        with self.lock:
+            for key in list(self.bucket_keys):
+                if key not in self.buckets:
+                    continue
+                head = self._head(key)
+                if head is None:
+                    continue
+                # take the head out so it cannot match itself
+                self._take(head)
+                opponent = self._find(head, now)
+                if opponent is None:
+                    head.active = True
+                    self.entries[id(head.client)] = head
+                    self._push(head, front=True)
+                    continue
+                self._take(opponent)
+                self._record_wait(head, now)
+                self._record_wait(opponent, now)
+                self.matches += 1
+                pairs.append((head, opponent))
+        return pairs
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            waits = [now - e.enqueued_at for e in self.entries.values()]
+            labels = [f"<{b}s" for b in WAIT_HISTOGRAM_BOUNDS] + [f">={WAIT_HISTOGRAM_BOUNDS[-1]}s"]
+            return {
+                "type": "queue_stats",
+                "depth": len(self.entries),
+                "buckets": len(self.bucket_keys),
+                "matches": self.matches,
+                "longest_wait_s": round(max(waits), 2) if waits else 0,
+                "wait_histogram": dict(zip(labels, self.wait_histogram)),
+            }
+
+
+matchmaker = Matchmaker()
+match_counter = itertools.count(1)
 
 
 def send_json(sock: socket.socket, payload: dict):
@@ -33,27 +306,353 @@ def send_json(sock: socket.socket, payload: dict):
     sock.sendall(data)
 
 
+def coalesce_key(msg: dict):
+    mtype = msg.get("type")
+    return (mtype, msg.get("from")) if mtype in COALESCE_TYPES else None
+
+
+def send_msg(client: ClientConn, payload: dict, wire: str | None = None, received_at=None) -> bool:
+    """Queue payload for client without touching the socket. False if the client was dropped.
+
+    received_at is the perf_counter() time the message was read, for relay latency.
+    """
+    data = encode_message(payload, client.wire if wire is None else wire)
+    return send_frame(client, payload.get("type"), coalesce_key(payload), data, received_at)
+
+
+def send_frame(client: ClientConn, mtype, key, data: bytes, received_at=None) -> bool:
+    if client.outbox is None or not client.outbox.push(mtype, key, data, received_at):
+        remove_client(client)
+        return False
+    return True
+
+
+class Outbox:
+    """Bounded outbound frame queue for one connection, written on a dedicated thread."""
+
+    def __init__(self, client: ClientConn, soft_limit=PLAYER_QUEUE_SOFT, hard_limit=PLAYER_QUEUE_HARD,
+                 droppable=PLAYER_DROPPABLE):
+        self.client = client
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.droppable = droppable
+        # entries are [key, data, mtype, received_at]; a coalesced entry has its data set to None
+        self.queue: deque[list] = deque()
+        self.latest: dict = {}
+        self.depth = 0
+        self.max_depth = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.sent_bytes = 0
+        self.cond = threading.Condition()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def push(self, mtype, key, data: bytes, received_at=None) -> bool:
+        """Queue a frame. Returns False if the connection is too far behind to keep."""
+        with self.cond:
+            if key is not None:
+                old = self.latest.get(key)
+                if old is not None and old[1] is not None:
+                    old[1] = None
+                    self.depth -= 1
+                    self.coalesced += 1
+            if self.depth >= self.soft_limit and mtype in self.droppable:
+                self.dropped += 1
+                return True
+            if self.depth >= self.hard_limit:
+                return False
+            if len(self.queue) >= 2 * self.hard_limit:
+                # a stalled reader leaves coalesced husks behind; compact them away
+                self.queue = deque(e for e in self.queue if e[1] is not None)
+            entry = [key, data, mtype, received_at]
+            self.queue.append(entry)
+            if key is not None:
+                self.latest[key] = entry
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+            self.cond.notify()
+        return True
+
+    def close(self):
+        with self.cond:
+            self.queue.clear()
+            self.latest.clear()
+            self.depth = 0
+            self.cond.notify()
+
+    def run(self):
+        client = self.client
+        while True:
+            with self.cond:
+                while not self.queue and client.alive:
+                    self.cond.wait(1.0)
+                if not client.alive:
+                    return
+                # drain everything queued so far into one write
+                batch = [entry for entry in self.queue if entry[1] is not None]
+                self.queue.clear()
+                self.latest.clear()
+                self.depth = 0
+            if not batch:
+                continue
+            data = b"".join(entry[1] for entry in batch)
+            try:
+                client.sock.sendall(data)
+            except Exception:
+                remove_client(client)
+                return
+            self.sent_bytes += len(data)
+            metrics.record_out([(e[2], len(e[1]), e[3]) for e in batch], time.perf_counter())
+
+
+class TimerHeap:
+    """Every server deadline on one thread: a heap of (when, seq, fn, args).
+
+    Scales with connections without a thread or threading.Timer each;
+    callbacks run on the timer thread and must not block.
+    """
+
+    def __init__(self):
+        self.heap: list = []
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+
+    def call_later(self, delay, fn, *args):
+        when = time.monotonic() + delay
+        with self.cond:
+            heapq.heappush(self.heap, (when, next(self.counter), fn, args))
+            if self.heap[0][0] == when:
+                self.cond.notify()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while True:
+                    if not self.heap:
+                        self.cond.wait()
+                        continue
+                    delay = self.heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self.cond.wait(delay)
+                _, _, fn, args = heapq.heappop(self.heap)
+            try:
+                fn(*args)
+            except Exception:
+                pass
+
+
+timers = TimerHeap()
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self, amount, now) -> bool:
+        tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if tokens < amount:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - amount
+        return True
+
+
+def make_bucket(limit):
+    rate, burst = limit
+    return TokenBucket(rate * RATE_LIMIT_SCALE, burst * RATE_LIMIT_SCALE)
+
+
+def drop_abuser(client: ClientConn, reason: str):
+    """Cut a client off without a resume window."""
+    with rooms_lock:
+        if not client.alive:
+            return
+        sessions.pop(client.token, None)
+        closed_totals["abusive"] += 1
+    print(f"Dropping {client.addr[0]}:{client.addr[1]} ({client.name}): {reason}")
+    remove_client(client)
+
+
+def allow_message(client: ClientConn, mtype, now) -> bool:
+    if RATE_LIMIT_SCALE <= 0:
+        return True
+    bucket = client.type_buckets.get(mtype)
+    if bucket is None:
+        limit = RATE_LIMITS.get(mtype)
+        if limit is None:
+            # unknown types share one bucket, so junk type names can't mint new budgets
+            mtype, limit = None, DEFAULT_RATE_LIMIT
+            bucket = client.type_buckets.get(None)
+        if bucket is None:
+            bucket = client.type_buckets[mtype] = make_bucket(limit)
+    if bucket.take(1, now):
+        return True
+    client.rate_limited += 1
+    if not client.strikes.take(1, now):
+        drop_abuser(client, f"sustained {mtype} flood")
+    return False
+
+
+def check_idle(client: ClientConn):
+    """One pending check per connection, rescheduled from its last_seen each time it fires."""
+    if not client.alive or IDLE_TIMEOUT_S <= 0:
+        return
+    silent = time.monotonic() - client.last_seen
+    if silent >= IDLE_TIMEOUT_S:
+        with rooms_lock:
+            closed_totals["reaped"] += 1
+        remove_client(client)
+        return
+    if silent >= HEARTBEAT_S:
+        if not client.probed:
+            client.probed = True
+            send_msg(client, {"type": "heartbeat"})
+        timers.call_later(IDLE_TIMEOUT_S - silent, check_idle, client)
+    else:
+        timers.call_later(HEARTBEAT_S - silent, check_idle, client)
+
+
+closed_totals = {"connections": 0, "dropped": 0, "coalesced": 0, "sent_bytes": 0, "reaped": 0, "abusive": 0,
+                 "rate_limited": 0}
+
+
+def connection_stats() -> dict:
+    with rooms_lock:
+        live_clients = list(clients)
+        live = [c.outbox for c in live_clients if c.outbox is not None]
+        totals = dict(closed_totals)
+    return {
+        "type": "server_stats",
+        "connections": len(live),
+        "closed_connections": totals["connections"],
+        "queued": sum(o.depth for o in live),
+        "max_queue_depth": max((o.max_depth for o in live), default=0),
+        "dropped": totals["dropped"] + sum(o.dropped for o in live),
+        "coalesced": totals["coalesced"] + sum(o.coalesced for o in live),
+        "sent_bytes": totals["sent_bytes"] + sum(o.sent_bytes for o in live),
+        "reaped": totals["reaped"],
+        "abusive": totals["abusive"],
+        "rate_limited": totals["rate_limited"] + sum(c.rate_limited for c in live_clients),
+    }
+
+
+def broadcast_to_spectators(room: Room, msg: dict, received_at=None):
+    """Encode msg once per wire format and queue the same bytes for every spectator in the room."""
+    spectators = room.spectators
+    if not spectators:
+        return
+    mtype = msg.get("type")
+    key = coalesce_key(msg)
+    frames = {}
+    for spec in spectators:
+        data = frames.get(spec.wire)
+        if data is None:
+            data = frames[spec.wire] = encode_message(msg, spec.wire)
+        send_frame(spec, mtype, key, data, received_at)
+
+
 def remove_client(client: ClientConn):
-    client.alive = False
+    with rooms_lock:
+        if not client.alive:
+            return
+        client.alive = False
+        clients.discard(client)
+        if client.outbox is not None:
+            closed_totals["connections"] += 1
+            closed_totals["dropped"] += client.outbox.dropped
+            closed_totals["coalesced"] += client.outbox.coalesced
+            closed_totals["sent_bytes"] += client.outbox.sent_bytes
+        closed_totals["rate_limited"] += client.rate_limited
+    if client.outbox is not None:
+        client.outbox.close()
+    try:
+        # close() alone does not wake a recv()/sendall() blocked on the socket in
+        # another thread; shutdown() makes both return so their threads exit
+        client.sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
     try:
         client.sock.close()
     except Exception:
         pass
 
+    if client.spectator:
+        with rooms_lock:
+            room = rooms.get(client.room)
+            if room is not None:
+                room.spectators = [s for s in room.spectators if s is not client]
+                if not room.players and not room.spectators:
+                    rooms.pop(client.room, None)
+                    metrics.forget_room(client.room)
+        return
+
+    if not park_session(client):
+        leave_room(client)
+
+
+def park_session(client: ClientConn) -> bool:
+    """Keep a dropped player's slot for RESUME_GRACE_S if it is mid-match."""
+    with rooms_lock:
+        room = rooms.get(client.room)
+        if (
+            RESUME_GRACE_S <= 0
+            or sessions.get(client.token) is not client
+            or client.opponent is None
+            or room is None
+            or client not in room.players
+        ):
+            sessions.pop(client.token, None)
+            return False
+        since = client.away_since = time.monotonic()
+    timers.call_later(RESUME_GRACE_S, expire_session, client, since)
     opp = client.opponent
+    if opp is not None and opp.alive:
+        send_msg(opp, {"type": "opponent_away", "grace_ms": int(RESUME_GRACE_S * 1000)})
+    broadcast_to_spectators(room, {"type": "player_away", "from": client.index})
+    return True
+
+
+def expire_session(client: ClientConn, since: float):
+    with rooms_lock:
+        if sessions.get(client.token) is not client or client.away_since != since:
+            return  # resumed (or parked again) in the meantime
+        sessions.pop(client.token, None)
+        client.away_since = None
+    leave_room(client)
+
+
+def leave_room(client: ClientConn):
+    opp = client.opponent
+    room = rooms.get(client.room)
+    if room is not None and room.match_id and client in room.players:
+        finish_match(room, 1 - client.index if opp is not None else None, "forfeit")
     if opp is not None:
         opp.opponent = None
-        try:
-            send_json(opp.sock, {"type": "opponent_left"})
-        except Exception:
-            remove_client(opp)
+        send_msg(opp, {"type": "opponent_left"})
 
     with rooms_lock:
         room = rooms.get(client.room)
-        if room is not None:
+        was_player = room is not None and client in room.players
+        if was_player:
             room.players = [p for p in room.players if p is not client]
-            if not room.players:
+            authority.close(client.room)
+            if not room.players and not room.spectators:
                 rooms.pop(client.room, None)
+                metrics.forget_room(client.room)
+    if was_player and client.index >= 0:
+        broadcast_to_spectators(room, {"type": "player_left", "from": client.index})
+
+    matchmaker.cancel(client)
 
 
 def pair_room_if_ready(room: Room):
@@ -65,60 +664,352 @@ def pair_room_if_ready(room: Room):
     p1.opponent = p2
     p2.opponent = p1
     seed = random.randrange(1_000_000)
+    # lockstep only works if both sides simulate each other
+    lockstep = AUTHORITATIVE or p1.netcode == p2.netcode == "lockstep"
+    room.seed = seed
+    room.netcode = "lockstep" if lockstep else "snapshot"
+    # both boards and the verifier must draw garbage holes the same way
+    room.garbage_policy = GARBAGE_POLICY
+    if AUTHORITATIVE:
+        authority.open(room.code, seed, room.garbage_policy)
+    begin_match(room)
+    broadcast_to_spectators(room, spectator_start(room))
     for player in (p1, p2):
-        send_json(
-            player.sock,
-            {
-                "type": "start",
-                "seed": seed,
-                "you": player.index,
-                "opponent": player.opponent.name,
-            },
+        start = {
+            "type": "start",
+            "seed": seed,
+            "you": player.index,
+            "opponent": player.opponent.name,
+            "garbage": room.garbage_policy,
+        }
+        if lockstep:
+            start["netcode"] = "lockstep"
+        send_msg(player, start)
+
+
+def begin_match(room: Room):
+    room.match_id = secrets.token_hex(6)
+    room.started_at = time.monotonic()
+    room.attacks = [0, 0]
+    room.scores = [0, 0]
+    if match_log is not None:
+        match_log.record(
+            "start",
+            id=room.match_id,
+            room=room.code,
+            players=[p.name for p in room.players],
+            addrs=[p.addr[0] for p in room.players],
+            seed=room.seed,
+            netcode=room.netcode,
+            garbage=room.garbage_policy,
         )
 
 
+def finish_match(room: Room, winner: int | None, reason: str, voided_by: int | None = None):
+    """Record a match's result once; later calls for the same match are ignored."""
+    with rooms_lock:
+        match_id, room.match_id = room.match_id, ""
+    if not match_id or match_log is None:
+        return
+    names = [p.name for p in sorted(room.players, key=lambda p: p.index)]
+    match_log.record(
+        "end",
+        id=match_id,
+        room=room.code,
+        players=names,
+        seed=room.seed,
+        duration_s=round(time.monotonic() - room.started_at, 3),
+        attacks=list(room.attacks),
+        # scores only arrive in snapshots, which lockstep clients never send
+        **({"scores": list(room.scores)} if room.netcode != "lockstep" else {}),
+        winner=winner,
+        reason=reason,
+        **({"voided_by": voided_by} if voided_by is not None else {}),
+    )
+
+
+def spectator_start(room: Room) -> dict:
+    return {
+        "type": "start",
+        "seed": room.seed,
+        "players": [p.name for p in room.players],
+        "netcode": room.netcode,
+        "garbage": room.garbage_policy,
+        "spectator": True,
+    }
+
+
+def ack_join(client: ClientConn, joined: dict, wire: str):
+    # "joined" is always JSON; it is the switch-over point for the requested wire format
+    if wire != WIRE_JSON:
+        joined["wire"] = wire
+    if not client.spectator:
+        if not client.token:
+            client.token = secrets.token_urlsafe(12)
+            with rooms_lock:
+                sessions[client.token] = client
+        joined["token"] = client.token
+    send_msg(client, joined, wire=WIRE_JSON)
+    client.wire = wire
+
+
 def handle_join(client: ClientConn, msg: dict):
     room_code = str(msg.get("room", "default")).strip() or "default"
     client.room = room_code
     client.name = str(msg.get("name", "player")).strip() or "player"
+    wire = msg.get("wire", WIRE_JSON)
+    if wire not in WIRE_FORMATS:
+        wire = WIRE_JSON
+    netcode = msg.get("netcode", "snapshot")
+    client.netcode = netcode if netcode in NETCODES else "snapshot"
+
+    if msg.get("resume") and handle_resume(client, str(msg["resume"]), msg.get("last_seq", 0), wire):
+        return
+
+    if room_code == MATCHMAKING_ROOM:
+        handle_queue(client, msg, wire)
+        return
+
+    if msg.get("spectate"):
+        handle_spectate(client, wire)
+        return
 
     with rooms_lock:
         room = rooms.get(room_code)
         if room is None:
             room = Room(code=room_code)
             rooms[room_code] = room
+        if len(room.players) < 2:
+            room.players.append(client)
+            ack_join(client, {"type": "joined", "room": room_code, "slot": len(room.players)}, wire)
 
-        if len(room.players) >= 2:
-            send_json(client.sock, {"type": "error", "message": "Room is full"})
-            remove_client(client)
+            if len(room.players) == 1:
+                send_msg(client, {"type": "waiting", "message": "Waiting for opponent"})
+            pair_room_if_ready(room)
             return
 
-        room.players.append(client)
-        send_json(client.sock, {"type": "joined", "room": room_code, "slot": len(room.players)})
+    # written directly (remove_client discards the outbox), but never while holding rooms_lock
+    try:
+        send_json(client.sock, {"type": "error", "message": "Room is full"})
+    except OSError:
+        pass
+    remove_client(client)
+
+
+def handle_resume(client: ClientConn, token: str, last_seq, wire: str) -> bool:
+    """Hand a parked player's slot to a new connection and replay what it missed.
+
+    Returns False (and the join carries on as a fresh one) if the session is gone.
+    """
+    with rooms_lock:
+        old = sessions.get(token)
+    if old is not None and old.alive:
+        # the client noticed the drop before we did; park the half-open socket first
+        remove_client(old)
+    with rooms_lock:
+        old = sessions.get(token)
+        room = rooms.get(old.room) if old is not None else None
+        if old is None or old.away_since is None or room is None or old not in room.players:
+            return False
+        old.away_since = None
+        sessions[token] = client
+    try:
+        last_seq = max(0, int(last_seq))
+    except (TypeError, ValueError):
+        last_seq = 0
+
+    client.room = old.room
+    client.name = old.name
+    client.index = old.index
+    client.netcode = old.netcode
+    client.token = token
+    client.recv_count = old.recv_count
+    with room.lock:
+        opp = old.opponent
+        client.opponent = opp
+        if opp is not None:
+            opp.opponent = client
+        room.players = [client if p is old else p for p in room.players]
+        ack_join(
+            client,
+            {
+                "type": "resumed",
+                "room": room.code,
+                "slot": client.index + 1,
+                "recv_seq": client.recv_count,
+                "seed": room.seed,
+                "you": client.index,
+                "opponent": opp.name if opp is not None else "",
+            },
+            wire,
+        )
+        # a full ring may have evicted messages this player never saw
+        gap = len(room.ring) == room.ring.maxlen and room.ring[0][0] > last_seq + 1
+        for seq, recipient, missed in room.ring:
+            if seq > last_seq and recipient == client.index:
+                send_msg(client, missed)
+    if opp is None:
+        send_msg(client, {"type": "opponent_left"})
+    elif opp.alive:
+        send_msg(opp, {"type": "opponent_back"})
+        if gap:
+            send_msg(opp, {"type": "resync"})
+    broadcast_to_spectators(room, {"type": "player_back", "from": client.index})
+    return True
+
 
-        if len(room.players) == 1:
-            send_json(client.sock, {"type": "waiting", "message": "Waiting for opponent"})
+def handle_spectate(client: ClientConn, wire: str):
+    client.spectator = True
+    with rooms_lock:
+        room = rooms.get(client.room)
+        if room is None:
+            room = Room(code=client.room)
+            rooms[client.room] = room
+        ack_join(client, {"type": "joined", "room": client.room, "slot": 0, "spectator": True}, wire)
+        outbox = client.outbox
+        outbox.soft_limit = SPECTATOR_QUEUE_SOFT
+        outbox.hard_limit = SPECTATOR_QUEUE_HARD
+        outbox.droppable = SPECTATOR_DROPPABLE
+        room.spectators = room.spectators + [client]
+        if room.seed is not None and len(room.players) == 2:
+            send_msg(client, spectator_start(room))
+            # a late viewer has no board history; ask both players for a fresh snapshot
+            for player in list(room.players):
+                send_msg(player, {"type": "resync"})
+
+
+def handle_queue(client: ClientConn, msg: dict, wire: str):
+    try:
+        rating = int(msg.get("rating", DEFAULT_RATING))
+    except (TypeError, ValueError):
+        rating = DEFAULT_RATING
+    ack_join(client, {"type": "joined", "room": MATCHMAKING_ROOM, "slot": 0}, wire)
+    send_msg(client, {"type": "waiting", "message": "Searching for opponent"})
+    matched = matchmaker.enqueue(client, rating)
+    if matched is not None:
+        start_match(*matched)
+
+
+def start_match(a: QueueEntry, b: QueueEntry):
+    with rooms_lock:
+        # remove_client flips alive under rooms_lock, so a client that is alive
+        # here gets its leave_room handled against the new room
+        if not (a.client.alive and b.client.alive):
+            for entry in (a, b):
+                if entry.client.alive:
+                    matchmaker.requeue(entry)
+            return
+        code = f"match-{next(match_counter)}"
+        room = Room(code=code)
+        rooms[code] = room
+        for entry in (a, b):
+            entry.client.room = code
+            room.players.append(entry.client)
+        for player in room.players:
+            send_msg(player, {"type": "matched", "room": code})
         pair_room_if_ready(room)
 
 
-def relay_to_opponent(client: ClientConn, msg: dict):
+def matchmaking_loop(interval=0.5):
+    while True:
+        time.sleep(interval)
+        for a, b in matchmaker.sweep():
+            try:
+                start_match(a, b)
+            except Exception as e:
+                print(f"Matchmaking: could not start {a.client.name} vs {b.client.name}: {e!r}")
+
+
+def relay_to_opponent(client: ClientConn, msg: dict, received_at=None):
     opp = client.opponent
     if opp is None:
         return
-    try:
-        send_json(opp.sock, msg)
-    except Exception:
-        remove_client(opp)
+    room = rooms.get(client.room)
+    if room is not None and msg.get("type") in RESUMABLE_TYPES:
+        # sequence and keep it, even while the opponent is away, so a resume can replay it
+        with room.lock:
+            tally = msg.get("amount") if msg["type"] == "attack" else msg.get("score")
+            if type(tally) is int:
+                if msg["type"] == "attack":
+                    room.attacks[client.index] += tally
+                elif msg["type"] == "snapshot":
+                    room.scores[client.index] = tally
+            stamped = dict(msg)
+            stamped["seq"] = room.next_seq
+            room.ring.append((room.next_seq, 1 - client.index, stamped))
+            room.next_seq += 1
+            opp = client.opponent
+            if opp is not None and opp.alive:
+                send_msg(opp, stamped, received_at=received_at)
+    elif opp.alive:
+        send_msg(opp, msg, received_at=received_at)
+
+    if room is not None and room.spectators:
+        tagged = dict(msg)
+        tagged["from"] = client.index
+        broadcast_to_spectators(room, tagged, received_at)
 
 
-def process_message(client: ClientConn, msg: dict):
+def process_message(client: ClientConn, msg: dict, received_at=None):
     mtype = msg.get("type")
     if mtype == "join":
         handle_join(client, msg)
         return
 
-    if mtype in {"attack", "snapshot", "gameover", "ping"}:
-        relay_to_opponent(client, msg)
+    if mtype == "queue_stats":
+        send_msg(client, matchmaker.stats())
+        return
+
+    if mtype == "server_stats":
+        send_msg(client, connection_stats())
+        return
+
+    if mtype == "heartbeat":
+        return  # receiving it already refreshed last_seen
+
+    if mtype == "leave":
+        # deliberate quit: no grace window
+        with rooms_lock:
+            sessions.pop(client.token, None)
+        remove_client(client)
+        return
+
+    if mtype in RELAYED_TYPES and not client.spectator:
+        if mtype in RESUMABLE_TYPES:
+            client.recv_count += 1
+            if mtype == "gameover" and client.opponent is not None:
+                room = rooms.get(client.room)
+                if room is not None:
+                    finish_match(room, 1 - client.index, "topout")
+        if AUTHORITATIVE and client.opponent is not None:
+            if mtype in VERIFIED_TYPES:
+                authority.submit(client.room, client.index, msg)
+            if mtype in UNTRUSTED_TYPES:
+                return
+        relay_to_opponent(client, msg, received_at)
+
+
+def apply_verdicts(results):
+    """Called on the verifier thread with a batch of MatchAuthority results."""
+    for code, index, kind, payload in results:
+        with rooms_lock:
+            room = rooms.get(code)
+            player = next((p for p in room.players if p.index == index), None) if room is not None else None
+        if player is None:
+            continue
+        if kind == "relay":
+            relay_to_opponent(player, payload)
+            continue
+        print(f"[{code}] match voided, player {index} ({player.name}): {payload}")
+        finish_match(room, None, "void", voided_by=index)
+        with rooms_lock:
+            sessions.pop(player.token, None)
+        if player.alive:
+            send_msg(player, {"type": "error", "message": f"Match voided: {payload}"})
+            # give the writer thread a moment to deliver the reason before hanging up
+            timers.call_later(VOID_DISCONNECT_DELAY_S, remove_client, player)
+        else:
+            leave_room(player)  # parked: its grace timer is now a no-op
 
 
 def client_thread(client: ClientConn):
@@ -127,47 +1018,162 @@ def client_thread(client: ClientConn):
             chunk = client.sock.recv(4096)
             if not chunk:
                 break
+            received_at = time.perf_counter()
+            now = client.last_seen = time.monotonic()
+            client.probed = False
+            # metered before any parsing, so a flood costs almost nothing to refuse
+            if RATE_LIMIT_SCALE > 0 and not client.byte_bucket.take(len(chunk), now):
+                drop_abuser(client, "byte rate")
+                break
             client.recv_buffer += chunk
-            while b"\n" in client.recv_buffer:
-                line, client.recv_buffer = client.recv_buffer.split(b"\n", 1)
-                line = line.strip()
-                if not line:
-                    continue
+            while client.alive:
+                # re-read client.wire every message: a join can switch formats mid-buffer
+                before = len(client.recv_buffer)
                 try:
-                    msg = json.loads(line.decode("utf-8"))
-                except Exception:
-                    continue
-                process_message(client, msg)
+                    msg, client.recv_buffer = read_message(client.recv_buffer, client.wire, MAX_FRAME_BYTES)
+                except ProtocolError as exc:
+                    drop_abuser(client, str(exc))
+                    break
+                if msg is None:
+                    break
+                if msg:
+                    mtype = msg.get("type")
+                    metrics.record_in(mtype, before - len(client.recv_buffer),
+                                      client.room if client.opponent is not None else None)
+                    if allow_message(client, mtype, now):
+                        process_message(client, msg, received_at)
     except Exception:
         pass
     finally:
         remove_client(client)
 
 
-def serve(host: str, port: int):
+def server_gauges() -> dict:
+    with rooms_lock:
+        live = list(clients)
+        room_count = len(rooms)
+    return {
+        "connections": len(live),
+        "rooms": room_count,
+        "spectators": sum(1 for c in live if c.spectator),
+        "queued_messages": sum(c.outbox.depth for c in live if c.outbox is not None),
+        "matchmaking_depth": len(matchmaker.entries),
+        "parked_sessions": sum(1 for c in list(sessions.values()) if c.away_since is not None),
+        "pending_timers": len(timers),
+        **(authority.stats() if AUTHORITATIVE else {}),
+        **(match_log.stats() if match_log is not None else {}),
+    }
+
+
+metrics = RelayMetrics()
+metrics.gauges = server_gauges
+authority = MatchAuthority(apply_verdicts)
+
+
+def serve(host: str, port: int, metrics_host="127.0.0.1", metrics_port=0, metrics_file=None, metrics_interval=10.0,
+          resume_grace=RESUME_GRACE_S, authoritative=False, heartbeat=HEARTBEAT_S, idle_timeout=IDLE_TIMEOUT_S,
+          max_frame_bytes=MAX_FRAME_BYTES, max_bytes_per_s=MAX_BYTES_PER_S, rate_limit_scale=RATE_LIMIT_SCALE,
+          match_log_path=None, match_log_interval=FLUSH_INTERVAL_S, garbage_policy=GARBAGE_POLICY):
+    global RESUME_GRACE_S, AUTHORITATIVE, HEARTBEAT_S, IDLE_TIMEOUT_S
+    global MAX_FRAME_BYTES, MAX_BYTES_PER_S, MAX_BYTES_BURST, RATE_LIMIT_SCALE, GARBAGE_POLICY, match_log
+    RESUME_GRACE_S = resume_grace
+    AUTHORITATIVE = authoritative
+    HEARTBEAT_S = heartbeat
+    IDLE_TIMEOUT_S = idle_timeout
+    MAX_FRAME_BYTES = max_frame_bytes
+    MAX_BYTES_BURST = max(4 * max_bytes_per_s, max_frame_bytes)
+    MAX_BYTES_PER_S = max_bytes_per_s
+    RATE_LIMIT_SCALE = rate_limit_scale
+    GARBAGE_POLICY = garbage_policy
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server.bind((host, port))
     server.listen(64)
     print(f"Sam Stackerz online server listening on {host}:{port}")
+    threading.Thread(target=matchmaking_loop, daemon=True).start()
+    threading.Thread(target=metrics.watch_lag, daemon=True).start()
+    threading.Thread(target=timers.run, daemon=True).start()
+    if AUTHORITATIVE:
+        threading.Thread(target=authority.run, daemon=True).start()
+        print(f"Authoritative mode: verifying matches every {authority.tick * 1000:g} ms")
+    if metrics_port:
+        serve_http(metrics, metrics_host, metrics_port)
+        print(f"Metrics on http://{metrics_host}:{metrics_port}/metrics (JSON: /metrics.json)")
+    if metrics_file:
+        threading.Thread(target=dump_loop, args=(metrics, metrics_file, metrics_interval), daemon=True).start()
+        print(f"Dumping metrics every {metrics_interval:g}s to {metrics_file}")
+    if match_log_path:
+        match_log = MatchLog(match_log_path, match_log_interval)
+        threading.Thread(target=match_log.run, daemon=True).start()
+        print(f"Logging matches to {match_log_path}")
 
     try:
         while True:
             sock, addr = server.accept()
             sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             client = ClientConn(sock=sock, addr=addr)
+            client.outbox = Outbox(client)
+            client.byte_bucket = TokenBucket(MAX_BYTES_PER_S * RATE_LIMIT_SCALE, MAX_BYTES_BURST * RATE_LIMIT_SCALE)
+            client.strikes = make_bucket(STRIKES)
+            with rooms_lock:
+                clients.add(client)
+            if IDLE_TIMEOUT_S > 0:
+                timers.call_later(min(HEARTBEAT_S, IDLE_TIMEOUT_S), check_idle, client)
             t = threading.Thread(target=client_thread, args=(client,), daemon=True)
             t.start()
     finally:
         server.close()
+        if match_log is not None:
+            match_log.flush()
 
 
 def main():
     parser = argparse.ArgumentParser(description="Sam Stackerz online relay server")
     parser.add_argument("--host", default="0.0.0.0")
     parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--metrics-host", default="127.0.0.1")
+    parser.add_argument("--metrics-port", type=int, default=0, help="HTTP port for /metrics (0 = off)")
+    parser.add_argument("--metrics-file", default=None, help="append a JSONL metrics record here periodically")
+    parser.add_argument("--metrics-interval", type=float, default=10.0)
+    parser.add_argument("--resume-grace", type=float, default=RESUME_GRACE_S,
+                        help="seconds a dropped player's slot is held for reconnection (0 = off)")
+    parser.add_argument("--heartbeat", type=float, default=HEARTBEAT_S,
+                        help="seconds of silence before a connection is sent a heartbeat")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT_S,
+                        help="seconds of silence before a connection is dropped (0 = never)")
+    parser.add_argument("--max-frame-bytes", type=int, default=MAX_FRAME_BYTES,
+                        help="longest JSON line or binary frame a client may send")
+    parser.add_argument("--max-bytes-per-s", type=int, default=MAX_BYTES_PER_S,
+                        help="sustained inbound bytes/s per connection (burst is 4x)")
+    parser.add_argument("--rate-limit-scale", type=float, default=RATE_LIMIT_SCALE,
+                        help="multiplier for all per-connection limits, e.g. for load tests (0 = off)")
+    parser.add_argument("--authoritative", action="store_true",
+                        help="re-simulate every match server-side and relay only verified attacks/snapshots")
+    parser.add_argument("--match-log", default=None,
+                        help="append match starts and results here as JSONL (query with match_log.py)")
+    parser.add_argument("--match-log-interval", type=float, default=FLUSH_INTERVAL_S,
+                        help="seconds between match log flushes")
+    parser.add_argument("--garbage-policy", choices=GARBAGE_POLICIES, default=GARBAGE_POLICY,
+                        help="where the holes go in garbage rows; sent to both players in every match start")
     args = parser.parse_args()
-    serve(args.host, args.port)
+    serve(
+        args.host,
+        args.port,
+        metrics_host=args.metrics_host,
+        metrics_port=args.metrics_port,
+        metrics_file=args.metrics_file,
+        metrics_interval=args.metrics_interval,
+        resume_grace=args.resume_grace,
+        authoritative=args.authoritative,
+        heartbeat=args.heartbeat,
+        idle_timeout=args.idle_timeout,
+        max_frame_bytes=args.max_frame_bytes,
+        max_bytes_per_s=args.max_bytes_per_s,
+        rate_limit_scale=args.rate_limit_scale,
+        match_log_path=args.match_log,
+        match_log_interval=args.match_log_interval,
+        garbage_policy=args.garbage_policy,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Local save files (progress, highscore). State lives in memory; update() only
+# marks a store dirty, and one writer thread saves it once changes have been
+# quiet for DEBOUNCE_S (or after MAX_DELAY_S of steady changes), so a burst of
+# line clears costs one write. Writes go to a temp file that is fsynced and
+# renamed over the old one, so a crash leaves either the old or the new file.
+DEBOUNCE_S = 1.0
+MAX_DELAY_S = 5.0
+
+
+class JsonStore:
+    """One JSON file, loaded on first access.
+
+    The file carries a "version"; migrations[i] upgrades a version i dict to
+    i + 1, so the current version is len(migrations). Files from before
+    versioning count as version 0.
+    """
+
+    def __init__(self, service, path, defaults, migrations=()):
+        self.service = service
+        self.path = path
+        self.defaults = defaults
+        self.migrations = list(migrations)
+        self.version = len(self.migrations)
+        self.lock = threading.Lock()
+        self.data = None
+        self.dirty_since = None  # monotonic time of the first unsaved change
+        self.changed_at = 0.0  # monotonic time of the latest change
+        self.writes = 0
+        self.failed_writes = 0
+
+    def _load(self):
+        data = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict):
+                data = loaded
+        except (OSError, ValueError):
+            pass
+        version = data.pop("version", 0)
+        if not isinstance(version, int) or version > self.version:
+            version = self.version  # written by a newer build: keep what we understand
+        for migrate in self.migrations[version:]:
+            data = migrate(data)
+        self.data = {**self.defaults, **data}
+
+    def get(self, key, default=None):
+        with self.lock:
+            if self.data is None:
+                self._load()
+            return self.data.get(key, default)
+
+    def update(self, **fields):
+        with self.lock:
+            if self.data is None:
+                self._load()
+            self.data.update(fields)
+            now = time.monotonic()
+            self.changed_at = now
+            if self.dirty_since is None:
+                self.dirty_since = now
+        self.service.notify()
+
+    def due(self, now, debounce_s, max_delay_s):
+        """Seconds until this store should be written; None when clean."""
+        with self.lock:
+            if self.dirty_since is None:
+                return None
+            return max(0.0, min(self.changed_at + debounce_s, self.dirty_since + max_delay_s) - now)
+
+    def write(self):
+        with self.lock:
+            if self.dirty_since is None:
+                return True
+            text = json.dumps({"version": self.version, **self.data})
+            started = self.dirty_since
+            self.dirty_since = None
+        try:
+            write_atomic(self.path, text)
+        except OSError:
+            self.failed_writes += 1
+            with self.lock:
+                # still dirty: retried on the next pass (or the exit flush)
+                if self.dirty_since is None or self.dirty_since > started:
+                    self.dirty_since = started
+            return False
+        self.writes += 1
+        return True
+
+
+def write_atomic(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class Persistence:
+    def __init__(self, debounce_s=DEBOUNCE_S, max_delay_s=MAX_DELAY_S):
+        self.debounce_s = debounce_s
+        self.max_delay_s = max_delay_s
+        self.stores = []
+        self.wake = threading.Condition()
+        self.thread = None
+        self.closed = False
+
+    def store(self, path, defaults, migrations=()):
+        store = JsonStore(self, path, defaults, migrations)
+        self.stores.append(store)
+        return store
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="persistence", daemon=True)
+            self.thread.start()
+            atexit.register(self.close)  # also covers exits that skip close()
+
+    def notify(self):
+        with self.wake:
+            self.wake.notify()
+
+    def run(self):
+        while True:
+            with self.wake:
+                if self.closed:
+                    return
+                now = time.monotonic()
+                waits = [w for w in (s.due(now, self.debounce_s, self.max_delay_s) for s in self.stores) if w is not None]
+                if not waits or min(waits) > 0:
+                    # a change notifies us; the timeout covers the debounce (and write retries)
+                    self.wake.wait(min(waits) if waits else None)
+                    continue
+            for store in self.stores:
+                wait = store.due(time.monotonic(), self.debounce_s, self.max_delay_s)
+                if wait == 0.0 and not store.write():
+                    time.sleep(self.debounce_s)  # disk trouble: don't spin
+
+    def flush(self):
+        """Write every dirty store now, on the calling thread."""
+        for store in self.stores:
+            store.write()
+
+    def close(self):
+        with self.wake:
+            self.closed = True
+            self.wake.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        self.flush()
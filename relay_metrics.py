@@ -0,0 +1,216 @@
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Relay latency (message read -> bytes handed to the opponent's socket), ms
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+# How late a periodic timer wakes up, ms; stands in for thread scheduling lag
+LAG_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.n += 1
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (q in 0..1); None past the last bound."""
+        if not self.n:
+            return 0.0
+        target = q * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else None
+        return None
+
+    def as_dict(self):
+        return {
+            "count": self.n,
+            "sum": round(self.total, 3),
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+            "buckets": dict(zip([str(b) for b in self.bounds] + ["+Inf"], self.counts)),
+        }
+
+
+class RelayMetrics:
+    """Counters and histograms for the relay server, safe to update from any thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.msgs_in = {}
+        self.bytes_in = {}
+        self.msgs_out = {}
+        self.bytes_out = {}
+        self.room_msgs = {}
+        self.latency = Histogram(LATENCY_BUCKETS_MS)
+        self.lag = Histogram(LAG_BUCKETS_MS)
+        self.max_lag_ms = 0.0
+        # filled in by the server so a snapshot can include live gauges
+        self.gauges = lambda: {}
+
+    def record_in(self, mtype, nbytes, room):
+        mtype = str(mtype)
+        with self.lock:
+            self.msgs_in[mtype] = self.msgs_in.get(mtype, 0) + 1
+            self.bytes_in[mtype] = self.bytes_in.get(mtype, 0) + nbytes
+            if room is not None:
+                self.room_msgs[room] = self.room_msgs.get(room, 0) + 1
+
+    def record_out(self, sent, now):
+        """sent: (mtype, nbytes, received_at) for each frame of one socket write."""
+        with self.lock:
+            for mtype, nbytes, received_at in sent:
+                mtype = str(mtype)
+                self.msgs_out[mtype] = self.msgs_out.get(mtype, 0) + 1
+                self.bytes_out[mtype] = self.bytes_out.get(mtype, 0) + nbytes
+                if received_at is not None:
+                    self.latency.observe((now - received_at) * 1000.0)
+
+    def forget_room(self, room):
+        with self.lock:
+            self.room_msgs.pop(room, None)
+
+    def watch_lag(self, interval=0.1):
+        """Run forever on a daemon thread, measuring how late each tick wakes."""
+        expected = time.perf_counter() + interval
+        while True:
+            time.sleep(max(0.0, expected - time.perf_counter()))
+            lag_ms = max(0.0, (time.perf_counter() - expected) * 1000.0)
+            with self.lock:
+                self.lag.observe(lag_ms)
+                self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            expected += interval
+
+    def snapshot(self):
+        gauges = self.gauges()
+        with self.lock:
+            return {
+                "time": round(time.time(), 3),
+                "uptime_s": round(time.time() - self.started, 3),
+                "gauges": gauges,
+                "msgs_in": dict(self.msgs_in),
+                "bytes_in": dict(self.bytes_in),
+                "msgs_out": dict(self.msgs_out),
+                "bytes_out": dict(self.bytes_out),
+                "room_msgs": dict(self.room_msgs),
+                "relay_latency_ms": self.latency.as_dict(),
+                "loop_lag_ms": self.lag.as_dict(),
+                "max_loop_lag_ms": round(self.max_lag_ms, 3),
+            }
+
+    def prometheus(self):
+        snap = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        def histogram(name, help_text, hist):
+            samples = []
+            running = 0
+            for bound, count in hist["buckets"].items():
+                running += count
+                samples.append(({"le": bound}, running))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, value in samples:
+                lines.append(f'{name}_bucket{{le="{labels["le"]}"}} {value}')
+            lines.append(f"{name}_sum {hist['sum']}")
+            lines.append(f"{name}_count {hist['count']}")
+
+        for key, value in snap["gauges"].items():
+            metric(f"stackerz_{key}", "gauge", key.replace("_", " "), [({}, value)])
+        metric("stackerz_messages_in_total", "counter", "messages received by type",
+               [({"type": t}, v) for t, v in sorted(snap["msgs_in"].items())])
+        metric("stackerz_bytes_in_total", "counter", "bytes received by type",
+               [({"type": t}, v) for t, v in sorted(snap["bytes_in"].items())])
+        metric("stackerz_messages_out_total", "counter", "messages written by type",
+               [({"type": t}, v) for t, v in sorted(snap["msgs_out"].items())])
+        metric("stackerz_bytes_out_total", "counter", "bytes written by type",
+               [({"type": t}, v) for t, v in sorted(snap["bytes_out"].items())])
+        metric("stackerz_room_messages_total", "counter", "messages received per room",
+               [({"room": r}, v) for r, v in sorted(snap["room_msgs"].items())])
+        histogram("stackerz_relay_latency_ms", "receive-to-send relay latency", snap["relay_latency_ms"])
+        histogram("stackerz_loop_lag_ms", "timer wake-up lag", snap["loop_lag_ms"])
+        return "\n".join(lines) + "\n"
+
+
+def rates(prev, cur):
+    """Per-second rates between two snapshots, for the JSONL dump."""
+    dt = max(1e-6, cur["uptime_s"] - prev["uptime_s"])
+
+    def per_sec(key):
+        before = prev[key]
+        return {k: round((v - before.get(k, 0)) / dt, 3) for k, v in cur[key].items()}
+
+    return {
+        "msgs_in_per_s": per_sec("msgs_in"),
+        "bytes_in_per_s": per_sec("bytes_in"),
+        "msgs_out_per_s": per_sec("msgs_out"),
+        "bytes_out_per_s": per_sec("bytes_out"),
+        "room_msgs_per_s": per_sec("room_msgs"),
+    }
+
+
+def dump_loop(metrics, path, interval):
+    prev = metrics.snapshot()
+    while True:
+        time.sleep(interval)
+        cur = metrics.snapshot()
+        record = dict(cur)
+        record.update(rates(prev, cur))
+        prev = cur
+        try:
+            with open(path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except Exception:
+            pass
+
+
+def serve_http(metrics, host, port):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = metrics.prometheus().encode("utf-8")
+                ctype = "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body = json.dumps(metrics.snapshot()).encode("utf-8")
+                ctype = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
@@ -0,0 +1,299 @@
+import argparse
+import json
+import sys
+import time
+import zlib
+
+from online_protocol import INPUT_KEYS, ProtocolError, decode_varint, encode_varint
+from tetris_engine import GARBAGE_POLICY, Bag, Board, Piece, board_checksum
+
+# ----------------------------
+# Replays: the game seed plus the player's event stream, re-simulated headlessly.
+# Only locks and garbage change the board (a lock carries the piece's final
+# position), so playback is exact without replaying gravity or frame timing;
+# the movement inputs are kept, with their frames, for viewers.
+# ----------------------------
+REPLAY_MAGIC = b"SSRP"
+REPLAY_VERSION = 1
+REPLAY_FPS = 60  # event times are stored as 1/60 s frames
+CHECKPOINT_EVERY = 50  # pieces between in-memory seek checkpoints
+
+# event tag = varint((frame delta << 3) | code), followed by the code's payload
+EV_LOCK = 5  # one byte x+2 | rotation << 4 | t-spin << 6, then varint y+8
+EV_GARBAGE = 6  # varint rows
+_INPUT_CODES = {k: i for i, k in enumerate(INPUT_KEYS)}  # codes 0-4
+
+
+class ReplayError(ValueError):
+    pass
+
+
+class ReplayRecorder:
+    """Encodes a Game's recorded events as they happen; attach one as game.replay."""
+
+    def __init__(self, seed, mode=""):
+        self.seed = seed
+        self.mode = mode
+        self.stream = bytearray()
+        self.frame = 0
+
+    def add(self, event):
+        frame = max(self.frame, int(event.get("t", 0)) * REPLAY_FPS // 1000)
+        delta = frame - self.frame
+        self.frame = frame
+        mtype = event.get("type")
+        if mtype == "input":
+            code = _INPUT_CODES.get(event.get("k"))
+            if code is None:
+                return
+            payload = b""
+        elif mtype == "lock":
+            x, y, r = int(event["x"]), int(event["y"]), int(event["r"]) % 4
+            if not (-2 <= x <= 13 and y >= -8):
+                return
+            code = EV_LOCK
+            payload = bytes((x + 2 | r << 4 | (1 << 6 if event.get("ts") else 0),)) + encode_varint(y + 8)
+        elif mtype == "garbage":
+            code = EV_GARBAGE
+            payload = encode_varint(int(event["n"]))
+        else:
+            return  # checksums are recomputed on playback
+        self.stream += encode_varint(delta << 3 | code)
+        self.stream += payload
+
+    def finish(self, board, pieces, elapsed_ms) -> bytes:
+        header = bytearray(REPLAY_MAGIC)
+        header.append(REPLAY_VERSION)
+        for value in (
+            self.seed,
+            int(elapsed_ms) * REPLAY_FPS // 1000,
+            pieces,
+            board.lines,
+            board.score,
+            board_checksum(board.grid, board.score, board.lines),
+        ):
+            header += encode_varint(value)
+        for text in (self.mode, board.garbage_policy):
+            raw = text.encode("utf-8")
+            header += encode_varint(len(raw)) + raw
+        return bytes(header) + zlib.compress(bytes(self.stream), 9)
+
+
+def save_replay(path, recorder, game):
+    with open(path, "wb") as f:
+        f.write(recorder.finish(game.board, game.pieces, game.elapsed_ms))
+
+
+class Replay:
+    def __init__(self, seed, frames, pieces, lines, score, crc, mode, garbage_policy, events):
+        self.seed = seed
+        self.frames = frames
+        self.pieces = pieces
+        self.lines = lines
+        self.score = score
+        self.crc = crc
+        self.mode = mode
+        self.garbage_policy = garbage_policy
+        self.events = events  # [(frame, code, payload)]; payload is (x, y, r, ts), rows, or None
+
+    def info(self) -> dict:
+        return {
+            "seed": self.seed,
+            "mode": self.mode,
+            "duration_s": round(self.frames / REPLAY_FPS, 2),
+            "pieces": self.pieces,
+            "lines": self.lines,
+            "score": self.score,
+            "events": len(self.events),
+        }
+
+
+def load_replay(data: bytes) -> Replay:
+    if data[:4] != REPLAY_MAGIC:
+        raise ReplayError("not a replay file")
+    if data[4] != REPLAY_VERSION:
+        raise ReplayError(f"unsupported replay version {data[4]}")
+    try:
+        pos = 5
+        fields = []
+        for _ in range(6):
+            value, pos = decode_varint(data, pos)
+            if value is None:
+                raise ReplayError("truncated header")
+            fields.append(value)
+        texts = []
+        for _ in range(2):
+            n, pos = decode_varint(data, pos)
+            if n is None:
+                raise ReplayError("truncated header")
+            texts.append(data[pos:pos + n].decode("utf-8"))
+            pos += n
+        stream = zlib.decompress(data[pos:])
+    except (ProtocolError, UnicodeDecodeError, zlib.error) as exc:
+        raise ReplayError(f"corrupt replay: {exc}") from exc
+
+    events = []
+    frame = 0
+    pos = 0
+    end = len(stream)
+    while pos < end:
+        tag, pos = decode_varint(stream, pos)
+        if tag is None:
+            raise ReplayError("truncated event stream")
+        frame += tag >> 3
+        code = tag & 7
+        if code == EV_LOCK:
+            if pos >= end:
+                raise ReplayError("truncated lock event")
+            packed = stream[pos]
+            y, pos = decode_varint(stream, pos + 1)
+            if y is None:
+                raise ReplayError("truncated lock event")
+            events.append((frame, code, ((packed & 15) - 2, y - 8, packed >> 4 & 3, bool(packed & 64))))
+        elif code == EV_GARBAGE:
+            rows, pos = decode_varint(stream, pos)
+            if rows is None:
+                raise ReplayError("truncated garbage event")
+            events.append((frame, code, rows))
+        elif code < len(INPUT_KEYS):
+            events.append((frame, code, None))
+        else:
+            raise ReplayError(f"unknown event code {code}")
+    return Replay(*fields, *texts, events)
+
+
+def read_replay(path) -> Replay:
+    with open(path, "rb") as f:
+        return load_replay(f.read())
+
+
+class ReplayPlayer:
+    """Re-simulates a replay on the headless engine; seek() restarts from the nearest checkpoint."""
+
+    def __init__(self, replay: Replay, checkpoint_every=CHECKPOINT_EVERY):
+        self.replay = replay
+        self.checkpoint_every = checkpoint_every
+        self.board = Board(garbage_seed=replay.seed, garbage_policy=replay.garbage_policy or GARBAGE_POLICY)
+        self.bag = Bag(seed=replay.seed)
+        self.kind = self.bag.next_kind()
+        self.next_kind = self.bag.next_kind()
+        self.pieces = 0
+        self.pos = 0  # index of the next event
+        self.frame = 0
+        self.checkpoints = [self._checkpoint()]  # ascending by frame
+
+    def _checkpoint(self):
+        return (self.frame, self.pos, self.pieces, self.kind, self.next_kind, self.board.copy(), self.bag.copy())
+
+    def _restore(self, cp):
+        self.frame, self.pos, self.pieces, self.kind, self.next_kind, board, bag = cp
+        # copy again so the checkpoint survives playing on from it
+        self.board = board.copy()
+        self.bag = bag.copy()
+
+    @property
+    def done(self):
+        return self.pos >= len(self.replay.events)
+
+    def step(self):
+        """Apply the next event."""
+        frame, code, payload = self.replay.events[self.pos]
+        self.pos += 1
+        self.frame = frame
+        if code == EV_LOCK:
+            x, y, r, ts = payload
+            piece = Piece(self.kind)
+            piece.x, piece.y, piece.rotation = x, y, r
+            # applied as the client applied it; rule checks are the relay verifier's job,
+            # a tampered or corrupt stream shows up as a checksum mismatch at the end
+            self.board.lock(piece, t_spin=ts)
+            self.pieces += 1
+            self.kind = self.next_kind
+            self.next_kind = self.bag.next_kind()
+            if self.pieces % self.checkpoint_every == 0 and frame > self.checkpoints[-1][0]:
+                self.checkpoints.append(self._checkpoint())
+        elif code == EV_GARBAGE:
+            self.board.add_garbage(payload)
+
+    def run_to(self, frame):
+        events = self.replay.events
+        while self.pos < len(events) and events[self.pos][0] <= frame:
+            self.step()
+        self.frame = max(self.frame, min(frame, self.replay.frames))
+
+    def seek(self, frame):
+        """Jump to the state after every event at or before frame, forwards or backwards."""
+        if frame < self.frame:
+            i = 0
+            for j, cp in enumerate(self.checkpoints):
+                if cp[0] > frame:
+                    break
+                i = j
+            self._restore(self.checkpoints[i])
+        self.run_to(frame)
+
+    def play(self, speed=100.0):
+        """Run to the end, paced at speed x real time (0 = as fast as possible)."""
+        started = time.perf_counter()
+        events = self.replay.events
+        while self.pos < len(events):
+            if speed > 0:
+                due = started + events[self.pos][0] / REPLAY_FPS / speed
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            self.step()
+        return self
+
+    def mismatches(self) -> list[str]:
+        """Differences between the simulated end state and the totals the recorder saved."""
+        replay = self.replay
+        board = self.board
+        found = []
+        for name, got, want in (
+            ("pieces", self.pieces, replay.pieces),
+            ("lines", board.lines, replay.lines),
+            ("score", board.score, replay.score),
+            ("checksum", board_checksum(board.grid, board.score, board.lines), replay.crc),
+        ):
+            if got != want:
+                found.append(f"{name}: simulated {got}, recorded {want}")
+        return found
+
+
+def verify_replay(replay: Replay, speed=100.0) -> list[str]:
+    return ReplayPlayer(replay).play(speed).mismatches()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and verify Sam Stackerz replays")
+    parser.add_argument("command", choices=("info", "verify"))
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--speed", type=float, default=100.0, help="playback speed for verify (0 = unpaced)")
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.paths:
+        try:
+            replay = read_replay(path)
+        except (OSError, ReplayError) as exc:
+            print(f"{path}: {exc}")
+            failed += 1
+            continue
+        if args.command == "info":
+            print(json.dumps({"path": path, **replay.info()}))
+            continue
+        started = time.perf_counter()
+        problems = verify_replay(replay, args.speed)
+        elapsed = time.perf_counter() - started
+        status = "OK" if not problems else "MISMATCH"
+        print(f"{path}: {status} score={replay.score} lines={replay.lines} pieces={replay.pieces} "
+              f"({replay.frames / REPLAY_FPS:.1f}s game in {elapsed:.2f}s)")
+        for problem in problems:
+            print(f"  {problem}")
+        failed += bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
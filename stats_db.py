@@ -0,0 +1,276 @@
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+from collections import deque
+
+# Local per-game history in SQLite. The game thread only appends a dict to an
+# in-memory queue; one writer thread owns the write connection and inserts the
+# queued games in a single transaction per flush. Per-mode totals are kept in
+# a summary table updated in that same transaction, so the stats screen reads
+# a handful of rows however many games are stored; leaderboards and sprint
+# times are index range scans.
+FLUSH_INTERVAL_S = 2.0
+SCHEMA_VERSION = 1
+
+GAME_FIELDS = (
+    "played_at", "mode", "seed", "result", "duration_ms", "score", "lines", "pieces",
+    "pps", "apm", "attack", "t_spins", "max_combo", "perfect_clears",
+)
+RESULT_WIN = "win"
+RESULT_LOSS = "loss"
+RESULT_TIE = "tie"
+RESULT_CLEAR = "clear"  # sprint finished
+RESULT_TOPOUT = "topout"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    played_at REAL NOT NULL,
+    mode TEXT NOT NULL,
+    seed INTEGER,
+    result TEXT NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    pieces INTEGER NOT NULL,
+    pps REAL NOT NULL,
+    apm REAL NOT NULL,
+    attack INTEGER NOT NULL,
+    t_spins INTEGER NOT NULL,
+    max_combo INTEGER NOT NULL,
+    perfect_clears INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_mode_score ON games (mode, score DESC);
+CREATE INDEX IF NOT EXISTS games_mode_result_time ON games (mode, result, duration_ms);
+CREATE INDEX IF NOT EXISTS games_played_at ON games (played_at);
+CREATE TABLE IF NOT EXISTS mode_totals (
+    mode TEXT PRIMARY KEY,
+    games INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    pieces INTEGER NOT NULL,
+    attack INTEGER NOT NULL,
+    t_spins INTEGER NOT NULL,
+    perfect_clears INTEGER NOT NULL,
+    best_score INTEGER NOT NULL,
+    max_combo INTEGER NOT NULL
+);
+"""
+
+UPSERT_TOTALS = """
+INSERT INTO mode_totals VALUES (:mode, 1, :won, :duration_ms, :score, :lines, :pieces, :attack,
+                                :t_spins, :perfect_clears, :score, :max_combo)
+ON CONFLICT (mode) DO UPDATE SET
+    games = games + 1,
+    wins = wins + excluded.wins,
+    duration_ms = duration_ms + excluded.duration_ms,
+    score = score + excluded.score,
+    lines = lines + excluded.lines,
+    pieces = pieces + excluded.pieces,
+    attack = attack + excluded.attack,
+    t_spins = t_spins + excluded.t_spins,
+    perfect_clears = perfect_clears + excluded.perfect_clears,
+    best_score = max(best_score, excluded.best_score),
+    max_combo = max(max_combo, excluded.max_combo)
+"""
+
+
+def connect(path):
+    # shared across threads only under StatsDB.write_lock
+    conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")  # the stats screen reads while the writer commits
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def connect_readonly(path):
+    """A query connection that never writes (or creates) the database; None if it doesn't exist yet."""
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro", uri=True,
+                           timeout=5.0, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_schema(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise sqlite3.DatabaseError(f"stats database is schema v{version}, this build knows v{SCHEMA_VERSION}")
+    conn.executescript(SCHEMA)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+
+def game_record(mode, seed, result, duration_ms, score, lines, pieces, attack, t_spins, max_combo, perfect_clears):
+    """A games row; PPS and APM are derived from the game clock."""
+    minutes = max(duration_ms, 1) / 60000.0
+    return {
+        "played_at": round(time.time(), 3),
+        "mode": mode,
+        "seed": seed,
+        "result": result,
+        "duration_ms": int(duration_ms),
+        "score": int(score),
+        "lines": int(lines),
+        "pieces": int(pieces),
+        "pps": round(pieces / (minutes * 60.0), 3),
+        "apm": round(attack / minutes, 2),
+        "attack": int(attack),
+        "t_spins": int(t_spins),
+        "max_combo": int(max_combo),
+        "perfect_clears": int(perfect_clears),
+    }
+
+
+class StatsDB:
+    def __init__(self, path, interval=FLUSH_INTERVAL_S):
+        self.path = path
+        self.interval = interval
+        self.pending = deque()  # append/popleft are atomic, so record() needs no lock
+        self.wake = threading.Event()
+        self.stop = threading.Event()
+        self.write_lock = threading.Lock()  # the writer thread and the exit flush share one connection
+        self.writer = None
+        self.reader = None
+        self.thread = None
+        self.written = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="stats-db", daemon=True)
+            self.thread.start()
+
+    def record(self, game: dict):
+        self.pending.append(game)
+        self.wake.set()
+
+    def run(self):
+        while not self.stop.is_set():
+            self.wake.wait()
+            # let a burst of records settle first; close() cuts the wait short
+            self.stop.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        batch = []
+        pending = self.pending
+        while pending:
+            batch.append(pending.popleft())
+        if not batch:
+            return
+        with self.write_lock:
+            try:
+                if self.writer is None:
+                    self.writer = connect(self.path)
+                    init_schema(self.writer)
+                with self.writer:
+                    self.writer.executemany(
+                        f"INSERT INTO games ({', '.join(GAME_FIELDS)}) VALUES ({', '.join(':' + f for f in GAME_FIELDS)})",
+                        batch,
+                    )
+                    self.writer.executemany(
+                        UPSERT_TOTALS, [{**g, "won": int(g["result"] in (RESULT_WIN, RESULT_CLEAR))} for g in batch],
+                    )
+            except sqlite3.Error:
+                # keep the games for the next flush rather than losing them
+                self.failed_flushes += 1
+                pending.extendleft(reversed(batch))
+                return
+        self.written += len(batch)
+
+    def close(self):
+        self.stop.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5.0)
+        self.flush()
+        for conn in (self.writer, self.reader):
+            if conn is not None:
+                conn.close()
+        self.writer = self.reader = None
+
+    # ---- queries (game thread) ----
+    def _read(self, sql, args=()):
+        # read-only: the writer thread alone creates the file and schema
+        try:
+            if self.reader is None:
+                self.reader = connect_readonly(self.path)
+                if self.reader is None:
+                    return []
+            return [dict(row) for row in self.reader.execute(sql, args)]
+        except sqlite3.Error:
+            return []
+
+    def totals(self):
+        """Per-mode totals and averages, from the summary table."""
+        rows = self._read("SELECT * FROM mode_totals ORDER BY games DESC")
+        for r in rows:
+            minutes = max(r["duration_ms"], 1) / 60000.0
+            r["avg_score"] = r["score"] / r["games"]
+            r["pps"] = r["pieces"] / (minutes * 60.0)
+            r["apm"] = r["attack"] / minutes
+        return rows
+
+    def leaderboard(self, mode, limit=10):
+        return self._read(
+            "SELECT score, lines, pieces, pps, duration_ms, played_at FROM games "
+            "WHERE mode = ? ORDER BY score DESC LIMIT ?",
+            (mode, limit),
+        )
+
+    def sprint_best(self, mode="sprint", limit=10):
+        return self._read(
+            "SELECT duration_ms, score, pieces, pps, played_at FROM games "
+            "WHERE mode = ? AND result = ? ORDER BY duration_ms LIMIT ?",
+            (mode, RESULT_CLEAR, limit),
+        )
+
+    def recent(self, limit=20):
+        return self._read("SELECT * FROM games ORDER BY played_at DESC LIMIT ?", (limit,))
+
+
+# ----------------------------
+# Query CLI
+# ----------------------------
+def format_ms(ms):
+    return f"{int(ms) // 60000:02d}:{int(ms) // 1000 % 60:02d}.{int(ms) % 1000 // 10:02d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print local Sam Stackerz game statistics")
+    parser.add_argument("path", nargs="?", default="stats.db")
+    parser.add_argument("--mode", default=None, help="also print this mode's top scores")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    db = StatsDB(args.path)
+    totals = db.totals()
+    if not totals:
+        print("no games recorded")
+        sys.exit(0)
+    print(f"{'mode':<10} {'games':>6} {'wins':>5} {'best':>9} {'avg':>9} {'lines':>7} {'pps':>5} {'apm':>6} {'hours':>6}")
+    for r in totals:
+        print(f"{r['mode']:<10} {r['games']:>6} {r['wins']:>5} {r['best_score']:>9} {r['avg_score']:>9.0f} "
+              f"{r['lines']:>7} {r['pps']:>5.2f} {r['apm']:>6.1f} {r['duration_ms'] / 3_600_000:>6.1f}")
+    best = db.sprint_best(limit=args.top)
+    if best:
+        print("\nsprint: " + ", ".join(format_ms(r["duration_ms"]) for r in best))
+    if args.mode:
+        print(f"\ntop {args.mode}:")
+        for i, r in enumerate(db.leaderboard(args.mode, args.top), 1):
+            print(f"{i:>3}. {r['score']:>9}  {r['lines']:>4} lines  {r['pps']:.2f} pps  {format_ms(r['duration_ms'])}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
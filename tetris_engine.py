@@ -0,0 +1,320 @@
+import random
+import zlib
+
+# ----------------------------
+# Headless game engine: pieces, bag and board rules.
+# No pygame here, so the relay server and tools can simulate games.
+# ----------------------------
+COLS = 10
+ROWS = 20
+
+# Garbage hole policies: where the open column goes in incoming garbage rows
+GARBAGE_MESSY = "messy"    # new random hole every row
+GARBAGE_ATTACK = "attack"  # one hole column per attack
+GARBAGE_CLEAN = "clean"    # one hole column for the whole game
+GARBAGE_POLICIES = (GARBAGE_MESSY, GARBAGE_ATTACK, GARBAGE_CLEAN)
+GARBAGE_POLICY = GARBAGE_MESSY
+GARBAGE_SEED_SALT = 0x5EED6A2B  # keeps the garbage stream independent of the piece bag
+
+# ----------------------------
+# Tetrominoes
+# ----------------------------
+TETROMINOES = {
+    "I": [[
+        "....",
+        "1111",
+        "....",
+        "...."
+    ]],
+    "O": [[
+        ".22.",
+        ".22.",
+        "....",
+        "...."
+    ]],
+    "T": [[
+        ".333",
+        "..3.",
+        "....",
+        "...."
+    ]],
+    "S": [[
+        "..44",
+        ".44.",
+        "....",
+        "...."
+    ]],
+    "Z": [[
+        ".55.",
+        "..55",
+        "....",
+        "...."
+    ]],
+    "J": [[
+        ".6..",
+        ".666",
+        "....",
+        "...."
+    ]],
+    "L": [[
+        "...7",
+        ".777",
+        "....",
+        "...."
+    ]]
+}
+
+def rotate(shape):
+    """Rotate a 4x4 shape 90 degrees clockwise."""
+    return ["".join(row[col] for row in shape[::-1]) for col in range(4)]
+
+
+_ROTATIONS = {}
+
+
+def piece_rotations(kind):
+    """The four rotation states of a kind, computed once and shared by every Piece."""
+    rotations = _ROTATIONS.get(kind)
+    if rotations is None:
+        rotations = [TETROMINOES[kind][0]]
+        for _ in range(3):
+            rotations.append(rotate(rotations[-1]))
+        rotations = _ROTATIONS[kind] = tuple(rotations)
+    return rotations
+
+
+def _copy_rng(rng):
+    copy = random.Random()
+    copy.setstate(rng.getstate())
+    return copy
+
+
+class Bag:
+    __slots__ = ("pool", "rng")
+
+    def __init__(self, seed=None):
+        self.pool = []
+        self.rng = random.Random(seed)
+
+    def next_kind(self):
+        if not self.pool:
+            self.pool = list(TETROMINOES.keys())
+            self.rng.shuffle(self.pool)
+        return self.pool.pop()
+
+    def copy(self):
+        bag = Bag.__new__(Bag)
+        bag.pool = self.pool[:]
+        bag.rng = _copy_rng(self.rng)
+        return bag
+
+
+class Piece:
+    """Kind, rotation and cell position only; animation state lives with the renderer."""
+
+    __slots__ = ("kind", "rotation", "rotations", "x", "y")
+
+    def __init__(self, kind=None):
+        if kind is None:
+            kind = random.choice(list(TETROMINOES.keys()))
+        self.kind = kind
+        self.rotation = 0
+        self.rotations = piece_rotations(kind)
+        self.x = COLS // 2 - 2
+        self.y = 0
+
+    def copy(self):
+        piece = Piece.__new__(Piece)
+        piece.kind = self.kind
+        piece.rotation = self.rotation
+        piece.rotations = self.rotations
+        piece.x = self.x
+        piece.y = self.y
+        return piece
+
+    def shape(self, rot=None):
+        r = self.rotation if rot is None else rot
+        return self.rotations[r % 4]
+
+    def cells(self, rot=None, x=None, y=None):
+        s = self.shape(rot)
+        ox = self.x if x is None else x
+        oy = self.y if y is None else y
+        for r in range(4):
+            for c in range(4):
+                v = s[r][c]
+                if v != ".":
+                    yield (ox + c, oy + r, v)
+
+class Board:
+    __slots__ = (
+        "grid", "garbage_rng", "garbage_policy", "garbage_hole",
+        "score", "level", "lines", "combo", "back_to_back", "row_fill", "filled",
+    )
+
+    def __init__(self, garbage_seed=None, garbage_policy=GARBAGE_POLICY):
+        self.grid = [["." for _ in range(COLS)] for _ in range(ROWS)]
+        # per-game stream so the same seed always produces the same garbage holes
+        self.garbage_rng = random.Random(None if garbage_seed is None else garbage_seed ^ GARBAGE_SEED_SALT)
+        self.garbage_policy = garbage_policy
+        self.garbage_hole = None
+        self.score = 0
+        self.level = 1
+        self.lines = 0
+        self.combo = -1
+        self.back_to_back = False
+        # occupied cells per row and in total, so a lock tests only the rows it
+        # touched and a perfect clear is a counter check
+        self.row_fill = [0] * ROWS
+        self.filled = 0
+
+    def set_grid(self, grid):
+        """Replace the grid wholesale (e.g. from a snapshot) and recount the fill."""
+        self.grid = grid
+        self.row_fill = [COLS - row.count(".") for row in grid]
+        self.filled = sum(self.row_fill)
+
+    def copy(self):
+        """Independent copy for search and checkpoints: 20 row slices plus scalars."""
+        board = Board.__new__(Board)
+        board.grid = [row[:] for row in self.grid]
+        board.garbage_rng = _copy_rng(self.garbage_rng)
+        board.garbage_policy = self.garbage_policy
+        board.garbage_hole = self.garbage_hole
+        board.score = self.score
+        board.level = self.level
+        board.lines = self.lines
+        board.combo = self.combo
+        board.back_to_back = self.back_to_back
+        board.row_fill = self.row_fill[:]
+        board.filled = self.filled
+        return board
+
+    def collision(self, piece, dx=0, dy=0, rotation=None):
+        rot = piece.rotation if rotation is None else rotation
+        s = piece.shape(rot)
+        for r in range(4):
+            for c in range(4):
+                v = s[r][c]
+                if v == ".":
+                    continue
+                nx = piece.x + c + dx
+                ny = piece.y + r + dy
+                if nx < 0 or nx >= COLS or ny >= ROWS:
+                    return True
+                if ny >= 0 and self.grid[ny][nx] != ".":
+                    return True
+        return False
+
+    def lock(self, piece, t_spin=False):
+        grid = self.grid
+        row_fill = self.row_fill
+        touched = set()
+        for x, y, v in piece.cells():
+            if 0 <= y < ROWS and 0 <= x < COLS:
+                if grid[y][x] == ".":
+                    row_fill[y] += 1
+                    self.filled += 1
+                grid[y][x] = v
+                touched.add(y)
+
+        cleared_rows = self.clear_lines(touched)
+        cleared = len(cleared_rows)
+        self.lines += cleared
+
+        if cleared > 0:
+            self.combo += 1
+        else:
+            self.combo = -1
+
+        if t_spin:
+            base_points = [0, 800, 1200, 1600][cleared]
+            attack = [0, 2, 4, 6][cleared]
+        else:
+            base_points = [0, 100, 300, 500, 800][cleared]
+            attack = [0, 0, 1, 2, 4][cleared]
+
+        b2b_eligible = t_spin and cleared > 0 or cleared == 4
+        if b2b_eligible:
+            if self.back_to_back:
+                base_points = int(base_points * 1.5)
+                attack += 1
+            self.back_to_back = True
+        elif cleared > 0:
+            self.back_to_back = False
+
+        combo_bonus = max(0, self.combo) * 50
+        attack += max(0, self.combo - 1)
+
+        perfect_clear = cleared > 0 and self.filled == 0
+        if perfect_clear:
+            base_points += 2000
+            attack += 6
+
+        self.level = 1 + self.lines // 10
+        self.score += (base_points + combo_bonus) * self.level
+        return cleared_rows, attack, perfect_clear
+
+    def clear_lines(self, rows=None):
+        """Remove full rows among rows (default: all) and return their indexes, top to bottom."""
+        row_fill = self.row_fill
+        cleared_rows = [r for r in (range(ROWS) if rows is None else sorted(rows)) if row_fill[r] == COLS]
+        if not cleared_rows:
+            return []
+
+        self.grid = compact_rows(self.grid, cleared_rows)
+        self.row_fill = [0] * len(cleared_rows) + [n for i, n in enumerate(row_fill) if i not in cleared_rows]
+        self.filled -= COLS * len(cleared_rows)
+        return cleared_rows
+
+    def garbage_holes(self, n):
+        """Draw the hole columns for one attack of n rows from the seeded stream."""
+        if self.garbage_policy == GARBAGE_MESSY:
+            return [self.garbage_rng.randrange(COLS) for _ in range(n)]
+        if self.garbage_hole is None or self.garbage_policy == GARBAGE_ATTACK:
+            self.garbage_hole = self.garbage_rng.randrange(COLS)
+        return [self.garbage_hole] * n
+
+    def add_garbage(self, n):
+        """Add n garbage lines at bottom, push board up. One hole each row."""
+        if n <= 0:
+            return
+        n = min(n, ROWS)
+        rows = []
+        for hole in self.garbage_holes(n):
+            garbage = ["8" for _ in range(COLS)]
+            garbage[hole] = "."
+            rows.append(garbage)
+        # push up in one step: drop the top n rows, append the garbage block
+        self.grid = self.grid[n:] + rows
+        self.filled += (COLS - 1) * n - sum(self.row_fill[:n])
+        self.row_fill = self.row_fill[n:] + [COLS - 1] * n
+
+
+def full_rows(grid, rows):
+    """Which of rows are completely filled, top to bottom; only these can clear after a lock."""
+    return [r for r in sorted(rows) if "." not in grid[r]]
+
+
+def compact_rows(grid, cleared_rows):
+    """grid without cleared_rows (a few indexes) and with as many empty rows on top, in one pass."""
+    kept = [row for i, row in enumerate(grid) if i not in cleared_rows]
+    return [["."] * COLS for _ in cleared_rows] + kept
+
+
+def board_checksum(grid, score, lines):
+    """CRC32 of the locked cells plus score and lines; what lockstep peers compare."""
+    state = "".join("".join(row) for row in grid)
+    state += f"|{score}|{lines}"
+    return zlib.crc32(state.encode("ascii"))
+
+
+def t_spin_corners(grid, piece):
+    """How many of the four cells diagonal to a T piece's centre are walls or blocks."""
+    cx = piece.x + 2
+    cy = piece.y + 1
+    blocked = 0
+    for x, y in ((cx - 1, cy - 1), (cx + 1, cy - 1), (cx - 1, cy + 1), (cx + 1, cy + 1)):
+        if x < 0 or x >= COLS or y < 0 or y >= ROWS or grid[y][x] != ".":
+            blocked += 1
+    return blocked
@@ -1,21 +1,42 @@
+import time
+
+STARTUP_T0 = time.perf_counter()  # taken before pygame's own import, which players wait through too
+
 import pygame
 import random
 import sys
 import math
-import json
 import os
+import select
 import socket
-from copy import deepcopy
+import threading
+from collections import deque
+
+from frame_profiler import FrameProfiler
+from lazy_assets import LazyAsset, LazyFont, StartupTimer, load_font, load_sound, loaded_fraction, start_loader
+from online_protocol import RESUMABLE_TYPES, WIRE_BINARY, WIRE_JSON, ProtocolError, encode_message, read_message
+from persistence import Persistence
+from replay import ReplayRecorder, save_replay
+from stats_db import RESULT_CLEAR, RESULT_LOSS, RESULT_TIE, RESULT_TOPOUT, RESULT_WIN, StatsDB, format_ms, game_record
+from tetris_engine import (COLS, GARBAGE_POLICIES, GARBAGE_POLICY, ROWS, Bag, Board, Piece, board_checksum, compact_rows,
+                           full_rows, t_spin_corners)
 
 # ----------------------------
 # Configuration
 # ----------------------------
 CELL = 30
-COLS = 10
-ROWS = 20
 BOARD_W = CELL * COLS
 BOARD_H = CELL * ROWS
 FPS = 60
+# Game logic runs in fixed ticks, decoupled from the render frame rate
+LOGIC_HZ = 240
+LOGIC_DT_MS = 1000.0 / LOGIC_HZ
+MAX_FRAME_MS = 250  # a longer stall is dropped instead of being caught up in one burst
+TICK_STATS = os.environ.get("TETRIS_TICK_STATS") == "1"  # print logic tick cost every few seconds
+PROFILE = os.environ.get("TETRIS_PROFILE") == "1"  # frame profiler overlay from the start; F3 toggles it
+PROFILE_TRACE = os.environ.get("TETRIS_PROFILE_TRACE", "frame_trace.json")  # Chrome trace written on exit
+STARTUP_TIMING = os.environ.get("TETRIS_STARTUP_TIMING", "")  # "1": print startup milestones; "exit": then quit
+SNAPSHOT_INTERVAL_MS = 150
 
 PADDING = 30
 SIDE_W = 220
@@ -23,26 +44,19 @@ SIDE_W = 220
 WINDOW_W = BOARD_W * 2 + PADDING * 3 + SIDE_W
 WINDOW_H = BOARD_H
 
-pygame.init()
-screen = pygame.display.set_mode((WINDOW_W, WINDOW_H))
-pygame.display.set_caption("Sam Stackerz VS AI")
+screen = None  # the window; open_window() creates it when main() starts
 clock = pygame.time.Clock()
-font = pygame.font.SysFont("Consolas", 20)
-big_font = pygame.font.SysFont("Consolas", 34)
-
-# Mixer (safe init)
-try:
-    pygame.mixer.init()
-except Exception:
-    pass
+profiler = FrameProfiler(enabled=PROFILE, trace_path=PROFILE_TRACE)
 
 # ----------------------------
 # Game states
 # ----------------------------
+STATE_LOADING = "loading"
 STATE_START = "start"
 STATE_PLAYING = "playing"
 STATE_PAUSED = "paused"
 STATE_GAMEOVER = "gameover"
+STATE_STATS = "stats"
 
 MODE_CLASSIC = "classic"
 MODE_VS_AI = "vs_ai"
@@ -52,7 +66,27 @@ MODE_SPRINT = "sprint"
 
 ONLINE_HOST = os.environ.get("TETRIS_ONLINE_HOST", "127.0.0.1")
 ONLINE_PORT = int(os.environ.get("TETRIS_ONLINE_PORT", "8765"))
-ONLINE_ROOM = os.environ.get("TETRIS_ONLINE_ROOM", "default")
+ONLINE_ROOM = os.environ.get("TETRIS_ONLINE_ROOM", "default")  # "*" = matchmaking queue
+ONLINE_RATING = int(os.environ.get("TETRIS_ONLINE_RATING", "1000"))
+MATCHMAKING_ROOM = "*"
+ONLINE_WIRE = os.environ.get("TETRIS_ONLINE_WIRE", WIRE_JSON)
+ONLINE_NETCODE = os.environ.get("TETRIS_ONLINE_NETCODE", "snapshot")  # or "lockstep"
+# garbage hole policy for local games; online matches use the one in the server's start message
+LOCAL_GARBAGE_POLICY = os.environ.get("TETRIS_GARBAGE_POLICY", GARBAGE_POLICY)
+if LOCAL_GARBAGE_POLICY not in GARBAGE_POLICIES:
+    LOCAL_GARBAGE_POLICY = GARBAGE_POLICY
+
+NETCODE_SNAPSHOT = "snapshot"
+NETCODE_LOCKSTEP = "lockstep"
+LOCKSTEP_CHECKSUM_EVERY = 10  # pieces between desync checks
+
+PING_INTERVAL_MS = 1000
+CLOCK_EWMA_ALPHA = 0.125  # weight of each new RTT / clock-offset sample
+GARBAGE_DELAY_MS = 150  # attacks land this long after the sender stamped them
+RECONNECT_BASE_MS = 250  # doubles per failed attempt
+RECONNECT_MAX_MS = 4000
+RECONNECT_ATTEMPTS = 8
+RESUME_RING_SIZE = 256  # sent gameplay messages kept for replay after a resume
 
 AI_DIFFICULTIES = ["Easy", "Normal", "Hard"]
 AI_DIFFICULTY_SETTINGS = {
@@ -62,26 +96,21 @@ AI_DIFFICULTY_SETTINGS = {
 }
 
 # ----------------------------
-# Assets (optional sounds)
+# Assets (fonts + optional sounds), loaded in the background by lazy_assets
 # ----------------------------
-def load_sound(name):
-    try:
-        if pygame.mixer.get_init() is None:
-            return None
-        if not os.path.exists(name):
-            return None
-        return pygame.mixer.Sound(name)
-    except Exception:
-        return None
+font = LazyFont(load_font, "Consolas", 20)
+big_font = LazyFont(load_font, "Consolas", 34)
+SND_MOVE = LazyAsset(load_sound, "move.wav")
+SND_ROTATE = LazyAsset(load_sound, "rotate.wav")
+SND_LOCK = LazyAsset(load_sound, "lock.wav")
+SND_CLEAR = LazyAsset(load_sound, "clear.wav")
+SND_DROP = LazyAsset(load_sound, "drop.wav")
+SND_GAMEOVER = LazyAsset(load_sound, "gameover.wav")
+ASSETS = [font, big_font, SND_MOVE, SND_ROTATE, SND_LOCK, SND_CLEAR, SND_DROP, SND_GAMEOVER]
 
-SND_MOVE = load_sound("move.wav")
-SND_ROTATE = load_sound("rotate.wav")
-SND_LOCK = load_sound("lock.wav")
-SND_CLEAR = load_sound("clear.wav")
-SND_DROP = load_sound("drop.wav")
-SND_GAMEOVER = load_sound("gameover.wav")
 
 def play(snd):
+    snd = snd.get()
     if snd is not None:
         try:
             snd.play()
@@ -90,119 +119,305 @@ def play(snd):
 
 
 class OnlineClient:
-    def __init__(self, host, port, room, name):
+    """Relay connection driven by its own I/O thread.
+
+    The game loop only touches two deques: send() appends to the outbox and
+    poll() drains the inbox, so socket stalls and reconnects never block a
+    frame. The thread also answers pings itself, which keeps RTT samples free
+    of frame-rate quantisation.
+    """
+
+    def __init__(self, host, port, room, name, wire=WIRE_JSON, netcode=NETCODE_SNAPSHOT, rating=1000):
         self.host = host
         self.port = int(port)
         self.room = room
         self.name = name
+        self.rating = rating
+        self.requested_wire = wire
+        self.netcode = netcode
+        self.wire = WIRE_JSON  # switches once the server acknowledges the join
         self.sock = None
         self.recv_buffer = b""
         self.connected = False
+        # NTP-style estimates against the opponent's clock, via relayed ping/pong
+        self.in_match = False
+        self.rtt_ms = None
+        self.jitter_ms = 0.0
+        self.offset_ms = None  # opponent clock minus ours
+        self.next_ping_ms = 0
+        # game loop <-> I/O thread; deque append/popleft need no lock
+        self.inbox = deque()
+        self.outbox = deque()
+        self.closed = False
+        self.thread = None
+        # session resumption: the server's token, the last relay seq we saw, and
+        # our own numbered history of resumable messages for the server to catch up on
+        self.token = None
+        self.resumable = False
+        self.last_seq = 0
+        self.sent_count = 0
+        self.sent_ring = deque(maxlen=RESUME_RING_SIZE)
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+    @staticmethod
+    def clock_ms():
+        return int(time.monotonic() * 1000)
+
+    def to_local_ms(self, remote_ms):
+        """Map a timestamp from the opponent's clock onto ours."""
+        if self.offset_ms is None:
+            return self.clock_ms()
+        return remote_ms - self.offset_ms
+
+    def _on_pong(self, msg, t3):
+        try:
+            t0, t1, t2 = int(msg["t0"]), int(msg["t1"]), int(msg["t2"])
+        except (KeyError, TypeError, ValueError):
+            return
+        rtt = max(0, (t3 - t0) - (t2 - t1))
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        if self.rtt_ms is None:
+            self.rtt_ms = float(rtt)
+            self.offset_ms = offset
+            return
+        a = CLOCK_EWMA_ALPHA
+        self.jitter_ms += a * (abs(rtt - self.rtt_ms) - self.jitter_ms)
+        self.rtt_ms += a * (rtt - self.rtt_ms)
+        self.offset_ms += a * (offset - self.offset_ms)
+
+    def join_message(self):
+        join = {"type": "join", "room": self.room, "name": self.name}
+        if self.requested_wire != WIRE_JSON:
+            join["wire"] = self.requested_wire
+        if self.netcode != NETCODE_SNAPSHOT:
+            join["netcode"] = self.netcode
+        if self.room == MATCHMAKING_ROOM:
+            join["rating"] = int(self.rating)
+        if self.token and self.resumable:
+            join["resume"] = self.token
+            join["last_seq"] = self.last_seq
+        return join
 
     def connect(self):
-        self.sock = socket.create_connection((self.host, self.port), timeout=3)
-        self.sock.setblocking(False)
-        self.connected = True
-        self.send({"type": "join", "room": self.room, "name": self.name})
+        """Start the I/O thread; connection progress arrives through poll()."""
+        self.thread = threading.Thread(target=self._run, name="online-io", daemon=True)
+        self.thread.start()
 
     def close(self):
+        self.outbox.append({"type": "leave"})  # tells the server not to hold our slot
+        self.closed = True
         self.connected = False
-        if self.sock is not None:
-            try:
-                self.sock.close()
-            except Exception:
-                pass
-            self.sock = None
+        self.in_match = False
+        self._wake()
 
     def send(self, payload):
-        if not self.connected or self.sock is None:
-            return False
-        try:
-            data = (json.dumps(payload) + "\n").encode("utf-8")
-            self.sock.sendall(data)
-            return True
-        except Exception:
-            self.close()
+        if self.closed:
             return False
+        self.outbox.append(payload)
+        self._wake()
+        return True
 
     def poll(self):
         messages = []
-        if not self.connected or self.sock is None:
-            return messages
+        inbox = self.inbox
+        while inbox:
+            messages.append(inbox.popleft())
+        return messages
 
-        while True:
+    # ---- I/O thread ----
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass  # buffer full means a wake-up is already pending
+
+    def _wait(self, seconds):
+        """Sleep, but return early if close() is called."""
+        select.select([self._wake_r], [], [], seconds)
+        self._drain_wake()
+
+    def _drain_wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def _run(self):
+        attempt = 0
+        while not self.closed:
             try:
-                chunk = self.sock.recv(4096)
-                if not chunk:
-                    self.close()
+                sock = socket.create_connection((self.host, self.port), timeout=3)
+            except OSError:
+                sock = None
+            if sock is not None:
+                joined = self._session(sock)
+                if self.closed:
                     break
-                self.recv_buffer += chunk
-            except BlockingIOError:
+                if joined:
+                    attempt = 0
+            attempt += 1
+            if attempt > RECONNECT_ATTEMPTS:
+                self.inbox.append({"type": "error", "message": "Could not reach online server"})
                 break
-            except Exception:
-                self.close()
+            delay_ms = min(RECONNECT_MAX_MS, RECONNECT_BASE_MS * 2 ** (attempt - 1))
+            self.inbox.append({"type": "reconnecting", "attempt": attempt, "delay_ms": delay_ms})
+            self._wait(delay_ms / 1000)
+        self.closed = True
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def _session(self, sock):
+        """Pump one connection until it drops. Returns True if the server accepted the join."""
+        sock.setblocking(False)
+        self.sock = sock
+        self.wire = WIRE_JSON
+        self.recv_buffer = b""
+        self.in_match = False
+        self.connected = True
+        if not (self.token and self.resumable):
+            self.outbox.clear()  # anything queued while offline belonged to the old match
+        pending = bytearray(encode_message(self.join_message(), self.wire))
+        joined = False
+        try:
+            while not self.closed:
+                if joined:
+                    # hold the outbox until the join is acknowledged: the wire format may
+                    # change, and a resume replays older messages first
+                    self._drain_outbox(pending)
+                timeout = None
+                if self.in_match:
+                    timeout = max(0.0, (self.next_ping_ms - self.clock_ms()) / 1000)
+                readable, writable, _ = select.select(
+                    [sock, self._wake_r], [sock] if pending else [], [], timeout
+                )
+                if self._wake_r in readable:
+                    self._drain_wake()
+                if writable:
+                    try:
+                        del pending[:sock.send(pending)]
+                    except BlockingIOError:
+                        pass
+                if sock in readable:
+                    try:
+                        chunk = sock.recv(65536)
+                    except BlockingIOError:
+                        chunk = None
+                    if chunk == b"":
+                        break
+                    if chunk:
+                        self.recv_buffer += chunk
+                        joined = self._dispatch(pending) or joined
+                now = self.clock_ms()
+                if self.in_match and now >= self.next_ping_ms:
+                    self.next_ping_ms = now + PING_INTERVAL_MS
+                    pending += encode_message({"type": "ping", "t0": now}, self.wire)
+            if self.closed:
+                # best effort: flush the final "leave" and anything queued with it
+                self._drain_outbox(pending)
+                sock.settimeout(0.2)
+                sock.sendall(pending)
+        except (OSError, ProtocolError):
+            pass
+        finally:
+            self.connected = False
+            self.in_match = False
+            self.sock = None
+            try:
+                sock.close()
+            except OSError:
+                pass
+        return joined
+
+    def _drain_outbox(self, pending):
+        outbox = self.outbox
+        while outbox:
+            msg = outbox.popleft()
+            if msg.get("type") in RESUMABLE_TYPES:
+                self.sent_count += 1
+                self.sent_ring.append((self.sent_count, msg))
+            pending += encode_message(msg, self.wire)
+
+    def _replay(self, pending, recv_seq):
+        """Resend what the server did not get before the drop."""
+        if not self.sent_ring or self.sent_ring[0][0] > recv_seq + 1:
+            if self.sent_count > recv_seq:
+                # history no longer covers the gap; have the game send a full snapshot
+                self.inbox.append({"type": "resync"})
+        for n, msg in self.sent_ring:
+            if n > recv_seq:
+                pending += encode_message(msg, self.wire)
+
+    def _dispatch(self, pending):
+        """Parse buffered messages; answer pings inline. Returns True on 'joined'."""
+        joined = False
+        now = self.clock_ms()
+        while True:
+            msg, self.recv_buffer = read_message(self.recv_buffer, self.wire)
+            if msg is None:
                 break
-
-        while b"\n" in self.recv_buffer:
-            line, self.recv_buffer = self.recv_buffer.split(b"\n", 1)
-            line = line.strip()
-            if not line:
+            if not msg:
                 continue
-            try:
-                messages.append(json.loads(line.decode("utf-8")))
-            except Exception:
+            mtype = msg.get("type")
+            seq = msg.get("seq")
+            if isinstance(seq, int) and seq > self.last_seq:
+                self.last_seq = seq
+            if mtype == "joined":
+                joined = True
+                if msg.get("wire") == WIRE_BINARY:
+                    self.wire = WIRE_BINARY
+                # a fresh session, even if we asked to resume
+                self.token = msg.get("token")
+                self.resumable = False
+                self.last_seq = 0
+                self.sent_count = 0
+                self.sent_ring.clear()
+                self.outbox.clear()
+            elif mtype == "resumed":
+                joined = True
+                if msg.get("wire") == WIRE_BINARY:
+                    self.wire = WIRE_BINARY
+                self.in_match = True
+                self.next_ping_ms = now
+                try:
+                    self._replay(pending, int(msg.get("recv_seq", 0)))
+                except (TypeError, ValueError):
+                    self._replay(pending, 0)
+            elif mtype == "ping":
+                if "t0" in msg:
+                    pong = {"type": "pong", "t0": msg["t0"], "t1": now, "t2": self.clock_ms()}
+                    pending += encode_message(pong, self.wire)
                 continue
-
-        return messages
+            elif mtype == "pong":
+                self._on_pong(msg, now)
+                continue
+            elif mtype == "heartbeat":
+                pending += encode_message(msg, self.wire)  # the server's liveness probe
+                continue
+            elif mtype == "start":
+                self.in_match = True
+                self.resumable = True
+                self.next_ping_ms = now
+            elif mtype == "opponent_left":
+                self.in_match = False
+                self.resumable = False
+            elif mtype == "error":
+                # the server refused us (full room, voided match) and is closing the socket;
+                # reconnecting would only rejoin the same room, so stop here
+                self.closed = True
+                self.in_match = False
+                self.resumable = False
+                self.outbox.clear()
+                self.inbox.append(msg)
+                break
+            self.inbox.append(msg)
+        return joined
 
 # ----------------------------
 # Tetrominoes + Colors
 # ----------------------------
-TETROMINOES = {
-    "I": [[
-        "....",
-        "1111",
-        "....",
-        "...."
-    ]],
-    "O": [[
-        ".22.",
-        ".22.",
-        "....",
-        "...."
-    ]],
-    "T": [[
-        ".333",
-        "..3.",
-        "....",
-        "...."
-    ]],
-    "S": [[
-        "..44",
-        ".44.",
-        "....",
-        "...."
-    ]],
-    "Z": [[
-        ".55.",
-        "..55",
-        "....",
-        "...."
-    ]],
-    "J": [[
-        ".6..",
-        ".666",
-        "....",
-        "...."
-    ]],
-    "L": [[
-        "...7",
-        ".777",
-        "....",
-        "...."
-    ]]
-}
-
 COLORS = {
     "1": (0, 255, 255),    # I
     "2": (255, 220, 80),   # O
@@ -213,10 +428,6 @@ COLORS = {
     "7": (255, 160, 60)    # L
 }
 
-def rotate(shape):
-    """Rotate a 4x4 shape 90 degrees clockwise."""
-    return ["".join(row[col] for row in shape[::-1]) for col in range(4)]
-
 def lighter_color(col, amt=30):
     return tuple(min(255, c + amt) for c in col)
 
@@ -228,40 +439,58 @@ def darker_color(col, amt=30):
 # ----------------------------
 HIGHSCORE_FILE = "highscore.json"
 PROGRESS_FILE = "progress.json"
+REPLAY_DIR = os.environ.get("TETRIS_REPLAY_DIR", "replays")  # "" = don't keep replays
 
-def load_highscore():
+def _coerce_progress(data):
+    """Version 0 -> 1: files from before versioning; keep only well-typed fields."""
+    out = {}
     try:
-        with open(HIGHSCORE_FILE, "r") as f:
-            return int(json.load(f).get("highscore", 0))
-    except Exception:
-        return 0
+        out["xp"] = int(data.get("xp", 0))
+    except (TypeError, ValueError):
+        pass
+    if isinstance(data.get("achievements"), list):
+        out["achievements"] = data["achievements"]
+    return out
 
-def save_highscore(score):
+
+def _coerce_highscore(data):
+    """Version 0 -> 1: files from before versioning."""
     try:
-        with open(HIGHSCORE_FILE, "w") as f:
-            json.dump({"highscore": int(score)}, f)
-    except Exception:
-        pass
+        return {"highscore": int(data.get("highscore", 0))}
+    except (TypeError, ValueError):
+        return {}
+
+
+# saves are held in memory and written in the background; main() starts the writer
+persistence = Persistence()
+highscore_store = persistence.store(HIGHSCORE_FILE, {"highscore": 0}, migrations=[_coerce_highscore])
+progress_store = persistence.store(PROGRESS_FILE, {"xp": 0, "achievements": []}, migrations=[_coerce_progress])
+STATS_DB = os.environ.get("TETRIS_STATS_DB", "stats.db")
+stats_db = StatsDB(STATS_DB)  # every finished game; main() starts its writer
+
+
+def load_highscore():
+    return highscore_store.get("highscore", 0)
+
+def save_highscore(score):
+    highscore_store.update(highscore=int(score))
 
 
 def load_progress():
-    default_data = {"xp": 0, "achievements": []}
-    try:
-        with open(PROGRESS_FILE, "r") as f:
-            data = json.load(f)
-            xp = int(data.get("xp", 0))
-            achievements = data.get("achievements", [])
-            if not isinstance(achievements, list):
-                achievements = []
-            return {"xp": xp, "achievements": achievements}
-    except Exception:
-        return default_data
+    return {"xp": progress_store.get("xp", 0), "achievements": list(progress_store.get("achievements", []))}
 
 
 def save_progress(progress):
+    progress_store.update(**progress)
+
+
+def keep_replay(game):
+    if not REPLAY_DIR:
+        return
     try:
-        with open(PROGRESS_FILE, "w") as f:
-            json.dump(progress, f)
+        os.makedirs(REPLAY_DIR, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{game.replay.mode}.ssr"
+        save_replay(os.path.join(REPLAY_DIR, name), game.replay, game)
     except Exception:
         pass
 
@@ -291,27 +520,45 @@ class Star:
         col = (b, b, b)
         pygame.draw.rect(surf, col, (int(self.x), int(self.y), self.size, self.size))
 
-stars = [Star() for _ in range(120)]
+STAR_COUNT = 120
+stars = []  # filled on the first background draw, not at import
+_background_cache = {}  # "gradient" / "scanlines" -> Surface, built on first use
+
+def scanlines_surface():
+    overlay = _background_cache.get("scanlines")
+    if overlay is None:
+        overlay = pygame.Surface((WINDOW_W, WINDOW_H), pygame.SRCALPHA)
+        for y in range(0, WINDOW_H, 4):
+            overlay.fill((0, 0, 0, 18), rect=pygame.Rect(0, y, WINDOW_W, 1))
+        _background_cache["scanlines"] = overlay
+    return overlay
+
+def gradient_surface():
+    gradient = _background_cache.get("gradient")
+    if gradient is None:
+        gradient = pygame.Surface((WINDOW_W, WINDOW_H))
+        top = (6, 0, 24)
+        bottom = (2, 0, 48)
+        for y in range(WINDOW_H):
+            t = y / WINDOW_H
+            r = int(top[0] + (bottom[0] - top[0]) * t)
+            g = int(top[1] + (bottom[1] - top[1]) * t)
+            b = int(top[2] + (bottom[2] - top[2]) * t)
+            pygame.draw.line(gradient, (r, g, b), (0, y), (WINDOW_W, y))
+        _background_cache["gradient"] = gradient
+    return gradient
 
 def draw_scanlines(surf):
     # faint scanlines
-    overlay = pygame.Surface((WINDOW_W, WINDOW_H), pygame.SRCALPHA)
-    for y in range(0, WINDOW_H, 4):
-        overlay.fill((0, 0, 0, 18), rect=pygame.Rect(0, y, WINDOW_W, 1))
-    surf.blit(overlay, (0, 0))
+    surf.blit(scanlines_surface(), (0, 0))
 
 def draw_background(surf, dt):
     # deep gradient background
-    top = (6, 0, 24)
-    bottom = (2, 0, 48)
-    for y in range(WINDOW_H):
-        t = y / WINDOW_H
-        r = int(top[0] + (bottom[0] - top[0]) * t)
-        g = int(top[1] + (bottom[1] - top[1]) * t)
-        b = int(top[2] + (bottom[2] - top[2]) * t)
-        pygame.draw.line(surf, (r, g, b), (0, y), (WINDOW_W, y))
+    surf.blit(gradient_surface(), (0, 0))
 
     # stars
+    if not stars:
+        stars.extend(Star() for _ in range(STAR_COUNT))
     for s in stars:
         s.update(dt)
         s.draw(surf)
@@ -321,59 +568,6 @@ def draw_background(surf, dt):
 # ----------------------------
 # Core classes
 # ----------------------------
-class Bag:
-    def __init__(self, seed=None):
-        self.pool = []
-        self.rng = random.Random(seed)
-
-    def next_kind(self):
-        if not self.pool:
-            self.pool = list(TETROMINOES.keys())
-            self.rng.shuffle(self.pool)
-        return self.pool.pop()
-
-class Piece:
-    def __init__(self, kind=None):
-        if kind is None:
-            kind = random.choice(list(TETROMINOES.keys()))
-        self.kind = kind
-        self.rotation = 0
-        base = TETROMINOES[kind][0]
-        self.rotations = [base]
-        for _ in range(3):
-            self.rotations.append(rotate(self.rotations[-1]))
-        self.x = COLS // 2 - 2
-        self.y = 0
-        self.fall_progress = 0
-
-        # rotation animation
-        self.rotating = False
-        self.rot_from = self.rotation
-        self.rot_to = self.rotation
-        self.rot_progress = 0.0
-
-    def shape(self, rot=None):
-        r = self.rotation if rot is None else rot
-        return self.rotations[r % 4]
-
-    def start_rotation(self, new_rot):
-        if self.rotating:
-            return
-        self.rot_from = self.rotation
-        self.rot_to = new_rot % 4
-        self.rot_progress = 0.0
-        self.rotating = True
-
-    def cells(self, rot=None, x=None, y=None):
-        s = self.shape(rot)
-        ox = self.x if x is None else x
-        oy = self.y if y is None else y
-        for r in range(4):
-            for c in range(4):
-                v = s[r][c]
-                if v != ".":
-                    yield (ox + c, oy + r, v)
-
 class Bounce:
     def __init__(self, x, y):
         self.x = x
@@ -389,6 +583,39 @@ class Bounce:
         p = self.t / self.dur
         return -abs(math.sin(p * math.pi) * 8) * (1 - p)
 
+class PieceAnim:
+    """Rotation animation of the falling piece, kept off the engine Piece.
+
+    The turn only takes effect (piece.rotation = rot_to) once it finishes, so
+    Game.update advances it; the renderer just reads the angle.
+    """
+
+    __slots__ = ("rotating", "rot_from", "rot_to", "rot_progress")
+
+    def __init__(self):
+        self.rotating = False
+        self.rot_from = 0
+        self.rot_to = 0
+        self.rot_progress = 0.0
+
+    def start(self, piece, new_rot):
+        if self.rotating:
+            return
+        self.rot_from = piece.rotation
+        self.rot_to = new_rot % 4
+        self.rot_progress = 0.0
+        self.rotating = True
+
+    def angle(self):
+        if not self.rotating:
+            return 0
+        t = self.rot_progress
+        et = (1 - math.cos(t * math.pi)) / 2
+        diff = (self.rot_to - self.rot_from) % 4
+        if diff == 3:
+            diff = -1
+        return 90 * diff * et
+
 class Particle:
     def __init__(self, x, y, col=None):
         self.x = x
@@ -419,102 +646,13 @@ class Particle:
         s.fill(col)
         surf.blit(s, (self.x - self.size / 2, self.y - self.size / 2))
 
-class Board:
-    def __init__(self):
-        self.grid = [["." for _ in range(COLS)] for _ in range(ROWS)]
-        self.score = 0
-        self.level = 1
-        self.lines = 0
-        self.combo = -1
-        self.back_to_back = False
-        self.lock_bounces = []
-
-    def collision(self, piece, dx=0, dy=0, rotation=None):
-        rot = piece.rotation if rotation is None else rotation
-        s = piece.shape(rot)
-        for r in range(4):
-            for c in range(4):
-                v = s[r][c]
-                if v == ".":
-                    continue
-                nx = piece.x + c + dx
-                ny = piece.y + r + dy
-                if nx < 0 or nx >= COLS or ny >= ROWS:
-                    return True
-                if ny >= 0 and self.grid[ny][nx] != ".":
-                    return True
-        return False
-
-    def lock(self, piece, t_spin=False):
-        for x, y, v in piece.cells():
-            if 0 <= y < ROWS and 0 <= x < COLS:
-                self.grid[y][x] = v
-
-        cleared_rows = self.clear_lines()
-        cleared = len(cleared_rows)
-        self.lines += cleared
-
-        if cleared > 0:
-            self.combo += 1
-        else:
-            self.combo = -1
-
-        if t_spin:
-            base_points = [0, 800, 1200, 1600][cleared]
-            attack = [0, 2, 4, 6][cleared]
-        else:
-            base_points = [0, 100, 300, 500, 800][cleared]
-            attack = [0, 0, 1, 2, 4][cleared]
-
-        b2b_eligible = t_spin and cleared > 0 or cleared == 4
-        if b2b_eligible:
-            if self.back_to_back:
-                base_points = int(base_points * 1.5)
-                attack += 1
-            self.back_to_back = True
-        elif cleared > 0:
-            self.back_to_back = False
-
-        combo_bonus = max(0, self.combo) * 50
-        attack += max(0, self.combo - 1)
-
-        perfect_clear = cleared > 0 and all(cell == "." for row in self.grid for cell in row)
-        if perfect_clear:
-            base_points += 2000
-            attack += 6
-
-        self.level = 1 + self.lines // 10
-        self.score += (base_points + combo_bonus) * self.level
-        return cleared_rows, attack, perfect_clear
-
-    def clear_lines(self):
-        cleared_rows = [i for i, row in enumerate(self.grid) if all(cell != "." for cell in row)]
-        if not cleared_rows:
-            return []
-
-        new_grid = [row for row in self.grid if any(cell == "." for cell in row)]
-        while len(new_grid) < ROWS:
-            new_grid.insert(0, ["." for _ in range(COLS)])
-        self.grid = new_grid
-        return cleared_rows
-
-    def add_garbage(self, n):
-        """Add n garbage lines at bottom, push board up. One hole each row."""
-        for _ in range(n):
-            hole = random.randrange(COLS)
-            garbage = ["8" for _ in range(COLS)]
-            garbage[hole] = "."
-            # push up: remove top row, add garbage at bottom
-            self.grid.pop(0)
-            self.grid.append(garbage)
-
 # garbage color key "8"
 COLORS["8"] = (120, 120, 120)
 
 # ----------------------------
 # Rendering
 # ----------------------------
-def draw_board(surf, board, offset_x=0):
+def draw_board(surf, grid, offset_x=0, bounces=()):
     # board background vignette
     vignette = pygame.Surface((BOARD_W, BOARD_H), pygame.SRCALPHA)
     for i in range(120):
@@ -525,9 +663,9 @@ def draw_board(surf, board, offset_x=0):
     # grid + blocks
     for r in range(ROWS):
         for c in range(COLS):
-            cell = board.grid[r][c]
+            cell = grid[r][c]
             offy = 0
-            for b in board.lock_bounces:
+            for b in bounces:
                 if b.x == c and b.y == r:
                     offy += b.offset()
             rect = pygame.Rect(offset_x + c * CELL, r * CELL + int(offy), CELL, CELL)
@@ -545,14 +683,11 @@ def draw_board(surf, board, offset_x=0):
 
 
 def draw_grid_snapshot(surf, grid, offset_x=0):
-    class _TempBoard:
-        def __init__(self, g):
-            self.grid = g
-            self.lock_bounces = []
-
-    draw_board(surf, _TempBoard(grid), offset_x=offset_x)
+    draw_board(surf, grid, offset_x=offset_x)
 
-def draw_piece(surf, piece, offset_x=0, glow_pulse=0.0):
+def draw_piece(surf, piece, offset_x=0, glow_pulse=0.0, y_px=None, anim=None):
+    if y_px is None:
+        y_px = piece.y * CELL
     local = pygame.Surface((CELL * 4, CELL * 4), pygame.SRCALPHA)
     for r in range(4):
         for c in range(4):
@@ -574,28 +709,17 @@ def draw_piece(surf, piece, offset_x=0, glow_pulse=0.0):
             pygame.draw.rect(local, lighter_color(color, 35 + pulse_amt), inner, 1)
 
     # rotation animation angle
-    angle = 0
-    if getattr(piece, "rotating", False):
-        t = piece.rot_progress
-        et = (1 - math.cos(t * math.pi)) / 2
-        diff = (piece.rot_to - piece.rot_from) % 4
-        if diff == 3:
-            diff = -1
-        angle = 90 * diff * et
-        if t >= 1.0:
-            piece.rotating = False
-            piece.rotation = piece.rot_to
-            piece.rot_progress = 0.0
+    angle = anim.angle() if anim is not None else 0
 
     if abs(angle) > 0.01:
         rotated = pygame.transform.rotate(local, -angle)
         rw, rh = rotated.get_size()
         px = offset_x + piece.x * CELL + (CELL * 4) // 2 - rw // 2
-        py = piece.y * CELL + int(getattr(piece, "fall_progress", 0)) + (CELL * 4) // 2 - rh // 2
+        py = int(y_px) + (CELL * 4) // 2 - rh // 2
         surf.blit(rotated, (px, py))
     else:
         px = offset_x + piece.x * CELL
-        py = piece.y * CELL + int(getattr(piece, "fall_progress", 0))
+        py = int(y_px)
         surf.blit(local, (px, py))
 
 def draw_next_box(surf, piece, x, y, label="Next"):
@@ -626,7 +750,7 @@ def draw_center_overlay(surf, title, subtitle=None):
 # ----------------------------
 def simulate_lock(grid, piece_kind, rot, x):
     """Return (new_grid, lines_cleared) after dropping a piece. If invalid placement, return (None, 0)."""
-    grid = deepcopy(grid)
+    grid = [row[:] for row in grid]
     p = Piece(piece_kind)
     p.rotation = rot % 4
     p.x = x
@@ -657,16 +781,16 @@ def simulate_lock(grid, piece_kind, rot, x):
         p.y += 1
 
     # lock
+    touched = set()
     for cx, cy, v in p.cells(rot=p.rotation, x=p.x, y=p.y):
         if 0 <= cy < ROWS and 0 <= cx < COLS:
             grid[cy][cx] = v
+            touched.add(cy)
 
-    # clear lines
-    cleared = [i for i, row in enumerate(grid) if all(cell != "." for cell in row)]
+    # clear lines: only the rows the piece landed in can have filled up
+    cleared = full_rows(grid, touched)
     if cleared:
-        grid = [row for row in grid if any(cell == "." for cell in row)]
-        while len(grid) < ROWS:
-            grid.insert(0, ["." for _ in range(COLS)])
+        grid = compact_rows(grid, cleared)
     return grid, len(cleared)
 
 def board_features(grid):
@@ -747,12 +871,16 @@ def ai_best_move(grid, kind, next_kind=None, lookahead_weight=0.35):
 # Game wrapper (engine + renderer-friendly)
 # ----------------------------
 class Game:
-    def __init__(self, seed=None, ai_interval_ms=120, ai_lookahead_weight=0.35):
-        self.board = Board()
+    def __init__(self, seed=None, ai_interval_ms=120, ai_lookahead_weight=0.35, remote=False,
+                 garbage_policy=GARBAGE_POLICY):
+        self.seed = seed
+        self.board = Board(garbage_seed=seed, garbage_policy=garbage_policy)
         self.bag = Bag(seed=seed)
         self.current = Piece(self.bag.next_kind())
         self.next_piece = Piece(self.bag.next_kind())
         self.particles = []
+        self.lock_bounces = []
+        self.anim = PieceAnim()
         self.fall_speed = 500  # ms per cell
         self.soft_drop = False
         self.game_over = False
@@ -763,10 +891,25 @@ class Game:
         self.last_t_spin = False
         self.last_perfect_clear = False
         self.last_clear_count = 0
+        self.pieces = 0
+        self.elapsed_ms = 0
+        # per-game totals for the stats database
+        self.attack_sent = 0
+        self.t_spins = 0
+        self.max_combo = 0
+        self.perfect_clears = 0
+        self.fall_progress = 0.0  # sub-cell gravity of the current piece, in pixels
+        self.fall_step_px = 0.0  # gravity moved the piece this far in the last tick; render interpolation
 
         # rotation
         self.rotate_ms = 180.0
 
+        # lockstep online: a remote game never locks on its own, it waits for the
+        # owner's lock event; a local game records its events into net_events
+        self.remote = remote
+        self.net_events = None
+        self.replay = None  # ReplayRecorder for the local player's game
+
         # AI plan fields (used only for ai game)
         self.ai_plan = None
         self.ai_action_cooldown_ms = 0
@@ -776,7 +919,9 @@ class Game:
     def spawn_next(self):
         self.current = self.next_piece
         self.next_piece = Piece(self.bag.next_kind())
-        self.current.fall_progress = 0
+        self.anim = PieceAnim()
+        self.fall_progress = 0
+        self.fall_step_px = 0.0
         self.grounded_ms = 0
         self.last_move_was_rotate = False
         if self.board.collision(self.current):
@@ -787,9 +932,11 @@ class Game:
             self.current.x += dx
             self.current.y += dy
             if dy != 0:
-                self.current.fall_progress = 0
+                self.fall_progress = 0
             self.grounded_ms = 0
             self.last_move_was_rotate = False
+            if dx:
+                self.record_input("L" if dx < 0 else "R")
             return True
         return False
 
@@ -800,9 +947,10 @@ class Game:
             if not self.board.collision(self.current, dx=dx, dy=dy, rotation=new_rot):
                 self.current.x += dx
                 self.current.y += dy
-                self.current.start_rotation(new_rot)
+                self.anim.start(self.current, new_rot)
                 self.grounded_ms = 0
                 self.last_move_was_rotate = True
+                self.record_input("U")
                 return True
         return False
 
@@ -811,44 +959,45 @@ class Game:
         while not self.board.collision(self.current, dy=1):
             self.current.y += 1
             moved = True
-        self.current.fall_progress = 0
+        self.fall_progress = 0
+        self.fall_step_px = 0.0
         self.grounded_ms = self.lock_delay_ms
         return moved
 
     def detect_t_spin(self):
         if self.current.kind != "T" or not self.last_move_was_rotate:
             return False
-
-        cx = self.current.x + 2
-        cy = self.current.y + 1
-        corners = [
-            (cx - 1, cy - 1),
-            (cx + 1, cy - 1),
-            (cx - 1, cy + 1),
-            (cx + 1, cy + 1),
-        ]
-
-        blocked = 0
-        for x, y in corners:
-            if x < 0 or x >= COLS or y < 0 or y >= ROWS:
-                blocked += 1
-            elif self.board.grid[y][x] != ".":
-                blocked += 1
-
-        return blocked >= 3
-
-    def lock_current(self):
-        t_spin = self.detect_t_spin()
-        cleared_rows, attack, perfect_clear = self.board.lock(self.current, t_spin=t_spin)
+        return t_spin_corners(self.board.grid, self.current) >= 3
+
+    def lock_current(self, t_spin=None):
+        if t_spin is None:
+            t_spin = self.detect_t_spin()
+        piece = self.current
+        cleared_rows, attack, perfect_clear = self.board.lock(piece, t_spin=t_spin)
+        self.pieces += 1
+        self.record({
+            "type": "lock",
+            "n": self.pieces,
+            "x": piece.x,
+            "y": piece.y,
+            "r": piece.rotation,
+            "ts": 1 if t_spin else 0,
+        })
+        if self.pieces % LOCKSTEP_CHECKSUM_EVERY == 0:
+            self.record({"type": "checksum", "n": self.pieces, "crc": self.checksum()})
         self.last_attack = attack
         self.last_t_spin = t_spin and len(cleared_rows) > 0
         self.last_perfect_clear = perfect_clear
         self.last_clear_count = len(cleared_rows)
+        self.attack_sent += attack
+        self.t_spins += self.last_t_spin
+        self.max_combo = max(self.max_combo, self.board.combo)
+        self.perfect_clears += perfect_clear
 
         # particles for lock tiles
         for x, y, v in self.current.cells():
             if 0 <= y < ROWS:
-                self.board.lock_bounces.append(Bounce(x, y))
+                self.lock_bounces.append(Bounce(x, y))
                 for _ in range(4):
                     px = x * CELL + random.uniform(0, CELL)
                     py = y * CELL + random.uniform(0, CELL)
@@ -869,16 +1018,16 @@ class Game:
             # still update effects a bit
             ndt = dt_ms / 1000.0
             self.particles = [p for p in self.particles if p.update(ndt)]
-            self.board.lock_bounces = [b for b in self.board.lock_bounces if b.update(ndt)]
+            self.lock_bounces = [b for b in self.lock_bounces if b.update(ndt)]
             return 0
 
         self.last_attack = 0
         self.last_t_spin = False
         self.last_perfect_clear = False
         self.last_clear_count = 0
+        self.elapsed_ms += dt_ms
 
         # falling logic
-        keys = pygame.key.get_pressed()
         # soft drop only for human-controlled game; AI sets it in its own logic
         active_speed = max(50, self.fall_speed - (self.board.level - 1) * 30)
         if self.soft_drop:
@@ -887,34 +1036,106 @@ class Game:
         pixels_per_ms = CELL / active_speed
 
         if not self.board.collision(self.current, dy=1):
-            self.current.fall_progress += pixels_per_ms * dt_ms
-            if self.current.fall_progress >= CELL:
+            self.fall_step_px = pixels_per_ms * dt_ms
+            self.fall_progress += self.fall_step_px
+            if self.fall_progress >= CELL:
                 self.current.y += 1
-                self.current.fall_progress -= CELL
+                self.fall_progress -= CELL
             self.grounded_ms = 0
         else:
-            self.current.fall_progress = 0
+            self.fall_step_px = 0.0
+            self.fall_progress = 0
             self.grounded_ms += dt_ms
-            if self.grounded_ms >= self.lock_delay_ms:
+            if self.grounded_ms >= self.lock_delay_ms and not self.remote:
                 cleared = self.lock_current()
                 self.spawn_next()
                 return cleared
 
         # update rotation progress
-        if getattr(self.current, "rotating", False):
-            self.current.rot_progress += dt_ms / self.rotate_ms
-            if self.current.rot_progress >= 1.0:
-                self.current.rot_progress = 1.0
-                self.current.rotating = False
-                self.current.rotation = self.current.rot_to
+        anim = self.anim
+        if anim.rotating:
+            anim.rot_progress += dt_ms / self.rotate_ms
+            if anim.rot_progress >= 1.0:
+                anim.rot_progress = 1.0
+                anim.rotating = False
+                self.current.rotation = anim.rot_to
 
         # effects update
         ndt = dt_ms / 1000.0
         self.particles = [p for p in self.particles if p.update(ndt)]
-        self.board.lock_bounces = [b for b in self.board.lock_bounces if b.update(ndt)]
+        self.lock_bounces = [b for b in self.lock_bounces if b.update(ndt)]
 
         return 0
 
+    def render_y_px(self, alpha):
+        """Pixel y to draw the falling piece at, alpha of the way from the last tick to the next."""
+        return self.current.y * CELL + self.fall_progress - self.fall_step_px * (1.0 - alpha)
+
+    # ---- lockstep online ----
+    def record(self, payload):
+        if self.net_events is None and self.replay is None:
+            return
+        payload["t"] = int(self.elapsed_ms)
+        if self.replay is not None:
+            self.replay.add(payload)
+        if self.net_events is not None:
+            self.net_events.append(payload)
+
+    def record_input(self, key):
+        self.record({"type": "input", "k": key})
+
+    def receive_garbage(self, amount):
+        self.board.add_garbage(amount)
+        self.record({"type": "garbage", "n": amount})
+
+    def checksum(self):
+        return board_checksum(self.board.grid, self.board.score, self.board.lines)
+
+    def apply_net_event(self, msg):
+        """Replay one event from the opponent's lockstep stream. Returns False on desync."""
+        mtype = msg.get("type")
+        if mtype == "input":
+            key = msg.get("k")
+            if key == "L":
+                self.try_move(-1, 0)
+            elif key == "R":
+                self.try_move(1, 0)
+            elif key == "U":
+                self.try_rotate()
+            elif key in ("S1", "S0"):
+                self.soft_drop = key == "S1"
+        elif mtype == "lock":
+            if self.game_over:
+                return True
+            piece = self.current
+            piece.x = int(msg.get("x", piece.x))
+            piece.y = int(msg.get("y", piece.y))
+            piece.rotation = int(msg.get("r", piece.rotation)) % 4
+            self.anim.rotating = False
+            self.fall_progress = 0
+            self.lock_current(t_spin=bool(msg.get("ts", 0)))
+            self.spawn_next()
+        elif mtype == "garbage":
+            # holes come from the shared seeded stream, only the amount travels
+            self.board.add_garbage(int(msg.get("n", 0)))
+        elif mtype == "checksum":
+            # events arrive in order, so a piece count that differs is a lost or extra lock
+            return int(msg.get("n", -1)) == self.pieces and int(msg.get("crc", -1)) == self.checksum()
+        return True
+
+    def resync(self, grid, pieces):
+        """Adopt the opponent's board from a snapshot and deal from where its bag is."""
+        self.board.set_grid(grid)
+        self.pieces = pieces
+        self.bag = Bag(seed=self.seed)
+        for _ in range(pieces):
+            self.bag.next_kind()
+        self.current = Piece(self.bag.next_kind())
+        self.next_piece = Piece(self.bag.next_kind())
+        self.anim.rotating = False
+        self.fall_progress = 0
+        self.grounded_ms = 0
+
     def update_ai(self, dt_ms):
         """AI decides where to place current piece and performs actions gradually."""
         if self.game_over:
@@ -922,12 +1143,14 @@ class Game:
 
         # compute/refresh plan
         if self.ai_plan is None:
+            plan_started = profiler.now()
             rot, x = ai_best_move(
                 self.board.grid,
                 self.current.kind,
                 self.next_piece.kind,
                 lookahead_weight=self.ai_lookahead_weight,
             )
+            profiler.span("ai_plan", plan_started)
             self.ai_plan = {"rot": rot, "x": x}
             self.ai_action_cooldown_ms = 0
 
@@ -938,7 +1161,7 @@ class Game:
 
             # rotate toward target
             target_rot = self.ai_plan["rot"] % 4
-            if self.current.rotation != target_rot and not self.current.rotating:
+            if self.current.rotation != target_rot and not self.anim.rotating:
                 if self.try_rotate():
                     play(SND_ROTATE)
 
@@ -966,6 +1189,32 @@ class Game:
 
         return cleared
 
+class TickStats:
+    """What the fixed logic ticks cost, timed apart from rendering."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.ticks = 0
+        self.total_ms = 0.0
+        self.max_batch_ms = 0.0
+
+    def add(self, ticks, ms):
+        self.ticks += ticks
+        self.total_ms += ms
+        self.max_batch_ms = max(self.max_batch_ms, ms)
+
+    def window_ms(self):
+        return (time.perf_counter() - self.started) * 1000.0
+
+    def report(self):
+        seconds = max(1e-9, self.window_ms() / 1000.0)
+        per_tick_us = self.total_ms * 1000.0 / self.ticks if self.ticks else 0.0
+        return (f"logic: {self.ticks / seconds:.0f} ticks/s, {per_tick_us:.1f} us/tick, "
+                f"{self.total_ms / seconds / 10.0:.2f}% of wall time, worst frame {self.max_batch_ms:.2f} ms")
+
 # ----------------------------
 # UI helpers
 # ----------------------------
@@ -999,11 +1248,126 @@ def draw_side_panel(surf, x, title, game: Game, highscore, is_ai=False):
         for i, t in enumerate(hints):
             surf.blit(font.render(t, True, (200, 200, 200)), (x + 12, y + i * 22))
 
+_profiler_font = None
+PROFILER_GRAPH_MS = 50.0  # top of the frame-time graph
+
+
+def draw_profiler_overlay(surf, prof):
+    """Rolling frame-time graph plus per-phase p50/p95/p99/max, bottom left."""
+    global _profiler_font
+    if _profiler_font is None:
+        _profiler_font = pygame.font.SysFont("Consolas", 14)
+    stats = prof.summary()
+    line_h = 16
+    graph_h = 80
+    w = max(prof.frames.maxlen, 360)
+    h = graph_h + 12 + line_h * (len(stats) + 1)
+    x0, y0 = 8, WINDOW_H - h - 8
+    panel = pygame.Surface((w + 8, h), pygame.SRCALPHA)
+    panel.fill((0, 0, 0, 190))
+    surf.blit(panel, (x0 - 4, y0))
+
+    # frame work time, one column per frame; the line is the 60 FPS budget
+    base = y0 + 4 + graph_h
+    for i, (work_ms, _) in enumerate(prof.frames):
+        col = (90, 220, 120) if work_ms < 1000 / FPS else (240, 210, 90) if work_ms < 2000 / FPS else (240, 90, 90)
+        bar = min(graph_h, int(work_ms / PROFILER_GRAPH_MS * graph_h))
+        if bar:
+            pygame.draw.line(surf, col, (x0 + i, base), (x0 + i, base - bar))
+    budget_y = base - int(1000 / FPS / PROFILER_GRAPH_MS * graph_h)
+    pygame.draw.line(surf, (200, 200, 255), (x0, budget_y), (x0 + w, budget_y))
+
+    y = base + 8
+    surf.blit(_profiler_font.render(f"{'ms':<16}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}", True, (200, 200, 255)), (x0, y))
+    for name, (p50, p95, p99, worst) in stats.items():
+        y += line_h
+        col = (255, 255, 255) if name == "frame" else (200, 200, 200)
+        text = f"{name[:16]:<16}{p50:>8.2f}{p95:>8.2f}{p99:>8.2f}{worst:>8.1f}"
+        surf.blit(_profiler_font.render(text, True, col), (x0, y))
+
+def draw_stats_row(surf, cells, x, y, color):
+    """Left-align the first cell, right-align the rest at their column edges."""
+    for i, (text, right) in enumerate(cells):
+        s = font.render(str(text), True, color)
+        surf.blit(s, (x + right - (0 if i == 0 else s.get_width()), y))
+
+
+def draw_stats_screen(surf, view, labels):
+    """Per-mode totals, the selected mode's top scores and the best sprint times."""
+    overlay = pygame.Surface((WINDOW_W, WINDOW_H), pygame.SRCALPHA)
+    overlay.fill((0, 0, 0, 200))
+    surf.blit(overlay, (0, 0))
+    title_s = big_font.render("STATS", True, (255, 255, 255))
+    surf.blit(title_s, (WINDOW_W // 2 - title_s.get_width() // 2, 24))
+
+    x = 40
+    y = 80
+    edges = (0, 200, 270, 380, 480, 550, 620)
+    head = ("mode", "games", "won", "best", "avg", "pps", "apm")
+    draw_stats_row(surf, zip(head, edges), x, y, (200, 200, 255))
+    if not view["totals"]:
+        surf.blit(font.render("No games recorded yet", True, (200, 200, 200)), (x, y + 26))
+    for i, r in enumerate(view["totals"][:5]):
+        row = (labels.get(r["mode"], r["mode"]), r["games"], r["wins"], r["best_score"],
+               f"{r['avg_score']:.0f}", f"{r['pps']:.2f}", f"{r['apm']:.1f}")
+        draw_stats_row(surf, zip(row, edges), x, y + 26 * (i + 1), (230, 230, 230))
+
+    y = 260
+    surf.blit(font.render(f"Top {labels.get(view['mode'], view['mode'])}  (←/→)", True, (200, 200, 255)), (x, y))
+    edges = (0, 150, 250, 350, 450)
+    for i, r in enumerate(view["top"]):
+        row = (f"{i + 1}.", r["score"], f"{r['lines']} lines", f"{r['pps']:.2f} pps", format_ms(r["duration_ms"]))
+        draw_stats_row(surf, zip(row, edges), x, y + 26 * (i + 1), (230, 230, 230))
+
+    y = 430
+    surf.blit(font.render("Best sprint times", True, (200, 200, 255)), (x, y))
+    times = "   ".join(format_ms(r["duration_ms"]) for r in view["sprint"]) or "-"
+    surf.blit(font.render(times, True, (230, 230, 230)), (x, y + 26))
+
+    hint = font.render("ESC / Enter: back", True, (170, 170, 190))
+    surf.blit(hint, (WINDOW_W // 2 - hint.get_width() // 2, WINDOW_H - 40))
+
+# ----------------------------
+# Startup
+# ----------------------------
+startup = StartupTimer(STARTUP_T0)
+
+
+def open_window():
+    """Open the window and show a first frame before any slow asset work; returns the asset thread."""
+    global screen
+    startup.mark("imported")
+    pygame.display.init()
+    screen = pygame.display.set_mode((WINDOW_W, WINDOW_H))
+    pygame.display.set_caption("Sam Stackerz VS AI")
+    screen.blit(gradient_surface(), (0, 0))
+    pygame.display.flip()
+    startup.mark("window")
+    pygame.font.init()
+    # Mixer (safe init)
+    try:
+        pygame.mixer.init()
+    except Exception:
+        pass
+    return start_loader(ASSETS)
+
+
+def draw_loading(surf):
+    # no text: fonts are what is loading
+    w = BOARD_W
+    x = WINDOW_W // 2 - w // 2
+    y = WINDOW_H // 2
+    pygame.draw.rect(surf, (120, 80, 255), (x, y, w, 10), 1)
+    pygame.draw.rect(surf, (120, 80, 255), (x + 2, y + 2, int((w - 4) * loaded_fraction(ASSETS)), 6))
+
 # ----------------------------
 # Main loop (menu + Classic/VS AI/Sprint)
 # ----------------------------
 def main():
-    state = STATE_START
+    loader = open_window()
+    persistence.start()
+    stats_db.start()
+    state = STATE_LOADING
     running = True
     highscore = load_highscore()
     progress = load_progress()
@@ -1011,6 +1375,9 @@ def main():
     total_xp = int(progress.get("xp", 0))
     notifications = []
     t_accum = 0.0
+    logic_accum_ms = 0.0
+    render_alpha = 0.0
+    logic_stats = TickStats()
 
     menu_modes = [MODE_CLASSIC, MODE_VS_AI, MODE_VS_LOCAL, MODE_ONLINE, MODE_SPRINT]
     menu_labels = {
@@ -1037,10 +1404,15 @@ def main():
         "lines": 0,
         "game_over": False,
     }
+    remote_game = None  # lockstep: opponent simulated locally from the shared seed
     snapshot_timer_ms = 0
+    pending_garbage = []  # [due_ms on our clock, rows] for stamped incoming attacks
+    remote_snapshot_at = -1
     sprint_target_lines = 40
     sprint_time_ms = 0
     sprint_complete = False
+    recorded_game = None  # the last Game written to the stats database
+    stats_view = None
 
     # layout offsets
     player_x_single = PADDING
@@ -1058,6 +1430,38 @@ def main():
         total_xp += int(amount)
         save_progress_state()
 
+    def finished_game_stats():
+        if active_mode in (MODE_VS_AI, MODE_VS_LOCAL, MODE_ONLINE):
+            opp_game_over = remote_state["game_over"] if active_mode == MODE_ONLINE else (ai is not None and ai.game_over)
+            if player.game_over and opp_game_over:
+                result = RESULT_TIE
+            else:
+                result = RESULT_LOSS if player.game_over else RESULT_WIN
+        else:
+            result = RESULT_CLEAR if active_mode == MODE_SPRINT and sprint_complete else RESULT_TOPOUT
+        return game_record(
+            active_mode,
+            player.seed,
+            result,
+            sprint_time_ms if result == RESULT_CLEAR else player.elapsed_ms,
+            player.board.score,
+            player.board.lines,
+            player.pieces,
+            player.attack_sent,
+            player.t_spins,
+            player.max_combo,
+            player.perfect_clears,
+        )
+
+    def load_stats_view(mode):
+        # summary rows plus two index scans: instant however many games are stored
+        return {
+            "mode": mode,
+            "totals": stats_db.totals(),
+            "top": stats_db.leaderboard(mode, limit=5),
+            "sprint": stats_db.sprint_best(MODE_SPRINT, limit=5),
+        }
+
     def unlock_achievement(key, label, xp_gain=120):
         if key in unlocked:
             return
@@ -1067,11 +1471,12 @@ def main():
 
     def start_mode(mode):
         nonlocal player, ai, online, online_ready, online_status, online_sent_gameover
-        nonlocal remote_state, snapshot_timer_ms
+        nonlocal remote_state, remote_game, snapshot_timer_ms, remote_snapshot_at
         nonlocal state, active_mode, sprint_time_ms, sprint_complete, active_ai_difficulty
         seed = random.randrange(1_000_000)
         active_mode = mode
-        player = Game(seed=seed)
+        player = Game(seed=seed, garbage_policy=LOCAL_GARBAGE_POLICY)
+        player.replay = ReplayRecorder(seed, mode)
         online_ready = False
         online_sent_gameover = False
         snapshot_timer_ms = 0
@@ -1081,6 +1486,9 @@ def main():
             "lines": 0,
             "game_over": False,
         }
+        remote_game = None
+        pending_garbage.clear()
+        remote_snapshot_at = -1
 
         if online is not None:
             online.close()
@@ -1093,17 +1501,26 @@ def main():
                 seed=seed + 1337,
                 ai_interval_ms=cfg["interval_ms"],
                 ai_lookahead_weight=cfg["lookahead_weight"],
+                garbage_policy=LOCAL_GARBAGE_POLICY,
             )
             online_status = ""
         elif mode == MODE_VS_LOCAL:
-            ai = Game(seed=seed + 1337)
+            ai = Game(seed=seed + 1337, garbage_policy=LOCAL_GARBAGE_POLICY)
             online_status = ""
         elif mode == MODE_ONLINE:
             ai = None
             try:
-                online = OnlineClient(ONLINE_HOST, ONLINE_PORT, ONLINE_ROOM, "Player")
+                online = OnlineClient(
+                    ONLINE_HOST,
+                    ONLINE_PORT,
+                    ONLINE_ROOM,
+                    "Player",
+                    wire=ONLINE_WIRE,
+                    netcode=ONLINE_NETCODE,
+                    rating=ONLINE_RATING,
+                )
                 online.connect()
-                online_status = f"Connected to {ONLINE_HOST}:{ONLINE_PORT} room '{ONLINE_ROOM}'"
+                online_status = f"Connecting to {ONLINE_HOST}:{ONLINE_PORT} room '{ONLINE_ROOM}'"
             except Exception:
                 online = None
                 online_status = "Could not connect to online server"
@@ -1115,15 +1532,36 @@ def main():
         state = STATE_PLAYING
 
     while running:
+        profiler.begin_frame()
         dt_ms = clock.tick(FPS)
+        profiler.mark("wait")
         dt = dt_ms / 1000.0
         t_accum += dt
+        logic_accum_ms += min(dt_ms, MAX_FRAME_MS)
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
 
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                profiler.toggle()
+
             elif event.type == pygame.KEYDOWN:
+                if state == STATE_LOADING:
+                    if event.key == pygame.K_ESCAPE:
+                        running = False
+                    continue
+
+                # STATS
+                if state == STATE_STATS:
+                    if event.key in (pygame.K_LEFT, pygame.K_a, pygame.K_RIGHT, pygame.K_d):
+                        step = -1 if event.key in (pygame.K_LEFT, pygame.K_a) else 1
+                        mode = menu_modes[(menu_modes.index(stats_view["mode"]) + step) % len(menu_modes)]
+                        stats_view = load_stats_view(mode)
+                    elif event.key in (pygame.K_ESCAPE, pygame.K_RETURN, pygame.K_t):
+                        state = STATE_START
+                    continue
+
                 # MENU
                 if state == STATE_START:
                     if event.key in (pygame.K_UP, pygame.K_w):
@@ -1136,6 +1574,9 @@ def main():
                         ai_diff_idx = (ai_diff_idx + 1) % len(AI_DIFFICULTIES)
                     elif event.key in (pygame.K_RETURN, pygame.K_SPACE):
                         start_mode(menu_modes[menu_idx])
+                    elif event.key == pygame.K_t:
+                        stats_view = load_stats_view(menu_modes[menu_idx])
+                        state = STATE_STATS
                     elif event.key == pygame.K_ESCAPE:
                         running = False
                     continue
@@ -1208,27 +1649,45 @@ def main():
         # Soft drop is hold-based for player
         keys = pygame.key.get_pressed()
         if player is not None:
-            player.soft_drop = (state == STATE_PLAYING) and keys[pygame.K_DOWN]
+            soft = (state == STATE_PLAYING) and keys[pygame.K_DOWN]
+            if soft != player.soft_drop:
+                player.record_input("S1" if soft else "S0")
+            player.soft_drop = soft
         if ai is not None and active_mode == MODE_VS_LOCAL:
             ai.soft_drop = (state == STATE_PLAYING) and keys[pygame.K_k]
+        profiler.mark("events")
 
         if online is not None:
             for msg in online.poll():
                 mtype = msg.get("type")
                 if mtype == "start":
                     seed = int(msg.get("seed", random.randrange(1_000_000)))
-                    player = Game(seed=seed)
+                    # servers that predate the field use the engine default
+                    garbage_policy = msg.get("garbage", GARBAGE_POLICY)
+                    if garbage_policy not in GARBAGE_POLICIES:
+                        garbage_policy = GARBAGE_POLICY
+                    player = Game(seed=seed, garbage_policy=garbage_policy)
+                    player.replay = ReplayRecorder(seed, MODE_ONLINE)
                     remote_state = {
                         "grid": [["." for _ in range(COLS)] for _ in range(ROWS)],
                         "score": 0,
                         "lines": 0,
                         "game_over": False,
                     }
+                    if msg.get("netcode") == NETCODE_LOCKSTEP:
+                        remote_game = Game(seed=seed, remote=True, garbage_policy=garbage_policy)
+                        player.net_events = []
+                    else:
+                        remote_game = None
+                    pending_garbage.clear()
+                    remote_snapshot_at = -1
                     online_ready = True
                     online_status = "Match started"
                 elif mtype == "waiting":
                     online_ready = False
-                    online_status = "Waiting for opponent..."
+                    online_status = str(msg.get("message", "Waiting for opponent")) + "..."
+                elif mtype == "matched":
+                    online_status = f"Matched — room {msg.get('room', '?')}"
                 elif mtype == "opponent_left":
                     online_ready = False
                     online_status = "Opponent left room"
@@ -1236,8 +1695,24 @@ def main():
                 elif mtype == "attack":
                     amount = int(msg.get("amount", 0))
                     if amount > 0 and player is not None:
-                        player.board.add_garbage(amount)
+                        # land the rows at a fixed delay after the sender's stamp, not
+                        # whenever this poll happened to run; clamp against a bad clock estimate
+                        now_ms = online.clock_ms()
+                        due = now_ms
+                        if isinstance(msg.get("at"), int):
+                            due = online.to_local_ms(msg["at"]) + GARBAGE_DELAY_MS
+                        pending_garbage.append([min(max(due, now_ms), now_ms + GARBAGE_DELAY_MS), amount])
+                elif mtype in ("input", "lock", "garbage", "checksum"):
+                    if remote_game is not None and not remote_game.apply_net_event(msg):
+                        online.send({"type": "resync"})
+                elif mtype == "resync":
+                    snapshot_timer_ms = SNAPSHOT_INTERVAL_MS
                 elif mtype == "snapshot":
+                    stamped = msg.get("at")
+                    if isinstance(stamped, int):
+                        if stamped < remote_snapshot_at:
+                            continue
+                        remote_snapshot_at = stamped
                     grid = msg.get("grid")
                     if isinstance(grid, list) and len(grid) == ROWS:
                         parsed = []
@@ -1250,32 +1725,66 @@ def main():
                                 break
                         if ok:
                             remote_state["grid"] = parsed
+                            if remote_game is not None:
+                                pieces = msg.get("n")
+                                if type(pieces) is int and pieces >= 0:
+                                    remote_game.resync([row[:] for row in parsed], pieces)
+                                else:
+                                    remote_game.board.set_grid([row[:] for row in parsed])
                     remote_state["score"] = int(msg.get("score", remote_state["score"]))
                     remote_state["lines"] = int(msg.get("lines", remote_state["lines"]))
                     remote_state["game_over"] = bool(msg.get("game_over", remote_state["game_over"]))
+                    if remote_game is not None:
+                        remote_game.board.score = remote_state["score"]
+                        remote_game.board.lines = remote_state["lines"]
                 elif mtype == "gameover":
                     remote_state["game_over"] = True
+                elif mtype == "resumed":
+                    online_ready = player is not None
+                    online_status = "Reconnected"
+                elif mtype == "opponent_away":
+                    online_ready = False
+                    online_status = f"Opponent disconnected - holding their slot for {int(msg.get('grace_ms', 0)) // 1000}s"
+                elif mtype == "opponent_back":
+                    online_ready = player is not None
+                    online_status = "Opponent reconnected"
+                elif mtype == "reconnecting":
+                    # the I/O thread lost (or never got) the connection and is backing off
+                    online_ready = False
+                    online_status = f"Connection lost - retrying ({msg.get('attempt', 1)}/{RECONNECT_ATTEMPTS})"
+                elif mtype == "joined":
+                    online_status = f"Connected to {ONLINE_HOST}:{ONLINE_PORT} room '{msg.get('room', ONLINE_ROOM)}'"
                 elif mtype == "error":
+                    online_ready = False
                     online_status = str(msg.get("message", "Online error"))
 
+        profiler.mark("online")
+
         notifications = [n for n in notifications if n["ms"] > 0]
         for n in notifications:
             n["ms"] -= dt_ms
 
-        # UPDATE
-        if state == STATE_PLAYING and player is not None:
+        # UPDATE: the simulation advances in fixed LOGIC_DT_MS ticks however long the
+        # frame took; what is left over in the accumulator interpolates the render
+        ticks = int(logic_accum_ms // LOGIC_DT_MS)
+        logic_accum_ms -= ticks * LOGIC_DT_MS
+        logic_started = time.perf_counter()
+        for _ in range(ticks):
+            if state != STATE_PLAYING or player is None:
+                break
+            tick_ms = LOGIC_DT_MS
             if active_mode == MODE_VS_AI and ai is not None:
-                cleared_p = player.update(dt_ms)
+                cleared_p = player.update(tick_ms)
                 if cleared_p > 0:
                     play(SND_CLEAR)
                     add_xp(cleared_p * 20 + (40 if player.last_t_spin else 0))
 
-                cleared_ai = ai.update_ai(dt_ms)
+                cleared_ai = ai.update_ai(tick_ms)
 
                 if player.last_attack > 0:
                     ai.board.add_garbage(player.last_attack)
                 if ai.last_attack > 0:
-                    player.board.add_garbage(ai.last_attack)
+                    player.receive_garbage(ai.last_attack)
 
                 if player.last_clear_count == 4:
                     unlock_achievement("first_tetris", "First Tetris")
@@ -1295,41 +1804,62 @@ def main():
                     if not player.game_over:
                         unlock_achievement("beat_ai", "Beat the AI", xp_gain=180)
             elif active_mode == MODE_VS_LOCAL and ai is not None:
-                cleared_p = player.update(dt_ms)
-                cleared_o = ai.update(dt_ms)
+                cleared_p = player.update(tick_ms)
+                cleared_o = ai.update(tick_ms)
 
                 if cleared_p > 0:
                     add_xp(cleared_p * 15)
                 if player.last_attack > 0:
                     ai.board.add_garbage(player.last_attack)
                 if ai.last_attack > 0:
-                    player.board.add_garbage(ai.last_attack)
+                    player.receive_garbage(ai.last_attack)
 
                 if player.game_over or ai.game_over:
                     state = STATE_GAMEOVER
                     play(SND_GAMEOVER)
             elif active_mode == MODE_ONLINE and online is not None:
                 if online_ready:
-                    cleared_p = player.update(dt_ms)
+                    if pending_garbage:
+                        now_ms = online.clock_ms()
+                        for entry in [e for e in pending_garbage if e[0] <= now_ms]:
+                            pending_garbage.remove(entry)
+                            player.receive_garbage(entry[1])
+                    cleared_p = player.update(tick_ms)
                     if cleared_p > 0:
                         play(SND_CLEAR)
                         add_xp(cleared_p * 20 + (40 if player.last_t_spin else 0))
 
                     if player.last_attack > 0:
-                        online.send({"type": "attack", "amount": int(player.last_attack)})
-
-                    snapshot_timer_ms += dt_ms
-                    if snapshot_timer_ms >= 150:
+                        online.send({"type": "attack", "amount": int(player.last_attack), "at": online.clock_ms()})
+
+                    if remote_game is not None:
+                        # lockstep: stream inputs/locks and let the opponent re-simulate;
+                        # snapshots are only sent when the other side asks for a resync
+                        for event in player.net_events:
+                            online.send(event)
+                        player.net_events.clear()
+                        remote_game.update(tick_ms)
+                        remote_state["score"] = remote_game.board.score
+                        remote_state["lines"] = remote_game.board.lines
+                        if remote_game.game_over:
+                            remote_state["game_over"] = True
+                    else:
+                        snapshot_timer_ms += tick_ms
+                    if snapshot_timer_ms >= SNAPSHOT_INTERVAL_MS:
                         snapshot_timer_ms = 0
-                        online.send(
-                            {
-                                "type": "snapshot",
-                                "grid": ["".join(row) for row in player.board.grid],
-                                "score": int(player.board.score),
-                                "lines": int(player.board.lines),
-                                "game_over": bool(player.game_over),
-                            }
-                        )
+                        snapshot = {
+                            "type": "snapshot",
+                            "grid": ["".join(row) for row in player.board.grid],
+                            "score": int(player.board.score),
+                            "lines": int(player.board.lines),
+                            "game_over": bool(player.game_over),
+                            "at": online.clock_ms(),
+                        }
+                        if remote_game is not None:
+                            # a lockstep resync also realigns the opponent's piece count and bag
+                            # (rare, so the JSON fallback for the extra field costs nothing)
+                            snapshot["n"] = player.pieces
+                        online.send(snapshot)
 
                     if player.game_over and not online_sent_gameover:
                         online.send({"type": "gameover"})
@@ -1344,7 +1874,7 @@ def main():
                 else:
                     snapshot_timer_ms = 0
             else:
-                cleared_p = player.update(dt_ms)
+                cleared_p = player.update(tick_ms)
                 if cleared_p > 0:
                     play(SND_CLEAR)
                     add_xp(cleared_p * 15 + (40 if player.last_t_spin else 0))
@@ -1358,7 +1888,7 @@ def main():
                         unlock_achievement("perfect_clear", "Perfect Clear")
 
                 if active_mode == MODE_SPRINT and not sprint_complete:
-                    sprint_time_ms += dt_ms
+                    sprint_time_ms += tick_ms
                     if player.board.lines >= sprint_target_lines:
                         sprint_complete = True
                         state = STATE_GAMEOVER
@@ -1372,14 +1902,48 @@ def main():
                     if player.board.score > highscore:
                         highscore = player.board.score
                         save_highscore(highscore)
+        if ticks:
+            logic_stats.add(ticks, (time.perf_counter() - logic_started) * 1000.0)
+            if TICK_STATS and logic_stats.window_ms() >= 5000:
+                print(logic_stats.report())
+                logic_stats.reset()
+        render_alpha = logic_accum_ms / LOGIC_DT_MS
+
+        if state == STATE_GAMEOVER and player is not None and player.replay is not None:
+            keep_replay(player)
+            player.replay = None
+        if state == STATE_GAMEOVER and player is not None and recorded_game is not player:
+            recorded_game = player
+            stats_db.record(finished_game_stats())
+        profiler.mark("update")
 
         # DRAW
         draw_background(screen, dt)
+        profiler.mark("draw_background")
         pulse = 0.5 + 0.5 * math.sin(t_accum * 2.0)
         border_col = (120, 80, 255) if state != STATE_GAMEOVER else (255, 80, 80)
 
+        if state == STATE_LOADING:
+            if loader.is_alive():
+                draw_loading(screen)
+                pygame.display.flip()
+                profiler.mark("flip")
+                continue
+            startup.mark("assets")
+            state = STATE_START
+
+        if state == STATE_STATS:
+            draw_stats_screen(screen, stats_view, menu_labels)
+            profiler.mark("draw_menu")
+            if profiler.enabled:
+                draw_profiler_overlay(screen, profiler)
+                profiler.mark("draw_profiler")
+            pygame.display.flip()
+            profiler.mark("flip")
+            continue
+
         if state == STATE_START:
-            draw_center_overlay(screen, "SAM STACKERZ", "Modes ↑/↓ | AI diff ←/→ | Enter start")
+            draw_center_overlay(screen, "SAM STACKERZ", "Modes ↑/↓ | AI diff ←/→ | Enter start | T stats")
             y0 = WINDOW_H // 2 + 30
             for i, mode in enumerate(menu_modes):
                 selected = (i == menu_idx)
@@ -1392,7 +1956,17 @@ def main():
             screen.blit(diff_txt, (WINDOW_W // 2 - diff_txt.get_width() // 2, y0 + len(menu_modes) * 30 + 18))
             tip = font.render("P2 controls (VS Local): J/L move, I rotate, K soft, U drop", True, (170, 170, 190))
             screen.blit(tip, (WINDOW_W // 2 - tip.get_width() // 2, y0 + len(menu_modes) * 30 + 50))
+            profiler.mark("draw_menu")
+            if profiler.enabled:
+                draw_profiler_overlay(screen, profiler)
+                profiler.mark("draw_profiler")
             pygame.display.flip()
+            profiler.mark("flip")
+            if STARTUP_TIMING and startup.marks[-1][0] == "assets":
+                startup.mark("interactive")
+                print(startup.report())
+                if STARTUP_TIMING == "exit":
+                    running = False
             continue
 
         if player is not None:
@@ -1400,25 +1974,31 @@ def main():
                 pygame.draw.rect(screen, border_col, (player_x_vs - 4, -4, BOARD_W + 8, BOARD_H + 8), 2)
                 pygame.draw.rect(screen, border_col, (ai_x - 4, -4, BOARD_W + 8, BOARD_H + 8), 2)
 
-                draw_board(screen, player.board, offset_x=player_x_vs)
-                if active_mode == MODE_ONLINE:
+                opp_game = ai if active_mode != MODE_ONLINE else remote_game
+                draw_board(screen, player.board.grid, offset_x=player_x_vs, bounces=player.lock_bounces)
+                if opp_game is None:
                     draw_grid_snapshot(screen, remote_state["grid"], offset_x=ai_x)
                 else:
-                    draw_board(screen, ai.board, offset_x=ai_x)
+                    draw_board(screen, opp_game.board.grid, offset_x=ai_x, bounces=opp_game.lock_bounces)
+                profiler.mark("draw_boards")
 
-                draw_piece(screen, player.current, offset_x=player_x_vs, glow_pulse=pulse)
-                if active_mode != MODE_ONLINE and ai is not None:
-                    draw_piece(screen, ai.current, offset_x=ai_x, glow_pulse=pulse)
+                draw_piece(screen, player.current, offset_x=player_x_vs, glow_pulse=pulse,
+                           y_px=player.render_y_px(render_alpha), anim=player.anim)
+                if opp_game is not None:
+                    draw_piece(screen, opp_game.current, offset_x=ai_x, glow_pulse=pulse,
+                               y_px=opp_game.render_y_px(render_alpha), anim=opp_game.anim)
+                profiler.mark("draw_pieces")
 
                 for p in player.particles:
                     p.draw(screen)
-                if active_mode != MODE_ONLINE and ai is not None:
-                    for p in ai.particles:
+                if opp_game is not None:
+                    for p in opp_game.particles:
                         pp = Particle(p.x + ai_x, p.y, col=p.col)
                         pp.age = p.age
                         pp.life = p.life
                         pp.size = p.size
                         pp.draw(screen)
+                profiler.mark("draw_particles")
 
                 draw_side_panel(screen, side_x, "PLAYER", player, highscore, is_ai=False)
                 if active_mode == MODE_VS_AI:
@@ -1428,12 +2008,17 @@ def main():
                 else:
                     opponent_label = "ONLINE"
                 screen.blit(font.render(f"{opponent_label}:", True, (255, 255, 255)), (side_x + 12, 470))
+                if active_mode == MODE_ONLINE and online is not None and online.rtt_ms is not None:
+                    rtt = online.rtt_ms
+                    rtt_col = (120, 230, 120) if rtt < 80 else (230, 210, 110) if rtt < 160 else (240, 110, 110)
+                    rtt_text = font.render(f"{rtt:.0f}±{online.jitter_ms:.0f}ms", True, rtt_col)
+                    screen.blit(rtt_text, (side_x + SIDE_W - 12 - rtt_text.get_width(), 470))
                 if active_mode == MODE_VS_AI:
                     screen.blit(font.render(f"Diff: {active_ai_difficulty}", True, (200, 200, 255)), (side_x + 12, 494))
                 elif active_mode == MODE_VS_LOCAL:
                     screen.blit(font.render("Local Multiplayer", True, (200, 200, 255)), (side_x + 12, 494))
                 else:
-                    room_text = f"Room: {ONLINE_ROOM}"
+                    room_text = "Matchmaking" if ONLINE_ROOM == MATCHMAKING_ROOM else f"Room: {ONLINE_ROOM}"
                     screen.blit(font.render(room_text, True, (200, 200, 255)), (side_x + 12, 494))
                 opp_score = ai.board.score if (ai is not None and active_mode != MODE_ONLINE) else int(remote_state["score"])
                 opp_lines = ai.board.lines if (ai is not None and active_mode != MODE_ONLINE) else int(remote_state["lines"])
@@ -1442,10 +2027,14 @@ def main():
                 screen.blit(font.render(f"XP: {total_xp}", True, (220, 220, 180)), (side_x + 12, 566))
             else:
                 pygame.draw.rect(screen, border_col, (player_x_single - 4, -4, BOARD_W + 8, BOARD_H + 8), 2)
-                draw_board(screen, player.board, offset_x=player_x_single)
-                draw_piece(screen, player.current, offset_x=player_x_single, glow_pulse=pulse)
+                draw_board(screen, player.board.grid, offset_x=player_x_single, bounces=player.lock_bounces)
+                profiler.mark("draw_boards")
+                draw_piece(screen, player.current, offset_x=player_x_single, glow_pulse=pulse,
+                       y_px=player.render_y_px(render_alpha), anim=player.anim)
+                profiler.mark("draw_pieces")
                 for p in player.particles:
                     p.draw(screen)
+                profiler.mark("draw_particles")
 
                 panel_title = "SPRINT" if active_mode == MODE_SPRINT else "CLASSIC"
                 draw_side_panel(screen, side_x, panel_title, player, highscore, is_ai=False)
@@ -1458,6 +2047,7 @@ def main():
                     ss = sec % 60
                     screen.blit(font.render(f"Time: {mm:02d}:{ss:02d}", True, (220, 220, 220)), (side_x + 12, 518))
                 screen.blit(font.render(f"XP: {total_xp}", True, (220, 220, 180)), (side_x + 12, 566))
+            profiler.mark("draw_panel")
 
         for i, n in enumerate(notifications[:3]):
             txt = font.render(n["text"], True, (255, 230, 130))
@@ -1500,11 +2090,21 @@ def main():
                 subtitle = f"Score {player.board.score} — Lines {player.board.lines}"
 
             draw_center_overlay(screen, "GAME OVER", subtitle + " (Enter: menu, ESC: quit)")
+        profiler.mark("draw_overlay")
 
+        if profiler.enabled:
+            draw_profiler_overlay(screen, profiler)
+            profiler.mark("draw_profiler")
         pygame.display.flip()
+        profiler.mark("flip")
 
     if online is not None:
         online.close()
+    trace = profiler.write_trace()
+    if trace:
+        print(f"frame trace written to {trace}")
+    persistence.close()
+    stats_db.close()
     pygame.quit()
     sys.exit()
 